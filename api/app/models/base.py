@@ -1,19 +1,114 @@
 from config import *
 from peewee import *
+from playhouse.pool import PooledMySQLDatabase
+from playhouse.shortcuts import case
+from pymysql.constants import CLIENT
 from datetime import datetime
+import operator
 
-db = MySQLDatabase(host=DATABASE['host'],port=DATABASE['port'],user=DATABASE['user'],\
-                   password=DATABASE['password'],database=DATABASE['database'])
+if DATABASE['engine'] == 'sqlite':
+    ''' Local stand-in for benchmarks, UPDATE row counts are the matched rows as with FOUND_ROWS '''
+    db = SqliteDatabase(DATABASE['path'], pragmas=[('foreign_keys', 'ON'), ('journal_mode', 'WAL')])
+else:
+    ''' Connections are checked out of the pool on first query and returned on close,
+    UPDATE row counts are the matched rows so an update without changes is not a 404 '''
+    db = PooledMySQLDatabase(host=DATABASE['host'],port=DATABASE['port'],user=DATABASE['user'],\
+                       password=DATABASE['password'],database=DATABASE['database'],\
+                       max_connections=DATABASE['max_connections'],stale_timeout=DATABASE['stale_timeout'],\
+                       client_flag=CLIENT.FOUND_ROWS)
+
+''' Dates are given in the API format, SQLite returns them in its ISO format '''
+DATETIME_FORMATS = ["%Y/%m/%d %H:%M:%S", "%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S"]
+
+def review_average(count, stars):
+    ''' Returns the average stars of the stored review aggregates, None without reviews '''
+    if not count:
+        return None
+    return round(float(stars) / count, 2)
 
 class BaseModel(Model):
     id = PrimaryKeyField(unique = True)
-    created_at = DateTimeField(default=datetime.now(),formats="%Y/%m/%d %H:%M:%S")
-    updated_at = DateTimeField(default=datetime.now(),formats="%Y/%m/%d %H:%M:%S")
+    created_at = DateTimeField(default=datetime.now,formats=DATETIME_FORMATS,index=True)
+    updated_at = DateTimeField(default=datetime.now,formats=DATETIME_FORMATS,index=True)
+
+    def prepared(self):
+        ''' Remembers the values loaded from the database '''
+        self._saved = dict(self._data)
 
-    def save(self, *args, **kwargs):
-        ''' Saves the Model to the database '''
+    @property
+    def changed_fields(self):
+        ''' Returns the fields whose value differs from the database '''
+        saved = getattr(self, '_saved', None)
+        if saved is None:
+            return self.dirty_fields
+        changed = []
+        for field in self.dirty_fields:
+            if not field.name in saved:
+                changed.append(field)
+                continue
+            try:
+                if field.db_value(self._data.get(field.name)) != field.db_value(saved[field.name]):
+                    changed.append(field)
+            except (TypeError, ValueError):
+                changed.append(field)
+        return changed
+
+    def save(self, force_insert=False, only=None):
+        ''' Saves the Model to the database, updating only the changed columns '''
+        if self.id is not None and not force_insert and only is None:
+            only = self.changed_fields
+            if not only:
+                self._dirty.clear()
+                return False
+            only.append(self._meta.fields['updated_at'])
         self.updated_at = datetime.now()
-        super(BaseModel, self).save()
+        rows = super(BaseModel, self).save(force_insert=force_insert, only=only)
+        self.prepared()
+        return rows
+
+    @classmethod
+    def update_fields(cls, fields, *expressions):
+        ''' Updates the given columns of the matching rows in one statement, returns the row count
+
+        updated_at is only moved when a value differs, so rows without changes
+        are left untouched. It is declared first and so assigned first, before
+        the compared columns hold their new values.
+        '''
+        unchanged = [getattr(cls, key) == value for key, value in fields.items()]
+        fields = dict(fields)
+        fields['updated_at'] = case(None, [(reduce(operator.and_, unchanged), cls.updated_at)], datetime.now())
+        return cls.update(**fields).where(*expressions).execute()
+
+    @classmethod
+    def insert_rows(cls, rows):
+        ''' Inserts the rows with one multi-row INSERT, returns their ids in order
+
+        The ids are read back rather than derived from the last insert id, as
+        they need not be consecutive with auto_increment_increment above 1 or
+        with concurrent inserts. They are above the highest id read before the
+        INSERT, and the rows are matched in insert order on their exact columns.
+        '''
+        if not rows:
+            return []
+        now = datetime.now()
+        for row in rows:
+            row['created_at'] = now
+            row['updated_at'] = now
+        last = cls.select(fn.MAX(cls.id)).order_by().scalar() or 0
+        cls.insert_many(rows).execute()
+
+        fields = [field for name, field in cls._meta.fields.items() if name in rows[0] and not isinstance(field, (FloatField, DateTimeField))]
+        ids = []
+        query = cls.select(cls.id, *fields).where(cls.id > last).order_by(cls.id).naive()
+        for found in query.iterator():
+            if len(ids) == len(rows):
+                break
+            row = rows[len(ids)]
+            if all(found._data.get(field.name) == field.python_value(field.db_value(row[field.name])) for field in fields):
+                ids.append(found.id)
+        if len(ids) != len(rows):
+            raise RuntimeError('inserted rows of %s were not found' % cls._meta.db_table)
+        return ids
 
     def to_dict(model, self, data):
         ''' Returns a hash of the BaseModel in the database '''
@@ -7,8 +7,7 @@ class City(BaseModel):
 
     def to_dict(self):
         ''' Returns a hash of the City in the database '''
-        state = State.get(State.id == self.state)
         data = {}
         data['name'] = self.name
-        data['state_id'] = state.id
+        data['state_id'] = self.state_id
         return super(City, self).to_dict(self, data)
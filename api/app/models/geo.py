@@ -0,0 +1,77 @@
+from math import radians, degrees, sin, cos, asin, sqrt
+
+''' Geohash helpers used to index and search places by location '''
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 12
+EARTH_RADIUS = 6371.0
+KM_PER_DEGREE = 111.32
+
+def encode(latitude, longitude, precision=PRECISION):
+    ''' Returns the geohash of the given coordinates '''
+    latitude, longitude = float(latitude), float(longitude)
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash = []
+    bits, bit, even = 0, 0, True
+    while len(geohash) < precision:
+        if even:
+            middle = (lng_range[0] + lng_range[1]) / 2
+            if longitude >= middle:
+                bits = bits * 2 + 1
+                lng_range[0] = middle
+            else:
+                bits = bits * 2
+                lng_range[1] = middle
+        else:
+            middle = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= middle:
+                bits = bits * 2 + 1
+                lat_range[0] = middle
+            else:
+                bits = bits * 2
+                lat_range[1] = middle
+        even = not even
+        bit += 1
+        if bit == 5:
+            geohash.append(BASE32[bits])
+            bits, bit = 0, 0
+    return ''.join(geohash)
+
+def cell_size(precision):
+    ''' Returns the (latitude, longitude) span in degrees of a cell '''
+    lng_bits = (5 * precision + 1) / 2
+    lat_bits = 5 * precision / 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+def distance(lat1, lng1, lat2, lng2):
+    ''' Returns the great-circle distance in kilometers between two points '''
+    lat1, lng1, lat2, lng2 = map(radians, [lat1, lng1, lat2, lng2])
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS * asin(sqrt(a))
+
+def covering_cells(latitude, longitude, radius):
+    ''' Returns the geohash prefixes of the cells covering a circle, [] for the whole world
+
+    The longest prefix whose cells are at least radius wide is used, so the
+    cell of the center and its eight neighbours always contain the circle.
+    '''
+    latitude, longitude, radius = float(latitude), float(longitude), float(radius)
+    widest = min(90.0, abs(latitude) + degrees(radius / EARTH_RADIUS))
+    precision = 0
+    while precision < PRECISION:
+        lat_span, lng_span = cell_size(precision + 1)
+        height = lat_span * KM_PER_DEGREE
+        width = lng_span * KM_PER_DEGREE * cos(radians(widest))
+        if height < radius or width < radius:
+            break
+        precision += 1
+    if precision == 0:
+        return []
+
+    lat_span, lng_span = cell_size(precision)
+    cells = set()
+    for lat_step in (-1, 0, 1):
+        for lng_step in (-1, 0, 1):
+            lat = max(-90.0, min(89.999999, latitude + lat_step * lat_span))
+            lng = (longitude + lng_step * lng_span + 180.0) % 360.0 - 180.0
+            cells.add(encode(lat, lng, precision))
+    return sorted(cells)
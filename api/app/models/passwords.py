@@ -0,0 +1,125 @@
+from config import PASSWORD
+from threading import Lock
+from hashlib import md5, pbkdf2_hmac
+from binascii import hexlify
+import hmac
+import sys
+import os
+
+''' Password hashers by algorithm, new hashes use the configured one '''
+HASHERS = {}
+
+def register(hasher):
+    ''' Adds a hasher, the passwords stored with its algorithm can then be verified '''
+    HASHERS[hasher.algorithm] = hasher
+    return hasher
+
+@register
+class PBKDF2Hasher:
+    ''' Salted PBKDF2-HMAC hashes, stored as algorithm$iterations$salt$hash '''
+    algorithm = 'pbkdf2_sha256'
+    digest = 'sha256'
+
+    @classmethod
+    def encode(cls, clear, iterations, salt=None):
+        ''' Returns the stored form of the password '''
+        if salt is None:
+            salt = hexlify(os.urandom(16))
+        hashed = hexlify(pbkdf2_hmac(cls.digest, clear, salt, iterations))
+        return '%s$%d$%s$%s' % (cls.algorithm, iterations, salt, hashed)
+
+    @classmethod
+    def verify(cls, clear, encoded):
+        ''' Returns True when the password matches the stored form, in constant time '''
+        algorithm, iterations, salt, hashed = encoded.split('$')
+        return hmac.compare_digest(cls.encode(clear, int(iterations), salt), encoded)
+
+    @classmethod
+    def cost(cls, encoded):
+        ''' Returns the iterations of the stored form '''
+        return int(encoded.split('$')[1])
+
+@register
+class MD5Hasher:
+    ''' Unsalted md5 hashes of the first users, only verified to rehash them on login '''
+    algorithm = 'md5'
+
+    @classmethod
+    def encode(cls, clear, iterations=None):
+        ''' Returns the md5 hex digest of the password '''
+        return md5(clear).hexdigest()
+
+    @classmethod
+    def verify(cls, clear, encoded):
+        ''' Returns True when the password matches the digest, in constant time '''
+        return hmac.compare_digest(cls.encode(clear), encoded)
+
+    @classmethod
+    def cost(cls, encoded):
+        ''' md5 has no work factor '''
+        return None
+
+pool = None
+pool_lock = Lock()
+
+def gevent_pool():
+    ''' Returns the hashing threads of a gevent worker, None when gevent did not patch threading
+
+    The pool is created on first use, so it is never forked from a preloaded
+    gunicorn master.
+    '''
+    global pool
+    if 'gevent' not in sys.modules:
+        return None
+    from gevent import monkey
+    if not monkey.is_module_patched('threading'):
+        return None
+    with pool_lock:
+        if pool is None:
+            from gevent.threadpool import ThreadPool
+            pool = ThreadPool(PASSWORD['threads'])
+    return pool
+
+def run(function, *args):
+    ''' Runs a hash, in at most PASSWORD threads at once under gevent
+
+    A gevent worker runs the hash in a real thread while the greenlet waits
+    on the hub, so the worker keeps serving its other requests. Other
+    workers call the hash directly: a sync worker serves a single request
+    anyway, and the hash releases the GIL for the other threads of a
+    threaded worker.
+    '''
+    threads = gevent_pool()
+    if threads is None:
+        return function(*args)
+    return threads.apply(function, args)
+
+def text(clear):
+    ''' Returns the password as utf-8 bytes '''
+    if isinstance(clear, unicode):
+        return clear.encode('utf-8')
+    return str(clear)
+
+def algorithm_of(encoded):
+    ''' Returns the algorithm of a stored password, md5 for the legacy digests without one '''
+    if '$' in encoded:
+        return encoded.split('$', 1)[0]
+    return MD5Hasher.algorithm
+
+def make(clear):
+    ''' Returns the stored form of a password with the configured algorithm and work factor '''
+    hasher = HASHERS[PASSWORD['algorithm']]
+    return run(hasher.encode, text(clear), PASSWORD['iterations'])
+
+def verify(clear, encoded):
+    ''' Returns True when the password matches its stored form '''
+    hasher = HASHERS.get(algorithm_of(encoded))
+    if hasher is None:
+        return False
+    return run(hasher.verify, text(clear), str(encoded))
+
+def needs_rehash(encoded):
+    ''' Returns True when the stored form uses another algorithm or work factor than configured '''
+    if algorithm_of(encoded) != PASSWORD['algorithm']:
+        return True
+    return HASHERS[PASSWORD['algorithm']].cost(encoded) != PASSWORD['iterations']
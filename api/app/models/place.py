@@ -1,10 +1,11 @@
 from base import *
 from user import User
 from city import City
+import geo
 
 class Place(BaseModel):
-    owner = ForeignKeyField(rel_model=User, related_name="places")
-    city = ForeignKeyField(rel_model=City, related_name="places")
+    owner = ForeignKeyField(rel_model=User, related_name="places", on_delete="CASCADE")
+    city = ForeignKeyField(rel_model=City, related_name="places", on_delete="CASCADE")
     name = CharField(max_length=128, null=False)
     description = TextField()
     number_rooms = IntegerField(default=0)
@@ -13,14 +14,34 @@ class Place(BaseModel):
     price_by_night = IntegerField(default=0)
     latitude = FloatField()
     longitude = FloatField()
+    geohash = CharField(max_length=12, null=True, index=True)
+    review_count = IntegerField(default=0)
+    review_stars = IntegerField(default=0)
+
+    class Meta:
+        ''' Indexes the filters and sorts of the place lists within a city '''
+        indexes = (
+            (('city', 'price_by_night'), False),
+            (('city', 'max_guest'), False),
+        )
+
+    def save(self, *args, **kwargs):
+        ''' Stores the geohash of the place location before saving it '''
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geo.encode(self.latitude, self.longitude)
+        return super(Place, self).save(*args, **kwargs)
+
+    @staticmethod
+    def lock(place_id):
+        ''' Locks the place row until the current transaction ends '''
+        query = Place.select(Place.id).where(Place.id == place_id)
+        return query.for_update(db.for_update).exists()
 
     def to_dict(self):
         ''' Returns a hash of the Place in the database '''
         data = {}
-        city = City.get(City.id == self.city)
-        owner = User.get(User.id == self.owner)
-        data['owner_id'] = owner.id
-        data['city_id'] = city.id
+        data['owner_id'] = self.owner_id
+        data['city_id'] = self.city_id
         data['name'] = self.name
         data['description'] = self.description
         data['number_rooms'] = self.number_rooms
@@ -29,4 +50,7 @@ class Place(BaseModel):
         data['price_by_night'] = self.price_by_night
         data['latitude'] = self.latitude
         data['longitude'] = self.longitude
+        data['review_count'] = self.review_count
+        data['review_stars'] = self.review_stars
+        data['review_average'] = review_average(self.review_count, self.review_stars)
         return super(Place, self).to_dict(self, data)
@@ -9,5 +9,5 @@ class PlaceAmenities(Model):
         ''' Connects the model to the DB '''
         database = db
 
-    place = ForeignKeyField(rel_model=Place)
-    amenity = ForeignKeyField(rel_model=Amenity)
+    place = ForeignKeyField(rel_model=Place, on_delete="CASCADE")
+    amenity = ForeignKeyField(rel_model=Amenity, on_delete="CASCADE")
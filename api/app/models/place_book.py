@@ -1,21 +1,64 @@
 from base import *
 from place import Place
 from user import User
+from datetime import timedelta
 
 class PlaceBook(BaseModel):
-    place = ForeignKeyField(rel_model=Place)
-    user = ForeignKeyField(rel_model=User, related_name="places_booked")
+    ''' Longest booking accepted, overlap checks only read the bookings starting that many days before '''
+    MAX_NIGHTS = 365
+
+    place = ForeignKeyField(rel_model=Place, on_delete="CASCADE")
+    user = ForeignKeyField(rel_model=User, related_name="places_booked", on_delete="CASCADE")
     is_validated = BooleanField(default=False)
-    date_start = DateTimeField(null=False, formats="%Y/%m/%d %H:%M:%S")
+    date_start = DateTimeField(null=False, formats=DATETIME_FORMATS)
     number_nights = IntegerField(default=1)
+    date_end = DateTimeField(null=False, formats=DATETIME_FORMATS)
+
+    class Meta:
+        ''' Indexes the booked interval of each place for overlap checks '''
+        indexes = (
+            (('place', 'date_start', 'date_end'), False),
+        )
+
+    def save(self, *args, **kwargs):
+        ''' Stores the end of the booking before saving it '''
+        if not isinstance(self.date_start, datetime):
+            self.date_start = datetime.strptime(self.date_start, "%Y/%m/%d %H:%M:%S")
+        self.date_end = PlaceBook.end_date(self.date_start, self.number_nights)
+        return super(PlaceBook, self).save(*args, **kwargs)
+
+    @staticmethod
+    def end_date(date_start, number_nights):
+        ''' Returns midnight after the last night of a booking '''
+        date_start = date_start.replace(hour=0, minute=0, second=0, microsecond=0)
+        return date_start + timedelta(days=int(number_nights))
+
+    @staticmethod
+    def overlaps(date_start, date_end):
+        ''' Returns the condition of the bookings overlapping [date_start, date_end)
+
+        A booking ends at most MAX_NIGHTS days after it starts, so the ones
+        starting earlier cannot overlap. Bounding date_start on both sides
+        keeps the range scan of the (place, date_start, date_end) index to
+        that window instead of every earlier booking of the place.
+        '''
+        return ((PlaceBook.date_start > date_start - timedelta(days=PlaceBook.MAX_NIGHTS)) &
+                (PlaceBook.date_start < date_end) &
+                (PlaceBook.date_end > date_start))
+
+    @staticmethod
+    def overlapping(place_id, date_start, date_end):
+        ''' Returns the bookings of a place overlapping [date_start, date_end) '''
+        return PlaceBook.select().where(
+            PlaceBook.place == place_id,
+            PlaceBook.overlaps(date_start, date_end)
+        )
 
     def to_dict(self):
         ''' Returns a hash of a booking in the database '''
         data = {}
-        place = Place.get(Place.id == self.place)
-        user = User.get(User.id == self.user)
-        data['place_id'] = place.id
-        data['user_id'] = user.id
+        data['place_id'] = self.place_id
+        data['user_id'] = self.user_id
         data['is_validated'] = self.is_validated
         data['date_start'] = self.date_start.strftime("%Y/%m/%d %H:%M:%S")
         data['number_nights'] = self.number_nights
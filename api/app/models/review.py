@@ -13,12 +13,10 @@ class Review(BaseModel):
 		data['message'] = self.message
 		data['stars'] = self.stars
 		data['fromuserid'] = self.user_id
-		if 'reviewuser' in dir(self):
-			data['touserid'] = self.reviewuser.user_id
-		else:
-			data['touserid'] = None
-		if 'reviewplace' in dir(self):
-			data['toplaceid'] = self.reviewplace.place_id
-		else:
-			data['toplaceid'] = None
+
+		''' The joined ReviewUser or ReviewPlace is set on the instance by the select, no query is made '''
+		review_user = self.__dict__.get('reviewuser')
+		review_place = self.__dict__.get('reviewplace')
+		data['touserid'] = review_user.user_id if review_user is not None else None
+		data['toplaceid'] = review_place.place_id if review_place is not None else None
 		return super(Review, self).to_dict(self, data)
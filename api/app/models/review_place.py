@@ -2,6 +2,7 @@ from peewee import *
 from base import db
 from place import Place
 from review import Review
+from datetime import datetime
 
 class ReviewPlace(Model):
 
@@ -9,5 +10,48 @@ class ReviewPlace(Model):
 		''' Connects the model to the DB '''
 		database = db
 
-	place = ForeignKeyField(rel_model=Place)
-	review = ForeignKeyField(rel_model=Review)
+	place = ForeignKeyField(rel_model=Place, on_delete="CASCADE")
+	review = ForeignKeyField(rel_model=Review, on_delete="CASCADE")
+
+	@staticmethod
+	def count(place_id, stars, count=1):
+		''' Adds count reviews of the given stars to the aggregates of the place, a negative count removes them '''
+		query = Place.update(
+			review_count = Place.review_count + count,
+			review_stars = Place.review_stars + stars * count,
+			updated_at = datetime.now()
+		)
+		return query.where(Place.id == place_id).execute()
+
+	@staticmethod
+	def recount(*expressions):
+		''' Recomputes the aggregates of the matching places from their reviews, moving their updated_at so caches and change feeds see it '''
+		reviews = ReviewPlace.select(fn.COUNT(ReviewPlace.id)).where(ReviewPlace.place == Place.id)
+		stars = Review.select(fn.COALESCE(fn.SUM(Review.stars), 0)).join(ReviewPlace).where(ReviewPlace.place == Place.id)
+		query = Place.update(review_count = reviews, review_stars = stars, updated_at = datetime.now())
+		if expressions:
+			query = query.where(*expressions)
+		return query.execute()
+
+	@staticmethod
+	def reviewed_by(user_id):
+		''' Returns the ids of the places reviewed by the given user '''
+		query = ReviewPlace.select(ReviewPlace.place).join(Review).where(Review.user == user_id).distinct()
+		return [row[0] for row in query.tuples()]
+
+	@staticmethod
+	def delete_reviews(places):
+		''' Deletes the reviews of the places in the given ids or select of ids with one statement, their links cascade '''
+		reviews = ReviewPlace.select(ReviewPlace.review).where(ReviewPlace.place << places)
+		return Review.delete().where(Review.id << reviews).execute()
+
+	@staticmethod
+	def delete_review(place_id, review_id):
+		''' Deletes the review of the place with its link and removes it from the aggregates, returns the deleted row count
+
+		Callers run it in a transaction and roll back when no row was deleted,
+		as the aggregates are updated first from the stars of the review.
+		'''
+		ReviewPlace.count(place_id, fn.COALESCE(Review.select(Review.stars).where(Review.id == review_id), 0), -1)
+		reviews = ReviewPlace.select(ReviewPlace.review).where(ReviewPlace.place == place_id, ReviewPlace.review == review_id)
+		return Review.delete().where(Review.id << reviews).execute()
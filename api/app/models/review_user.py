@@ -2,6 +2,7 @@ from peewee import *
 from base import db
 from user import User
 from review import Review
+from datetime import datetime
 
 class ReviewUser(Model):
 
@@ -9,5 +10,48 @@ class ReviewUser(Model):
 		''' Connects the model to the DB '''
 		database = db
 
-	user = ForeignKeyField(rel_model=User)
-	review = ForeignKeyField(rel_model=Review)
+	user = ForeignKeyField(rel_model=User, on_delete="CASCADE")
+	review = ForeignKeyField(rel_model=Review, on_delete="CASCADE")
+
+	@staticmethod
+	def count(user_id, stars, count=1):
+		''' Adds count reviews of the given stars to the aggregates of the user, a negative count removes them '''
+		query = User.update(
+			review_count = User.review_count + count,
+			review_stars = User.review_stars + stars * count,
+			updated_at = datetime.now()
+		)
+		return query.where(User.id == user_id).execute()
+
+	@staticmethod
+	def recount(*expressions):
+		''' Recomputes the aggregates of the matching users from their reviews, moving their updated_at so caches and change feeds see it '''
+		reviews = ReviewUser.select(fn.COUNT(ReviewUser.id)).where(ReviewUser.user == User.id)
+		stars = Review.select(fn.COALESCE(fn.SUM(Review.stars), 0)).join(ReviewUser).where(ReviewUser.user == User.id)
+		query = User.update(review_count = reviews, review_stars = stars, updated_at = datetime.now())
+		if expressions:
+			query = query.where(*expressions)
+		return query.execute()
+
+	@staticmethod
+	def reviewed_by(user_id):
+		''' Returns the ids of the users reviewed by the given user '''
+		query = ReviewUser.select(ReviewUser.user).join(Review).where(Review.user == user_id).distinct()
+		return [row[0] for row in query.tuples()]
+
+	@staticmethod
+	def delete_reviews(users):
+		''' Deletes the reviews of the users in the given ids or select of ids with one statement, their links cascade '''
+		reviews = ReviewUser.select(ReviewUser.review).where(ReviewUser.user << users)
+		return Review.delete().where(Review.id << reviews).execute()
+
+	@staticmethod
+	def delete_review(user_id, review_id):
+		''' Deletes the review of the user with its link and removes it from the aggregates, returns the deleted row count
+
+		Callers run it in a transaction and roll back when no row was deleted,
+		as the aggregates are updated first from the stars of the review.
+		'''
+		ReviewUser.count(user_id, fn.COALESCE(Review.select(Review.stars).where(Review.id == review_id), 0), -1)
+		reviews = ReviewUser.select(ReviewUser.review).where(ReviewUser.user == user_id, ReviewUser.review == review_id)
+		return Review.delete().where(Review.id << reviews).execute()
@@ -1,5 +1,5 @@
 from base import *
-from hashlib import *
+import passwords
 
 class User(BaseModel):
 
@@ -8,12 +8,26 @@ class User(BaseModel):
     first_name = CharField(max_length=128, null=False)
     last_name = CharField(max_length=128, null=False)
     is_admin = BooleanField(default=False)
+    review_count = IntegerField(default=0)
+    review_stars = IntegerField(default=0)
 
     def set_password(self, clear_password):
-        ''' Sets the password in MD5 encryption '''
-        passwd = md5()
-        passwd.update(clear_password)
-        self.password = passwd.hexdigest()
+        ''' Sets the password hashed with the configured algorithm '''
+        self.password = User.hash_password(clear_password)
+
+    @staticmethod
+    def hash_password(clear_password):
+        ''' Returns the salted hash of a password '''
+        return passwords.make(clear_password)
+
+    def check_password(self, clear_password):
+        ''' Returns True when the password matches, rehashing it if stored with a legacy algorithm or cost '''
+        if not passwords.verify(clear_password, self.password):
+            return False
+        if passwords.needs_rehash(self.password):
+            self.set_password(clear_password)
+            self.save()
+        return True
 
     def to_dict(self):
         ''' Returns a hash of the User in the database '''
@@ -22,4 +36,7 @@ class User(BaseModel):
         data['first_name'] = self.first_name
         data['last_name'] = self.last_name
         data['is_admin'] = self.is_admin
+        data['review_count'] = self.review_count
+        data['review_stars'] = self.review_stars
+        data['review_average'] = review_average(self.review_count, self.review_stars)
         return super(User, self).to_dict(self, data)
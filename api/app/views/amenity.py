@@ -2,11 +2,17 @@
 
 ''' Import app and models '''
 from app import app
+from app.models.base import db
 from app.models.amenity import Amenity
 from app.models.place import Place
 from app.models.place_amenity import PlaceAmenities
 from return_styles import ListStyle
-from index import type_test
+from index import fetch_or_404
+from conditional import row_headers, not_modified
+from schema import Schema, Field, coerce
+from auth import admin_required
+from bulk import bulk_items, bulk_error, bulk_response, existing_ids
+from cache import cached, invalidate
 
 ''' Import packages '''
 from flask_json import as_json, request
@@ -15,8 +21,14 @@ from datetime import datetime
 from peewee import OperationalError
 import json
 
+''' Fields accepted when creating an amenity '''
+AMENITY_SCHEMA = Schema({
+    'name': Field('string', required=True, msg="amenity '%s' must be a string value")
+})
+
 @app.route('/amenities', methods=['GET'])
 @as_json
+@cached('amenities')
 def get_amenities():
     """
     Get all amenities
@@ -54,12 +66,72 @@ def get_amenities():
                                     type: string
                                     description: previous page URL
                                     default: "/<path>?page=1&number=10"
+        304:
+            description: List page was not modified since the ETag or date given by the client
+        400:
+            description: Issue with the page, number or after cursor
     """
-    data = Amenity.select()
-    return ListStyle.list(data, request), 200
+    try:
+        data = Amenity.select()
+        return ListStyle.conditional(data, request)
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
+
+@app.route('/amenities/changes', methods=['GET'])
+@as_json
+def get_amenities_changes():
+    """
+    Get changed amenities
+    List the amenities created or updated since a cursor, oldest change first.
+    ---
+    tags:
+        - Amenity
+    parameters:
+        -
+            name: since
+            in: query
+            type: string
+            description: cursor from paging next of the previous pull, or a date formatted as %Y/%m/%d %H:%M:%S, all amenities if omitted
+        -
+            name: number
+            in: query
+            type: integer
+            description: maximum number of amenities returned
+    responses:
+        200:
+            description: List of the changed amenities, paging next holds the cursor of the next pull
+            schema:
+                id: AmenityChanges
+                required:
+                    - data
+                    - paging
+                properties:
+                    data:
+                        type: array
+                        description: amenities array
+                        items:
+                            $ref: '#/definitions/get_amenity_get_Amenity'
+                    paging:
+                        description: pagination
+                        schema:
+                            $ref: '#/definitions/get_amenities_get_Paging'
+        400:
+            description: Issue with the since cursor or number
+    """
+    try:
+        return ListStyle.changes(Amenity.select(), request), 200
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
 
 @app.route('/amenities', methods=['POST'])
 @as_json
+@admin_required
 def create_amenity():
     """
     Create a new amenity
@@ -98,26 +170,18 @@ def create_amenity():
                         default: "created successfully"
         400:
             description: Issue with amenity request
+        401:
+            description: A token is required when authentication is enforced
+        403:
+            description: The token is not the one of an admin
         409:
             description: Amenity already exists
         500:
             description: The request was not able to be processed
     """
-    data = {}
-    if request.json:
-        data = request.json
-    else:
-        for key in request.form.keys():
-        	for value in request.form.getlist(key):
-        		data[key] = value
     try:
-        ''' Check if name for amenity was given '''
-        if not 'name' in data:
-            raise KeyError("'name'")
-
-        ''' Check if name is a string '''
-        if not type_test(data['name'], 'string'):
-            raise TypeError("amenity 'name' must be a string value")
+        ''' Check if name for amenity was given and is a string '''
+        data = AMENITY_SCHEMA.validate(request.json or request.form)
 
         ''' Check if amenity already exists '''
         query = Amenity.select().where(Amenity.name == data['name'])
@@ -128,6 +192,7 @@ def create_amenity():
         new = Amenity.create(
             name = data['name']
         )
+        invalidate('amenities')
         res = {}
         res['code'] = 201
         res['id'] = new.id
@@ -194,20 +259,20 @@ def get_amenity(amenity_id):
                         type: datetime string
                         description: date and time the amenity was updated in the database
                         default: '2016-08-11 20:30:38'
+        304:
+            description: Record was not modified since the ETag or date given by the client
         404:
             description: Amenity was not found
         500:
             description: Request could not be processed
     """
     try:
-        ''' Check if amenity exists '''
-        query = Amenity.select().where(Amenity.id == amenity_id)
-        if not query.exists():
-            raise LookupError('amenity_id')
-
-        ''' Return amenity data '''
-        amenity = Amenity.get(Amenity.id == amenity_id)
-        return amenity.to_dict(), 200
+        ''' Return amenity data, 404 if it does not exist '''
+        amenity = fetch_or_404(Amenity.select().where(Amenity.id == amenity_id))
+        headers = row_headers(amenity)
+        if not_modified(request, headers):
+            return None, 304, headers
+        return amenity.to_dict(), 200, headers
     except LookupError as e:
         abort(404)
     except Exception as e:
@@ -215,6 +280,7 @@ def get_amenity(amenity_id):
 
 @app.route('/amenities/<amenity_id>', methods=['DELETE'])
 @as_json
+@admin_required
 def delete_amenity(amenity_id):
     """
     Delete the given amenity
@@ -246,20 +312,21 @@ def delete_amenity(amenity_id):
                         type: string
                         description: Message about record deletion
                         default: "deleted successfully"
+        401:
+            description: A token is required when authentication is enforced
+        403:
+            description: The token is not the one of an admin
         404:
             description: Amenity was not found
         500:
             description: Request could not be processed
     """
     try:
-        ''' Check if amenity exists '''
-        query = Amenity.select().where(Amenity.id == amenity_id)
-        if not query.exists():
-            raise LookupError('amenity_id')
-
-        ''' Delete the amenity '''
+        ''' Delete the amenity, 404 if no row was deleted '''
         amenity = Amenity.delete().where(Amenity.id == amenity_id)
-        amenity.execute()
+        if not amenity.execute():
+            raise LookupError('amenity_id')
+        invalidate('amenities', 'place_amenities')
         res = {}
         res['code'] = 200
         res['msg'] = "Amenity was deleted successfully"
@@ -271,6 +338,7 @@ def delete_amenity(amenity_id):
 
 @app.route('/places/<place_id>/amenities', methods=['GET'])
 @as_json
+@cached('place_amenities')
 def get_place_amenities(place_id):
     """
     Get amenities for place
@@ -290,18 +358,116 @@ def get_place_amenities(place_id):
             description: List of all amenities for the place
             schema:
                 $ref: '#/definitions/get_amenities_get_Amenities'
+        304:
+            description: List page was not modified since the ETag or date given by the client
+        400:
+            description: Issue with the page, number or after cursor
+    """
+    try:
+        ''' Return amenities for the given place '''
+        data = Amenity.select().join(PlaceAmenities).where(PlaceAmenities.place == place_id)
+        result, status, headers = ListStyle.conditional(data, request)
+
+        ''' Only check that the place exists when no amenity was found '''
+        if status == 200 and not result['data']:
+            query = Place.select().where(Place.id == place_id)
+            if not query.exists():
+                raise LookupError('place_id')
+        return result, status, headers
+    except LookupError as e:
+        abort(404)
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
+    except Exception as e:
+        abort(500)
+
+@app.route('/places/<place_id>/amenities', methods=['POST'])
+@as_json
+def post_place_amenities(place_id):
+    """
+    Add many amenities to a place
+    Add the amenities of a JSON array of amenity ids to the given place in one transaction
+    ---
+    tags:
+        - Amenity
+    parameters:
+        -
+            name: place_id
+            in: path
+            type: string
+            required: True
+            description: ID of the given place
+        -
+            name: body
+            in: body
+            required: True
+            description: array of amenity ids
+            schema:
+                type: array
+                items:
+                    type: integer
+    responses:
+        201:
+            description: All amenities were added
+            schema:
+                $ref: '#/definitions/create_places_post_bulk_success'
+        200:
+            description: Some amenities were not added, see the code of each item
+        400:
+            description: The request body is not a JSON array
+        404:
+            description: Place was not found
+        500:
+            description: The request was not able to be processed
     """
     try:
-        ''' Check if the place exists '''
+        ''' Check that every item is an amenity id '''
+        items = bulk_items(request)
+        results = {}
+        amenity_ids = [coerce(item, int) for item in items]
+        for index, amenity_id in enumerate(amenity_ids):
+            if amenity_id is None:
+                results[index] = bulk_error(index, 400, 'amenity_id is not an integer')
+
+        ''' Check if place_id is valid '''
         query = Place.select().where(Place.id == place_id)
         if not query.exists():
             raise LookupError('place_id')
 
-        ''' Return amenities for the given place '''
-        data = Amenity.select().join(PlaceAmenities).where(PlaceAmenities.place == place_id)
-        return ListStyle.list(data, request), 200
+        ''' Check the amenities and the ones already set with one query each '''
+        amenities = existing_ids(Amenity, [amenity_id for amenity_id in amenity_ids if amenity_id is not None])
+        query = PlaceAmenities.select(PlaceAmenities.amenity).where(PlaceAmenities.place == place_id)
+        linked = set([row[0] for row in query.tuples()])
+
+        rows = []
+        for index, amenity_id in enumerate(amenity_ids):
+            if index in results:
+                continue
+            if not amenity_id in amenities:
+                results[index] = bulk_error(index, 404, 'amenity_id was not found')
+            elif amenity_id in linked:
+                results[index] = bulk_error(index, 400, 'Amenity is already set for the given place')
+            else:
+                linked.add(amenity_id)
+                rows.append({'place': place_id, 'amenity': amenity_id})
+                results[index] = {'index': index, 'code': 201, 'msg': 'Amenity added successfully for the given place'}
+
+        ''' Add the amenities with one multi-row INSERT '''
+        if rows:
+            with db.atomic():
+                PlaceAmenities.insert_many(rows).execute()
+            invalidate('place_amenities')
+        return bulk_response(results, len(items))
     except LookupError as e:
         abort(404)
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
     except Exception as e:
         abort(500)
 
@@ -360,6 +526,7 @@ def post_place_amenity(place_id, amenity_id):
             place = place_id,
             amenity = amenity_id
         )
+        invalidate('place_amenities')
         res = {
             'code': 201,
             'msg': 'Amenity added successfully for the given place'
@@ -411,27 +578,14 @@ def delete_place_amenity(place_id, amenity_id):
             description: Request could not be processed
     """
     try:
-        ''' Check if place_id is valid '''
-        query = Place.select().where(Place.id == place_id)
-        if not query.exists():
-            raise LookupError('place_id')
-
-        ''' Check if amenity_id is valid '''
-        query = Amenity.select().where(Amenity.id == amenity_id)
-        if not query.exists():
-            raise LookupError('amenity_id')
-
-        ''' Check if amenity is already added for place '''
-        query = PlaceAmenities.select().where(PlaceAmenities.amenity == amenity_id, PlaceAmenities.place == place_id)
-        if not query.exists():
-            raise LookupError('amenity_id, place_id')
-
-        ''' Add amenity for place '''
+        ''' Remove amenity from place, 404 if it was not set for the place '''
         delete = PlaceAmenities.delete().where(
             PlaceAmenities.amenity == amenity_id,
             PlaceAmenities.place == place_id
         )
-        delete.execute()
+        if not delete.execute():
+            raise LookupError('amenity_id, place_id')
+        invalidate('place_amenities')
         res = {}
         res['code'] = 200
         res['msg'] = 'Amenity deleted successfully for the given place'
@@ -0,0 +1,127 @@
+''' Verifies user credentials and the signed tokens issued at login '''
+from app import app
+from app.models.user import User
+from cache import ResponseCache
+from config import PASSWORD, AUTH
+from flask import g
+from flask_json import json_response, request
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from functools import wraps
+from hashlib import sha256
+import hmac
+import os
+
+if not AUTH['secret']:
+    raise RuntimeError('AIRBNB_SECRET_KEY must be set to sign the authentication tokens')
+
+''' Credentials verified recently, keyed by an HMAC of this process so the cache never holds a password '''
+verified = ResponseCache(PASSWORD['cache_size'], PASSWORD['cache_ttl'])
+SECRET = os.urandom(32)
+
+''' Signs the tokens, which carry the user id and admin flag so verifying them reads no row
+
+The admin flag of a token is only a hint, admin_error checks it against the user row.
+'''
+serializer = URLSafeTimedSerializer(AUTH['secret'], salt='airbnb-auth-token')
+
+''' Revoked tokens until they would have expired anyway, per worker and bounded to deny_size entries '''
+denied = ResponseCache(AUTH['deny_size'], AUTH['max_age'])
+
+def credentials_key(user, clear):
+    ''' Returns the cache key of the credentials, bound to the stored hash so a new password misses '''
+    if isinstance(clear, unicode):
+        clear = clear.encode('utf-8')
+    message = '%d\0%s\0%s' % (user.id, clear, user.password)
+    return ('credentials', hmac.new(SECRET, message, sha256).hexdigest())
+
+def authenticate(email, clear):
+    ''' Returns the user with the given credentials, None if they do not match
+
+    Repeat requests with credentials verified within the cache ttl only read
+    the user, without hashing the password again. A legacy hash is replaced
+    on the first successful verification.
+    '''
+    user = User.select().where(User.email == email).first()
+    if user is None:
+        return None
+    if verified.get(credentials_key(user, clear)):
+        return user
+    if not user.check_password(clear):
+        return None
+    verified.set(credentials_key(user, clear), True)
+    return user
+
+def basic_user(request):
+    ''' Returns the user of the Basic Authorization header of the request, None without valid credentials '''
+    auth = request.authorization
+    if auth is None or not auth.username or auth.password is None:
+        return None
+    return authenticate(auth.username, auth.password)
+
+def issue_token(user):
+    ''' Returns a signed token for the user, unique per login so it can be revoked alone '''
+    return serializer.dumps({'id': user.id, 'is_admin': user.is_admin, 'nonce': os.urandom(8).encode('hex')})
+
+def verify_token(token):
+    ''' Returns the claims of a valid token, None if it is forged, expired or revoked '''
+    if denied.get(('tokens', token)):
+        return None
+    try:
+        return serializer.loads(token, max_age=AUTH['max_age'])
+    except BadSignature:
+        return None
+
+def revoke_token(token):
+    ''' Denies the token in this worker until it expires '''
+    denied.set(('tokens', token), True)
+
+def bearer_token(request):
+    ''' Returns the token of the Bearer Authorization header of the request, None without one '''
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        return None
+    return header[len('Bearer '):].strip()
+
+@app.before_request
+def load_user():
+    ''' Sets g.user to the claims of the Bearer token of the request, 401 if the token is not valid '''
+    g.user = None
+    token = bearer_token(request)
+    if token is None:
+        return None
+    g.user = verify_token(token)
+    if g.user is None:
+        return json_response(401, code=401, msg='Invalid or expired token')
+
+def admin_error():
+    ''' Returns the 401 or 403 response when the request has no admin token, None when authentication is not enforced
+
+    The admin flag is read again from the database rather than from the token,
+    so a demoted admin loses its rights before its token expires.
+    '''
+    if not AUTH['required']:
+        return None
+    if g.user is None:
+        return {'code': 401, 'msg': 'Authentication required'}, 401
+    user = User.select(User.is_admin).where(User.id == g.user['id']).first()
+    if user is None or not user.is_admin:
+        return {'code': 403, 'msg': 'Admin rights required'}, 403
+    return None
+
+def owner_error(user_id):
+    ''' Returns the 401 or 403 response unless the token is the one of the given user or of an admin '''
+    if not AUTH['required']:
+        return None
+    if g.user is not None and str(g.user['id']) == str(user_id):
+        return None
+    return admin_error()
+
+def admin_required(view):
+    ''' Requires the token of an admin when AIRBNB_AUTH_REQUIRED is set '''
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        error = admin_error()
+        if error is not None:
+            return error
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,43 @@
+''' Helpers shared by the bulk create endpoints '''
+BULK_LIMIT = 1000
+
+def bulk_items(request):
+    ''' Returns the JSON array of a bulk request, raises TypeError if it is not one '''
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        raise TypeError('request body must be a JSON array')
+    if len(items) > BULK_LIMIT:
+        raise TypeError('request body cannot hold more than %d items' % BULK_LIMIT)
+    return items
+
+def bulk_validate(schema, items):
+    ''' Validates every item with the schema, returns the valid items and the errors by index '''
+    valid, errors = [], {}
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise TypeError('item is not an object')
+            valid.append((index, schema.validate(item)))
+        except KeyError as e:
+            errors[index] = bulk_error(index, 40000, 'Missing parameters')
+        except (TypeError, ValueError) as e:
+            errors[index] = bulk_error(index, 400, e.message)
+    return valid, errors
+
+def existing_ids(model, ids):
+    ''' Returns which of the ids exist in the table of the model, with one IN query '''
+    ids = list(set(ids))
+    if not ids:
+        return set()
+    return set([row[0] for row in model.select(model.id).where(model.id << ids).tuples()])
+
+def bulk_error(index, code, msg):
+    ''' Returns the result of an item that was not created '''
+    return {'index': index, 'code': code, 'msg': msg}
+
+def bulk_response(results, count):
+    ''' Returns the results ordered by index, 201 only when every item was created '''
+    data = [results[index] for index in range(count)]
+    if all(result['code'] == 201 for result in data):
+        return {'data': data}, 201
+    return {'data': data}, 200
@@ -0,0 +1,96 @@
+from config import CACHE
+from conditional import not_modified
+from flask import request
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+from time import time
+
+class ResponseCache:
+	''' In-process LRU cache of view responses, entries expire after ttl seconds
+
+	Each worker has its own cache and only sees its own invalidations, so
+	ttl bounds how long another worker can serve a stale response.
+	'''
+	def __init__(self, size, ttl):
+		self.size = size
+		self.ttl = ttl
+		self.entries = OrderedDict()
+		self.lock = Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key):
+		''' Returns the cached value of the key, None if it is missing or expired '''
+		with self.lock:
+			entry = self.entries.pop(key, None)
+			if entry is None or entry[0] < time():
+				self.misses += 1
+				return None
+			self.entries[key] = entry
+			self.hits += 1
+			return entry[1]
+
+	def set(self, key, value):
+		''' Stores the value, evicting the least recently used entries beyond size '''
+		with self.lock:
+			self.entries.pop(key, None)
+			self.entries[key] = (time() + self.ttl, value)
+			while len(self.entries) > self.size:
+				self.entries.popitem(last=False)
+
+	def invalidate(self, *namespaces):
+		''' Drops every entry of the given namespaces '''
+		with self.lock:
+			for key in self.entries.keys():
+				if key[0] in namespaces:
+					del self.entries[key]
+
+	def clear(self):
+		''' Drops every entry and resets the counters '''
+		with self.lock:
+			self.entries.clear()
+			self.hits = 0
+			self.misses = 0
+
+	def stats(self):
+		''' Returns the hit and miss counters and the number of entries '''
+		with self.lock:
+			requests = self.hits + self.misses
+			return {
+				'hits': self.hits,
+				'misses': self.misses,
+				'hit_rate': float(self.hits) / requests if requests else 0.0,
+				'entries': len(self.entries),
+				'size': self.size,
+				'ttl': self.ttl
+			}
+
+cache = ResponseCache(CACHE['size'], CACHE['ttl'])
+
+def cached(namespace):
+	''' Caches the 200 responses of a view by root url, path and query string, when ttl is set
+
+	The paging urls of a list are absolute, so the same path requested
+	through another host or scheme is cached separately.
+	'''
+	def decorator(view):
+		@wraps(view)
+		def wrapper(*args, **kwargs):
+			if not cache.ttl:
+				return view(*args, **kwargs)
+			key = (namespace, request.url_root, request.full_path)
+			response = cache.get(key)
+			if response is None:
+				response = view(*args, **kwargs)
+				if isinstance(response, tuple) and response[1] == 200:
+					cache.set(key, response)
+			elif len(response) == 3 and not_modified(request, response[2]):
+				return None, 304, response[2]
+			return response
+		return wrapper
+	return decorator
+
+def invalidate(*namespaces):
+	''' Drops the cached responses of the namespaces after a write '''
+	cache.invalidate(*namespaces)
@@ -1,9 +1,16 @@
 ''' Import app and models '''
 from app import app
+from app.models.base import db
 from app.models.city import City
 from app.models.city import State
+from app.models.place import Place
+from app.models.review_place import ReviewPlace
 from return_styles import ListStyle
-from index import type_test
+from index import fetch_or_404
+from conditional import row_headers, not_modified
+from schema import Schema, Field
+from auth import admin_required
+from cache import cached, invalidate
 
 ''' Import packages '''
 from flask_json import as_json, request
@@ -11,8 +18,14 @@ from flask import abort
 from datetime import datetime
 import json
 
+''' Fields accepted when creating a city '''
+CITY_SCHEMA = Schema({
+    'name': Field('string', required=True, msg="'%s' value is not a string")
+})
+
 @app.route('/states/<state_id>/cities', methods=['GET'])
 @as_json
+@cached('cities')
 def get_cities(state_id):
     """
     Get all cities
@@ -38,23 +51,84 @@ def get_cities(state_id):
                         description: pagination
                         schema:
                             $ref: '#/definitions/get_amenities_get_Paging'
+        304:
+            description: List page was not modified since the ETag or date given by the client
+        400:
+            description: Issue with the page, number or after cursor
     """
     try:
-        ''' Check if state exists '''
-        query = State.select().where(State.id == state_id)
-        if not query.exists():
-            raise LookupError('state')
-
         ''' Return list of cities in given state '''
         data = City.select().where(City.state == state_id)
-        return ListStyle.list(data, request), 200
+        result, status, headers = ListStyle.conditional(data, request)
+
+        ''' Only check that the state exists when no city was found '''
+        if status == 200 and not result['data']:
+            query = State.select().where(State.id == state_id)
+            if not query.exists():
+                raise LookupError('state')
+        return result, status, headers
     except LookupError as e:
         abort(404)
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
     except Exception as e:
         abort(500)
 
+@app.route('/cities/changes', methods=['GET'])
+@as_json
+def get_cities_changes():
+    """
+    Get changed cities
+    List the cities created or updated since a cursor, oldest change first.
+    ---
+    tags:
+        - City
+    parameters:
+        -
+            name: since
+            in: query
+            type: string
+            description: cursor from paging next of the previous pull, or a date formatted as %Y/%m/%d %H:%M:%S, all cities if omitted
+        -
+            name: number
+            in: query
+            type: integer
+            description: maximum number of cities returned
+    responses:
+        200:
+            description: List of the changed cities, paging next holds the cursor of the next pull
+            schema:
+                id: CityChanges
+                required:
+                    - data
+                    - paging
+                properties:
+                    data:
+                        type: array
+                        description: cities array
+                        items:
+                            $ref: '#/definitions/get_city_get_City'
+                    paging:
+                        description: pagination
+                        schema:
+                            $ref: '#/definitions/get_amenities_get_Paging'
+        400:
+            description: Issue with the since cursor or number
+    """
+    try:
+        return ListStyle.changes(City.select(), request), 200
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
+
 @app.route('/states/<state_id>/cities', methods=['POST'])
 @as_json
+@admin_required
 def create_city(state_id):
     """
     Create a new city
@@ -82,28 +156,23 @@ def create_city(state_id):
                 $ref: '#/definitions/create_amenity_post_post_success'
         400:
             description: Issue with city request
+        401:
+            description: A token is required when authentication is enforced
+        403:
+            description: The token is not the one of an admin
         409:
             description: City already exists
         500:
             description: The request was not able to be processed
     """
-    data = {}
-    for key in request.form.keys():
-    	for value in request.form.getlist(key):
-    		data[key] = value
     try:
         ''' Check if state exists '''
         query = State.select().where(State.id == state_id)
         if not query.exists():
             raise LookupError('state_id')
 
-        ''' Check if 'name' key in data '''
-        if not 'name' in data:
-            raise KeyError('name')
-
-        ''' Check if 'name' value is a string '''
-        if not type_test(data['name'], 'string'):
-            raise TypeError("'name' value is not a string")
+        ''' Check if 'name' is given and is a string '''
+        data = CITY_SCHEMA.validate(request.form)
 
         ''' Check if city already exists '''
         query = City.select().where(City.name == data['name'])
@@ -115,6 +184,7 @@ def create_city(state_id):
             name = data['name'],
             state_id = state_id
         )
+        invalidate('cities')
         res = {}
         res['code'] = 201
         res['id'] = int(new.id)
@@ -194,25 +264,20 @@ def get_city(state_id, city_id):
                         type: datetime string
                         description: date and time the city was updated in the database
                         default: '2016-08-11 20:30:38'
+        304:
+            description: Record was not modified since the ETag or date given by the client
         404:
             description: City or state was not found
         500:
             description: Request could not be processed
     """
     try:
-        ''' Check if state exists '''
-        query = State.select().where(State.id == state_id)
-        if not query.exists():
-            raise LookupError('state_id')
-
-        ''' Check if city exists '''
-        query = City.select().where(City.id == city_id)
-        if not query.exists():
-            raise LookupError('city_id')
-
-        ''' Return city data '''
-        city = City.get(City.id == city_id, City.state == state_id)
-        return city.to_dict(), 200
+        ''' Return the city, 404 if it does not exist in the given state '''
+        city = fetch_or_404(City.select().where(City.id == city_id, City.state == state_id))
+        headers = row_headers(city)
+        if not_modified(request, headers):
+            return None, 304, headers
+        return city.to_dict(), 200, headers
     except LookupError as e:
         abort(404)
     except Exception as e:
@@ -220,6 +285,7 @@ def get_city(state_id, city_id):
 
 @app.route('/states/<state_id>/cities/<city_id>', methods=['DELETE'])
 @as_json
+@admin_required
 def delete_city(state_id, city_id):
     """
     Delete the given city
@@ -245,25 +311,28 @@ def delete_city(state_id, city_id):
             description: City deleted successfully
             schema:
                 $ref: '#/definitions/delete_amenity_delete_delete_200'
+        401:
+            description: A token is required when authentication is enforced
+        403:
+            description: The token is not the one of an admin
         404:
             description: City was not found
         500:
             description: Request could not be processed
     """
     try:
-        ''' Check if state exists '''
-        query = State.select().where(State.id == state_id)
-        if not query.exists():
-            raise LookupError('state_id')
+        ''' Delete the city from the given state and the reviews of its places in one transaction, 404 if no row was deleted
 
-        ''' Check if city exists '''
-        query = City.select().where(City.id == city_id)
-        if not query.exists():
-            raise LookupError('city_id')
+        Places cascade from the city, with their bookings and links.
+        '''
+        with db.atomic():
+            ReviewPlace.delete_reviews(Place.select(Place.id).where(Place.city == city_id))
+            delete_city = City.delete().where(City.id == city_id, City.state == state_id)
+            if not delete_city.execute():
+                raise LookupError('city_id')
 
-        ''' Delete the city from the given state '''
-        delete_city = City.delete().where(City.id == city_id, City.state == state_id)
-        delete_city.execute()
+        ''' Places cascade from the city, and their amenity links with them '''
+        invalidate('cities', 'place_amenities')
         response = {}
         response['code'] = 200
         response['msg'] = "City account was deleted"
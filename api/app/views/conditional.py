@@ -0,0 +1,39 @@
+from werkzeug.http import http_date, parse_date, quote_etag, unquote_etag
+from calendar import timegm
+from hashlib import md5
+from time import mktime
+
+def modified_time(updated_at):
+    ''' Returns the epoch seconds of a local updated_at, None if there is none '''
+    if updated_at is None:
+        return None
+    return int(mktime(updated_at.timetuple()))
+
+def headers_for(etag, last_modified):
+    ''' Returns the ETag and Last-Modified headers of a response '''
+    headers = {'ETag': quote_etag(etag)}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
+
+def row_headers(row):
+    ''' Returns the validators of a single row, from its column values '''
+    values = sorted(row._data.items())
+    etag = md5(repr([type(row).__name__] + values)).hexdigest()
+    return headers_for(etag, modified_time(row.updated_at))
+
+def page_headers(request, rows):
+    ''' Returns the validators of a list page, from the id and updated_at of its rows '''
+    values = [(row.id, row.updated_at) for row in rows]
+    etag = md5(repr([request.full_path] + values)).hexdigest()
+    times = [modified_time(updated_at) for row_id, updated_at in values if updated_at is not None]
+    return headers_for(etag, max(times) if times else None)
+
+def not_modified(request, headers):
+    ''' Returns True when the copy of the client matches the validators, If-None-Match first '''
+    if request.if_none_match:
+        return request.if_none_match.contains(unquote_etag(headers['ETag'])[0])
+    if request.if_modified_since and 'Last-Modified' in headers:
+        since = timegm(request.if_modified_since.utctimetuple())
+        return since >= timegm(parse_date(headers['Last-Modified']).utctimetuple())
+    return False
@@ -3,7 +3,8 @@ from flask_json import as_json
 from datetime import datetime
 from app.models.base import db
 from app import app
-import re
+from peewee import DoesNotExist
+from cache import cache
 
 '''allow only get request'''
 @app.route('/', methods=['GET'])
@@ -40,12 +41,49 @@ def index():
     data['time'] = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
     return data
 
-'''to open databse connection using db'''
-@app.before_request
-def _db_connect():
-    db.connect()
+@app.route('/cache/stats', methods=['GET'])
+@as_json
+def cache_stats():
+    """
+    Response cache statistics
+    This endpoint returns the hit and miss counters of the response cache of this worker
+    ---
+    tags:
+      - Index
+    responses:
+      200:
+        description: Counters of the response cache
+        schema:
+          id: cache_stats
+          properties:
+            hits:
+              type: integer
+              description: responses served from the cache
+              default: 120
+            misses:
+              type: integer
+              description: responses computed by the view
+              default: 8
+            hit_rate:
+              type: number
+              description: share of the responses served from the cache
+              default: 0.9375
+            entries:
+              type: integer
+              description: responses held in the cache
+              default: 8
+            size:
+              type: integer
+              description: maximum number of entries
+              default: 1024
+            ttl:
+              type: integer
+              description: seconds an entry is kept, 0 when the cache is disabled
+              default: 60
+    """
+    return cache.stats(), 200
 
-'''to close databse connection using db'''
+'''to return the pooled database connection, if the request used one'''
 @app.teardown_request
 def _db_close(exc):
     if not db.is_closed():
@@ -63,31 +101,9 @@ def not_found(e):
     ''' return a JSON with code = 500 and msg = "server"'''
     return {"code":500, "msg":"server error"}, 500
 
-def type_test(data, data_type):
-    if data_type == int:
-        try:
-            int(data)
-            return True
-        except:
-            return False
-    elif data_type == float:
-        try:
-            float(data)
-            return True
-        except:
-            return False
-    elif data_type == bool:
-        if data == 'True' or data == 'False':
-            return True
-        return False
-    elif data_type == 'email':
-        pattern = re.compile("^([A-z0-9\"“][\w-]*[+\.]?[\w-]+[\"”]{0,1}@[A-z0-9][\w-]*\.[\w]+\.?[\w]{0,3}\.?[\w]{0,3}\]{0,1})$")
-        if pattern.match(data):
-            return True
-        return False
-    elif data_type == 'string':
-        if type_test(data, int):
-            return False
-        elif type_test(data, float):
-            return False
-        return True
+def fetch_or_404(select):
+    ''' Returns the first row of a select, raises LookupError (404) if there is none '''
+    try:
+        return select.get()
+    except DoesNotExist:
+        raise LookupError(select.model_class.__name__)
@@ -1,19 +1,126 @@
 ''' Import app and models '''
 from app import app
+from app.models.base import db
 from app.models.place import Place
 from app.models.city import City
 from app.models.state import State
 from app.models.user import User
 from app.models.place_book import PlaceBook
+from app.models.review_place import ReviewPlace
+from app.models import geo
 from return_styles import ListStyle
-from index import type_test
+from index import fetch_or_404
+from conditional import row_headers, not_modified
+from bulk import bulk_items, bulk_validate, bulk_error, bulk_response, existing_ids
+from schema import Schema, Field, coerce
+from cache import invalidate
 
 ''' Import packages '''
 from flask_json import as_json, request
 from datetime import datetime, timedelta
 from flask import abort
+from peewee import fn, JOIN
+import operator
 import json
 
+''' Filters of the place lists, by query argument '''
+PLACE_FILTERS = {
+    'min_price': lambda value: Place.price_by_night >= value,
+    'max_price': lambda value: Place.price_by_night <= value,
+    'min_guest': lambda value: Place.max_guest >= value,
+    'min_rooms': lambda value: Place.number_rooms >= value
+}
+
+''' Fields the place lists can be sorted on '''
+PLACE_SORTS = {
+    'price_by_night': Place.price_by_night,
+    'max_guest': Place.max_guest,
+    'number_rooms': Place.number_rooms
+}
+
+''' Query arguments of the place list filters '''
+PLACE_FILTER_SCHEMA = Schema(dict((key, Field(int)) for key in PLACE_FILTERS))
+
+''' Optional fields of a place, shared by creation and update '''
+PLACE_FIELDS = {
+    'name': Field('string'),
+    'description': Field('string'),
+    'number_rooms': Field(int, min=0),
+    'number_bathrooms': Field(int, min=0),
+    'max_guest': Field(int, min=0),
+    'price_by_night': Field(int, min=0),
+    'latitude': Field(float, min=-90, max=90),
+    'longitude': Field(float, min=-180, max=180)
+}
+
+''' Fields accepted when creating a place in a city '''
+PLACE_BY_CITY_SCHEMA = Schema(dict(PLACE_FIELDS,
+    owner_id=Field(int, required=True),
+    name=Field('string', required=True)
+))
+
+''' Fields accepted when creating a place '''
+PLACE_SCHEMA = Schema(dict(PLACE_FIELDS,
+    owner_id=Field(int, required=True),
+    name=Field('string', required=True),
+    city_id=Field(int, required=True)
+))
+
+''' Fields of each place of a bulk creation, the columns without default are required '''
+PLACE_BULK_SCHEMA = Schema(dict(PLACE_FIELDS,
+    owner_id=Field(int, required=True),
+    name=Field('string', required=True),
+    city_id=Field(int, required=True),
+    description=Field('string', required=True),
+    latitude=Field(float, required=True, min=-90, max=90),
+    longitude=Field(float, required=True, min=-180, max=180)
+))
+
+''' Fields accepted when updating a place '''
+PLACE_UPDATE_SCHEMA = Schema(PLACE_FIELDS)
+
+''' Date of a place availability check '''
+AVAILABILITY_SCHEMA = Schema({
+    'year': Field(int, required=True),
+    'month': Field(int, required=True, min=1, max=12),
+    'day': Field(int, required=True, min=1, max=31)
+}, msg='%s')
+
+''' Places and dates of a bulk availability check '''
+PLACES_AVAILABILITY_SCHEMA = Schema({
+    'city_id': Field(int),
+    'state_id': Field(int),
+    'date_start': Field('datetime', required=True, msg='%s is not formatted correctly'),
+    'number_nights': Field(int, min=1)
+})
+
+''' Arguments of a place search by location '''
+SEARCH_SCHEMA = Schema({
+    'lat': Field(float, required=True, min=-90, max=90, msg='%s is not a valid latitude'),
+    'lng': Field(float, required=True, min=-180, max=180, msg='%s is not a valid longitude'),
+    'radius': Field(float, required=True, min=0, msg='%s is not a positive float'),
+    'number': Field(int, min=1)
+})
+
+def filter_places(select, args):
+    ''' Applies the filters and sort of the query string to a select of places '''
+    values = PLACE_FILTER_SCHEMA.validate(args)
+    for key in PLACE_FILTERS:
+        if key in values:
+            select = select.where(PLACE_FILTERS[key](values[key]))
+
+    if 'sort' in args:
+        field = args['sort'].lstrip('-')
+        if not field in PLACE_SORTS:
+            raise TypeError('sort must be one of ' + ', '.join(sorted(PLACE_SORTS)))
+        if 'after' in args:
+            raise TypeError('sort cannot be combined with after')
+        order = PLACE_SORTS[field]
+        if args['sort'].startswith('-'):
+            order = order.desc()
+        select = select.order_by(order, Place.id)
+    return select
+
 @app.route('/places', methods=['GET'])
 @as_json
 def get_places():
@@ -23,6 +130,32 @@ def get_places():
     ---
     tags:
         - Place
+    parameters:
+        -
+            name: min_price
+            in: query
+            type: integer
+            description: minimum price by night
+        -
+            name: max_price
+            in: query
+            type: integer
+            description: maximum price by night
+        -
+            name: min_guest
+            in: query
+            type: integer
+            description: minimum number of guests the place must host
+        -
+            name: min_rooms
+            in: query
+            type: integer
+            description: minimum number of rooms
+        -
+            name: sort
+            in: query
+            type: string
+            description: price_by_night, max_guest or number_rooms, prefixed with - for descending order
     responses:
         200:
             description: List of all places
@@ -41,9 +174,68 @@ def get_places():
                         description: pagination
                         schema:
                             $ref: '#/definitions/get_amenities_get_Paging'
+        304:
+            description: List page was not modified since the ETag or date given by the client
+        400:
+            description: Issue with the filters or sort
+    """
+    try:
+        data = filter_places(Place.select(), request.args)
+        return ListStyle.conditional(data, request)
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
+
+@app.route('/places/changes', methods=['GET'])
+@as_json
+def get_places_changes():
+    """
+    Get changed places
+    List the places created or updated since a cursor, oldest change first.
+    ---
+    tags:
+        - Place
+    parameters:
+        -
+            name: since
+            in: query
+            type: string
+            description: cursor from paging next of the previous pull, or a date formatted as %Y/%m/%d %H:%M:%S, all places if omitted
+        -
+            name: number
+            in: query
+            type: integer
+            description: maximum number of places returned
+    responses:
+        200:
+            description: List of the changed places, paging next holds the cursor of the next pull
+            schema:
+                id: PlaceChanges
+                required:
+                    - data
+                    - paging
+                properties:
+                    data:
+                        type: array
+                        description: places array
+                        items:
+                            $ref: '#/definitions/get_place_get_Place'
+                    paging:
+                        description: pagination
+                        schema:
+                            $ref: '#/definitions/get_amenities_get_Paging'
+        400:
+            description: Issue with the since cursor or number
     """
-    data = Place.select()
-    return ListStyle.list(data, request), 200
+    try:
+        return ListStyle.changes(Place.select(), request), 200
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
 
 @app.route('/places', methods=['POST'])
 @as_json
@@ -120,42 +312,9 @@ def create_place():
         500:
             description: The request was not able to be processed
     """
-    data = {}
-    for key in request.form.keys():
-    	for value in request.form.getlist(key):
-    		data[key] = value
     try:
-        ''' Check for required keys '''
-        if not 'owner_id' in data:
-            raise KeyError('owner_id')
-        if not 'name' in data:
-            raise KeyError('name')
-        if not 'city_id' in data:
-            raise KeyError('city_id')
-
-        ''' Check required key value data types '''
-        if not type_test(data['owner_id'], int):
-            raise TypeError('owner_id is not an integer')
-        if not type_test(data['name'], 'string'):
-            raise TypeError('name is not a string')
-        if not type_test(data['city_id'], int):
-            raise TypeError('city_id is not an integer')
-
-        ''' Check optional key value data types '''
-        if 'description' in data and not type_test(data['description'], 'string'):
-            raise TypeError('description is not a string')
-        if 'number_rooms' in data and not type_test(data['number_rooms'], int):
-            raise TypeError('number_rooms is not an integer')
-        if 'number_bathrooms' in data and not type_test(data['number_bathrooms'], int):
-            raise TypeError('number_bathrooms is not an integer')
-        if 'max_guest' in data and not type_test(data['max_guest'], int):
-            raise TypeError('max_guest is not an integer')
-        if 'price_by_night' in data and not type_test(data['price_by_night'], int):
-            raise TypeError('price_by_night is not an integer')
-        if 'latitude' in data and not type_test(data['latitude'], float):
-            raise TypeError('latitude is not a float')
-        if 'longitude' in data and not type_test(data['longitude'], float):
-            raise TypeError('longitude is not a float')
+        ''' Check for required keys and key value data types '''
+        data = PLACE_SCHEMA.validate(request.form)
 
         ''' Check if city_id exists '''
         query = City.select().where(City.id == data['city_id'])
@@ -176,17 +335,17 @@ def create_place():
         )
         if data['description']:
             new.description = data['description']
-        if data['number_rooms']:
+        if data['number_rooms'] is not None:
             new.number_rooms = data['number_rooms']
-        if data['number_bathrooms']:
+        if data['number_bathrooms'] is not None:
             new.number_bathrooms = data['number_bathrooms']
-        if data['max_guest']:
+        if data['max_guest'] is not None:
             new.max_guest = data['max_guest']
-        if data['price_by_night']:
+        if data['price_by_night'] is not None:
             new.price_by_night = data['price_by_night']
-        if data['latitude']:
+        if data['latitude'] is not None:
             new.latitude = data['latitude']
-        if data['longitude']:
+        if data['longitude'] is not None:
             new.longitude = data['longitude']
         new.save()
         res = {}
@@ -209,6 +368,97 @@ def create_place():
     except Exception as e:
         abort(500)
 
+@app.route('/places/bulk', methods=['POST'])
+@as_json
+def create_places():
+    """
+    Create many places
+    Create the places of a JSON array in one transaction
+    ---
+    tags:
+        - Place
+    parameters:
+        -
+            name: body
+            in: body
+            required: True
+            description: array of places, each with the fields of a new place
+            schema:
+                type: array
+                items:
+                    type: object
+    responses:
+        201:
+            description: All places were created
+            schema:
+                id: bulk_success
+                required:
+                    - data
+                properties:
+                    data:
+                        type: array
+                        description: result of each item, in the order of the request
+                        items:
+                            properties:
+                                index:
+                                    type: integer
+                                    description: position of the item in the request
+                                code:
+                                    type: integer
+                                    description: 201 if the item was created, error code otherwise
+                                msg:
+                                    type: string
+                                    description: Message about the item
+                                id:
+                                    type: integer
+                                    description: id of the created record
+        200:
+            description: Some places were not created, see the code of each item
+        400:
+            description: The request body is not a JSON array
+        500:
+            description: The request was not able to be processed
+    """
+    try:
+        ''' Check the fields of every place in one pass '''
+        items = bulk_items(request)
+        valid, results = bulk_validate(PLACE_BULK_SCHEMA, items)
+
+        ''' Check the cities and owners of the whole batch with one query each '''
+        cities = existing_ids(City, [data['city_id'] for index, data in valid])
+        owners = existing_ids(User, [data['owner_id'] for index, data in valid])
+
+        rows, positions = [], []
+        for index, data in valid:
+            if not data['city_id'] in cities:
+                results[index] = bulk_error(index, 404, 'city_id was not found')
+            elif not data['owner_id'] in owners:
+                results[index] = bulk_error(index, 404, 'owner_id was not found')
+            else:
+                row = {
+                    'owner': data['owner_id'],
+                    'city': data['city_id'],
+                    'geohash': geo.encode(data['latitude'], data['longitude'])
+                }
+                for key in PLACE_FIELDS:
+                    row[key] = data.get(key, Place._meta.fields[key].default)
+                rows.append(row)
+                positions.append(index)
+
+        ''' Insert the valid places with one multi-row INSERT '''
+        with db.atomic():
+            ids = Place.insert_rows(rows)
+        for index, new_id in zip(positions, ids):
+            results[index] = {'index': index, 'code': 201, 'msg': 'Place was created successfully', 'id': new_id}
+        return bulk_response(results, len(items))
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
+    except Exception as e:
+        abort(500)
+
 @app.route('/places/<place_id>', methods=['GET'])
 @as_json
 def get_place(place_id):
@@ -278,6 +528,18 @@ def get_place(place_id):
                         type: float
                         description: the longitude of the place location
                         default: -122.493439
+                    review_count:
+                        type: integer
+                        description: number of reviews of the place
+                        default: 0
+                    review_stars:
+                        type: integer
+                        description: total stars of the reviews of the place
+                        default: 0
+                    review_average:
+                        type: float
+                        description: average stars of the reviews of the place, null without reviews
+                        default: null
                     id:
                         type: integer
                         description: id of the place
@@ -290,20 +552,20 @@ def get_place(place_id):
                         type: datetime string
                         description: date and time the booking was updated in the database
                         default: '2016-08-11 20:30:38'
+        304:
+            description: Record was not modified since the ETag or date given by the client
         404:
             description: Place, owner or city was not found
         500:
             description: Request could not be processed
     """
     try:
-        ''' Check if place_id exists '''
-        query = Place.select().where(Place.id == place_id)
-        if not query.exists():
-            raise LookupError('place_id')
-
-        ''' Return place data '''
-        place = Place.get(Place.id == place_id)
-        return place.to_dict(), 200
+        ''' Return place data, 404 if it does not exist '''
+        place = fetch_or_404(Place.select().where(Place.id == place_id))
+        headers = row_headers(place)
+        if not_modified(request, headers):
+            return None, 304, headers
+        return place.to_dict(), 200, headers
     except LookupError as e:
         abort(404)
     except Exception as e:
@@ -380,59 +642,36 @@ def update_place(place_id):
             description: The request was not able to be processed
     """
     try:
-        data = {}
-        for key in request.form.keys():
-        	for value in request.form.getlist(key):
-        		data[key] = value
-
-        ''' Check if place_id exists '''
-        query = Place.select().where(Place.id == place_id)
-        if not query.exists():
-            raise LookupError('place_id')
-
         ''' Check that no request to change protected values '''
-        if 'owner_id' in data:
+        if 'owner_id' in request.form:
             raise ValueError('Owner cannot be changed')
-        if 'city_id' in data:
+        if 'city_id' in request.form:
             raise ValueError('City cannot be changed')
 
         ''' Check for valid data types '''
-        if 'name' in data and not type_test(data['name'], 'string'):
-            raise TypeError('name is not a string')
-        if 'description' in data and not type_test(data['description'], 'string'):
-            raise TypeError('description is not a string')
-        if 'number_rooms' in data and not type_test(data['number_rooms'], int):
-            raise TypeError('number_rooms is not an integer')
-        if 'number_bathrooms' in data and not type_test(data['number_bathrooms'], int):
-            raise TypeError('number_bathrooms is not an integer')
-        if 'max_guest' in data and not type_test(data['max_guest'], int):
-            raise TypeError('max_guest is not an integer')
-        if 'price_by_night' in data and not type_test(data['price_by_night'], int):
-            raise TypeError('price_by_night is not an integer')
-        if 'latitude' in data and not type_test(data['latitude'], float):
-            raise TypeError('latitude is not a float')
-        if 'longitude' in data and not type_test(data['longitude'], float):
-            raise TypeError('longitude is not a float')
-
-        place = Place.get(Place.id == place_id)
+        data = PLACE_UPDATE_SCHEMA.validate(request.form)
+
+        ''' Collect the columns to update '''
+        fields = {}
         for key in data:
-            if key == 'name':
-                place.name = data[key]
-            elif key == 'description':
-                place.description = data[key]
-            elif key == 'number_rooms':
-                place.number_rooms = data[key]
-            elif key == 'number_bathrooms':
-                place.number_bathrooms = data[key]
-            elif key == 'max_guest':
-                place.max_guest = data[key]
-            elif key == 'price_by_night':
-                place.price_by_night = data[key]
-            elif key == 'latitude':
-                place.latitude = data[key]
-            elif key == 'longitude':
-                place.longitude = data[key]
-        place.save()
+            if key in PLACE_FIELDS:
+                fields[key] = data[key]
+
+        ''' Moving only one coordinate needs the other one to compute the geohash '''
+        if ('latitude' in fields) != ('longitude' in fields):
+            place = fetch_or_404(Place.select().where(Place.id == place_id))
+            for key in fields:
+                setattr(place, key, fields[key])
+            place.save()
+        elif fields:
+            if 'latitude' in fields:
+                fields['geohash'] = geo.encode(fields['latitude'], fields['longitude'])
+
+            ''' Update place record in one statement, 404 if it does not exist '''
+            if not Place.update_fields(fields, Place.id == place_id):
+                raise LookupError('place_id')
+        elif not Place.select().where(Place.id == place_id).exists():
+            raise LookupError('place_id')
         res = {}
         res['code'] = 200
         res['msg'] = "Place was updated successfully"
@@ -479,14 +718,16 @@ def delete_place(place_id):
             description: Request could not be processed
     """
     try:
-        ''' Check if place_id exists '''
-        query = Place.select().where(Place.id == place_id)
-        if not query.exists():
-            raise LookupError('place_id')
+        ''' Delete the given place and its reviews in one transaction, 404 if no row was deleted
 
-        ''' Delete the given place '''
-        delete_place = Place.delete().where(Place.id == place_id)
-        delete_place.execute()
+        Bookings, amenity and review links cascade from the place.
+        '''
+        with db.atomic():
+            ReviewPlace.delete_reviews([place_id])
+            delete_place = Place.delete().where(Place.id == place_id)
+            if not delete_place.execute():
+                raise LookupError('place_id')
+        invalidate('place_amenities')
         response = {}
         response['code'] = 200
         response['msg'] = "Place was deleted"
@@ -518,34 +759,59 @@ def get_places_by_city(state_id, city_id):
             type: integer
             required: True
             description: ID of the city
+        -
+            name: min_price
+            in: query
+            type: integer
+            description: minimum price by night
+        -
+            name: max_price
+            in: query
+            type: integer
+            description: maximum price by night
+        -
+            name: min_guest
+            in: query
+            type: integer
+            description: minimum number of guests the place must host
+        -
+            name: min_rooms
+            in: query
+            type: integer
+            description: minimum number of rooms
+        -
+            name: sort
+            in: query
+            type: string
+            description: price_by_night, max_guest or number_rooms, prefixed with - for descending order
     responses:
         200:
             description: List of all places
             schema:
                 $ref: '#/definitions/get_places_get_Places'
+        304:
+            description: List page was not modified since the ETag or date given by the client
+        400:
+            description: Issue with the filters or sort
     """
     try:
-        ''' Check if the state_id exists '''
-        query = State.select().where(State.id == state_id)
-        if not query.exists():
-            raise LookupError('state_id')
-
-        ''' Check if the city_id exists '''
-        query = City.select().where(City.id == city_id)
-        if not query.exists():
-            raise LookupError('city_id')
+        ''' Return all places in the given city, joined to check it is in the given state '''
+        data = Place.select().join(City).where(Place.city == city_id, City.state == state_id)
+        result, status, headers = ListStyle.conditional(filter_places(data, request.args), request)
 
-        ''' Check if the city_id is associated to the state_id '''
-        city = City.get(City.id == city_id)
-        query = State.select().where(State.id == city.state, State.id == state_id)
-        if not query.exists():
-            raise LookupError('city_id, state_id')
-
-        ''' Return all places in the given city '''
-        data = Place.select().where(Place.city == city.id)
-        return ListStyle.list(data, request), 200
+        ''' Only check that the city is in the state when no place was found '''
+        if status == 200 and not result['data']:
+            query = City.select().where(City.id == city_id, City.state == state_id)
+            if not query.exists():
+                raise LookupError('city_id, state_id')
+        return result, status, headers
     except LookupError as e:
         abort(404)
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
     except Exception as error:
         abort(500)
 
@@ -631,54 +897,11 @@ def create_place_by_city(state_id, city_id):
             description: The request was not able to be processed
     """
     try:
-        data = {}
-        for key in request.form.keys():
-        	for value in request.form.getlist(key):
-        		data[key] = value
-
-        ''' Check for required keys '''
-        if not 'owner_id' in data:
-            raise KeyError('owner_id')
-        if not 'name' in data:
-            raise KeyError('name')
-
-        ''' Check required key value data types '''
-        if not type_test(data['owner_id'], int):
-            raise TypeError('owner_id is not an integer')
-        if not type_test(data['name'], 'string'):
-            raise TypeError('name is not a string')
-
-        ''' Check optional key value data types '''
-        if 'description' in data and not type_test(data['description'], 'string'):
-            raise TypeError('description is not a string')
-        if 'number_rooms' in data and not type_test(data['number_rooms'], int):
-            raise TypeError('number_rooms is not an integer')
-        if 'number_bathrooms' in data and not type_test(data['number_bathrooms'], int):
-            raise TypeError('number_bathrooms is not an integer')
-        if 'max_guest' in data and not type_test(data['max_guest'], int):
-            raise TypeError('max_guest is not an integer')
-        if 'price_by_night' in data and not type_test(data['price_by_night'], int):
-            raise TypeError('price_by_night is not an integer')
-        if 'latitude' in data and not type_test(data['latitude'], float):
-            raise TypeError('latitude is not a float')
-        if 'longitude' in data and not type_test(data['longitude'], float):
-            raise TypeError('longitude is not a float')
-
-        ''' Check if the state_id exists '''
-        query = State.select().where(State.id == state_id)
-        if not query.exists():
-            raise LookupError('state_id')
+        ''' Check for required keys and key value data types '''
+        data = PLACE_BY_CITY_SCHEMA.validate(request.form)
 
-        ''' Check if the city_id exists '''
-        query = City.select().where(City.id == city_id)
-        if not query.exists():
-            raise LookupError('city_id')
-
-        ''' Check if the city_id is associated to the state_id '''
-        city = City.get(City.id == city_id)
-        query = State.select().where(State.id == city.state, State.id == state_id)
-        if not query.exists():
-            raise LookupError('city_id, state_id')
+        ''' Check if the city_id exists in the state_id '''
+        city = fetch_or_404(City.select().where(City.id == city_id, City.state == state_id))
 
         ''' Check if the owner_id exists '''
         query = User.select().where(User.id == data['owner_id'])
@@ -692,17 +915,17 @@ def create_place_by_city(state_id, city_id):
         )
         if data['description']:
             new.description = data['description']
-        if data['number_rooms']:
+        if data['number_rooms'] is not None:
             new.number_rooms = data['number_rooms']
-        if data['number_bathrooms']:
+        if data['number_bathrooms'] is not None:
             new.number_bathrooms = data['number_bathrooms']
-        if data['max_guest']:
+        if data['max_guest'] is not None:
             new.max_guest = data['max_guest']
-        if data['price_by_night']:
+        if data['price_by_night'] is not None:
             new.price_by_night = data['price_by_night']
-        if data['latitude']:
+        if data['latitude'] is not None:
             new.latitude = data['latitude']
-        if data['longitude']:
+        if data['longitude'] is not None:
             new.longitude = data['longitude']
         new.save()
         res = {}
@@ -742,31 +965,59 @@ def get_places_by_state(state_id):
             type: integer
             required: True
             description: ID of the state
+        -
+            name: min_price
+            in: query
+            type: integer
+            description: minimum price by night
+        -
+            name: max_price
+            in: query
+            type: integer
+            description: maximum price by night
+        -
+            name: min_guest
+            in: query
+            type: integer
+            description: minimum number of guests the place must host
+        -
+            name: min_rooms
+            in: query
+            type: integer
+            description: minimum number of rooms
+        -
+            name: sort
+            in: query
+            type: string
+            description: price_by_night, max_guest or number_rooms, prefixed with - for descending order
     responses:
         200:
             description: List of all places in state
             schema:
                 $ref: '#/definitions/get_places_get_Places'
+        304:
+            description: List page was not modified since the ETag or date given by the client
+        400:
+            description: Issue with the filters or sort
     """
     try:
-        ''' Check if state exists '''
-        query = State.select().where(State.id == state_id)
-        if not query.exists():
-            raise LookupError('state_id')
+        ''' Return the places in the cities of the state '''
+        data = Place.select().join(City).where(City.state == state_id)
+        result, status, headers = ListStyle.conditional(filter_places(data, request.args), request)
 
-        ''' Create a list of city ids in the state '''
-        query = City.select().where(City.state == state_id)
-        if not query.exists():
-            return ListStyle.list(query, request), 200
-        cities = []
-        for city in query:
-            cities.append(city.id)
-
-        ''' Return the places in listed cities '''
-        data = Place.select().where(Place.city << cities)
-        return ListStyle.list(data, request), 200
+        ''' Only check that the state exists when no place was found '''
+        if status == 200 and not result['data']:
+            query = State.select().where(State.id == state_id)
+            if not query.exists():
+                raise LookupError('state_id')
+        return result, status, headers
     except LookupError as e:
         abort(404)
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
     except Exception as e:
         print e.message
         abort(500)
@@ -825,40 +1076,21 @@ def get_place_availability(place_id):
             description: The request was not able to be processed
     """
     try:
-        data = {}
-        for key in request.form.keys():
-        	for value in request.form.getlist(key):
-        		data[key] = value
-        ''' Check for required keys '''
-        if not 'year' in data:
-            raise KeyError('year')
-        if not 'month' in data:
-            raise KeyError('month')
-        if not 'day' in data:
-            raise KeyError('day')
-
-        ''' Check for valid data types '''
-        if not type_test(data['year'], int):
-            raise TypeError('year')
-        if not type_test(data['month'], int):
-            raise TypeError('month')
-        if not type_test(data['day'], int):
-            raise TypeError('day')
-        ''' Check if place exists '''
-        query = Place.select().where(Place.id == place_id)
-        if not query.exists():
-            raise LookupError('place_id')
+        ''' Check for required keys and valid data types '''
+        data = AVAILABILITY_SCHEMA.validate(request.form)
 
         ''' Set datetime object to compare '''
-        check_date = datetime(int(data['year']), int(data['month']), int(data['day']))
+        check_date = datetime(data['year'], data['month'], data['day'])
 
         ''' Check if date is already booked '''
-        bookings = PlaceBook.select().where(PlaceBook.place == place_id)
-        for booking in bookings:
-            date_start = booking.date_start.replace(hour=0, minute=0, second=0)
-            date_end = date_start + timedelta(days= int(booking.number_nights))
-            if check_date >= date_start and check_date < date_end:
-                return {'available': False}, 200
+        bookings = PlaceBook.overlapping(place_id, check_date, check_date + timedelta(days=1))
+        if bookings.exists():
+            return {'available': False}, 200
+
+        ''' Only check that the place exists when it has no booking at that date '''
+        query = Place.select().where(Place.id == place_id)
+        if not query.exists():
+            raise LookupError('place_id')
         return {'available': True}, 200
     except KeyError as e:
         res = {}
@@ -875,3 +1107,207 @@ def get_place_availability(place_id):
     except Exception as e:
         print e.message
         abort(500)
+
+@app.route('/places/available', methods=['POST'])
+@as_json
+def get_places_availability():
+    """
+    Checks availability of many places
+    Returns the availability of the given places, or of all places in a city or state, for a date range
+    ---
+    tags:
+        - Place
+    parameters:
+        -
+            name: place_id
+            in: form
+            type: integer
+            description: id of a place to check, can be repeated
+        -
+            name: city_id
+            in: form
+            type: integer
+            description: id of a city whose places are checked
+        -
+            name: state_id
+            in: form
+            type: integer
+            description: id of a state whose places are checked
+        -
+            name: date_start
+            in: form
+            type: string
+            required: True
+            description: first night of the requested stay
+        -
+            name: number_nights
+            in: form
+            type: integer
+            description: number of nights of the requested stay
+    responses:
+        200:
+            description: Availability of each place was returned
+            schema:
+                id: places_availability
+                required:
+                    - data
+                properties:
+                    data:
+                        type: array
+                        description: availability of each place
+                        items:
+                            schema:
+                                id: place_availability
+                                required:
+                                    - place_id
+                                    - available
+                                properties:
+                                    place_id:
+                                        type: integer
+                                        description: id of the place
+                                        default: 1
+                                    available:
+                                        type: boolean
+                                        description: availability of the place
+                                        default: False
+        400:
+            description: Issue with places availability request
+        500:
+            description: The request was not able to be processed
+    """
+    try:
+        ''' Check for required keys and valid data types '''
+        data = PLACES_AVAILABILITY_SCHEMA.validate(request.form)
+        place_ids = [coerce(place_id, int) for place_id in request.form.getlist('place_id')]
+        city_id = data.get('city_id')
+        state_id = data.get('state_id')
+        if not place_ids and not city_id and not state_id:
+            raise KeyError('place_id')
+        if None in place_ids:
+            raise TypeError('place_id is not an integer')
+
+        ''' Set the requested interval '''
+        book_start = data['date_start'].replace(hour=0, minute=0, second=0)
+        book_end = book_start + timedelta(days=data.get('number_nights', 1))
+
+        ''' Count the overlapping bookings of every place in one query '''
+        overlap = (PlaceBook.place == Place.id) & PlaceBook.overlaps(book_start, book_end)
+        query = (Place
+                 .select(Place.id, fn.COUNT(PlaceBook.id))
+                 .join(PlaceBook, JOIN.LEFT_OUTER, on=overlap)
+                 .group_by(Place.id))
+        if place_ids:
+            query = query.where(Place.id << place_ids)
+        elif city_id:
+            query = query.where(Place.city == city_id)
+        else:
+            query = query.switch(Place).join(City).where(City.state == state_id)
+
+        data = []
+        for place_id, bookings in query.tuples():
+            data.append({'place_id': place_id, 'available': bookings == 0})
+        return {'data': data}, 200
+    except KeyError as e:
+        res = {}
+        res['code'] = 40000
+        res['msg'] = 'Missing parameters'
+        return res, 400
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
+    except Exception as e:
+        abort(500)
+
+@app.route('/places/search', methods=['GET'])
+@as_json
+def search_places():
+    """
+    Search places by location
+    List the places within a radius of the given coordinates, nearest first.
+    ---
+    tags:
+        - Place
+    parameters:
+        -
+            name: lat
+            in: query
+            type: float
+            required: True
+            description: latitude of the center of the search
+        -
+            name: lng
+            in: query
+            type: float
+            required: True
+            description: longitude of the center of the search
+        -
+            name: radius
+            in: query
+            type: float
+            required: True
+            description: radius of the search in kilometers
+        -
+            name: number
+            in: query
+            type: integer
+            description: maximum number of places returned
+    responses:
+        200:
+            description: List of the places in the radius
+            schema:
+                id: PlacesSearch
+                required:
+                    - data
+                properties:
+                    data:
+                        type: array
+                        description: places array, each with its distance in kilometers
+                        items:
+                            $ref: '#/definitions/get_place_get_Place'
+        400:
+            description: Issue with place search request
+        500:
+            description: The request was not able to be processed
+    """
+    try:
+        ''' Check for required keys, valid data types and ranges '''
+        data = SEARCH_SCHEMA.validate(request.args)
+        if not data['radius']:
+            raise TypeError('radius is not a positive float')
+        lat, lng, radius = data['lat'], data['lng'], data['radius']
+        number = data.get('number', 10)
+
+        ''' Only read the places in the geohash cells covering the circle '''
+        query = Place.select()
+        cells = geo.covering_cells(lat, lng, radius)
+        if cells:
+            query = query.where(reduce(operator.or_, [Place.geohash.startswith(cell) for cell in cells]))
+
+        ''' Keep the places within the radius, nearest first '''
+        places = []
+        for place in query:
+            distance = geo.distance(lat, lng, place.latitude, place.longitude)
+            if distance <= radius:
+                places.append((distance, place))
+        places.sort(key=lambda item: item[0])
+
+        result = []
+        for distance, place in places[:number]:
+            place_dict = place.to_dict()
+            place_dict['distance'] = distance
+            result.append(place_dict)
+        return {'data': result}, 200
+    except KeyError as e:
+        res = {}
+        res['code'] = 40000
+        res['msg'] = 'Missing parameters'
+        return res, 400
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
+    except Exception as e:
+        abort(500)
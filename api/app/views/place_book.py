@@ -1,10 +1,14 @@
 ''' Import app and models '''
 from app import app
+from app.models.base import db
 from app.models.place_book import PlaceBook
 from app.models.place import Place
 from app.models.user import User
 from return_styles import ListStyle
-from index import type_test
+from index import fetch_or_404
+from conditional import row_headers, not_modified
+from bulk import bulk_items, bulk_validate, bulk_error, bulk_response, existing_ids
+from schema import Schema, Field
 
 ''' Import packages '''
 from flask_json import as_json, request
@@ -12,6 +16,21 @@ from flask import abort
 from datetime import datetime, timedelta
 import json
 
+''' Fields accepted when creating a booking '''
+BOOKING_SCHEMA = Schema({
+    'user_id': Field(int, required=True),
+    'date_start': Field('datetime', required=True, msg='%s is not formatted correctly'),
+    'is_validated': Field(bool, msg='%s is not a boolean'),
+    'number_nights': Field(int, min=1, max=PlaceBook.MAX_NIGHTS)
+})
+
+''' Fields accepted when updating a booking '''
+BOOKING_UPDATE_SCHEMA = Schema({
+    'is_validated': Field(bool, msg="Value of '%s' should be a boolean"),
+    'date_start': Field('datetime', msg="'%s' is not formatted properly"),
+    'number_nights': Field(int, min=1, max=PlaceBook.MAX_NIGHTS, msg="Value of '%s' should be a integer")
+})
+
 @app.route('/places/<place_id>/books', methods=['GET'])
 @as_json
 def get_place_bookings(place_id):
@@ -46,21 +65,81 @@ def get_place_bookings(place_id):
                         description: pagination
                         schema:
                             $ref: '#/definitions/get_amenities_get_Paging'
+        304:
+            description: List page was not modified since the ETag or date given by the client
+        400:
+            description: Issue with the page, number or after cursor
     """
     try:
-        ''' Check if place_id exists '''
-        query = Place.select().where(Place.id == place_id)
-        if not query.exists():
-            raise LookupError('place_id')
-
         ''' Return list of bookings for the given place '''
         data = PlaceBook.select().where(PlaceBook.place == place_id)
-        return ListStyle.list(data, request), 200
+        result, status, headers = ListStyle.conditional(data, request)
+
+        ''' Only check that the place exists when no booking was found '''
+        if status == 200 and not result['data']:
+            query = Place.select().where(Place.id == place_id)
+            if not query.exists():
+                raise LookupError('place_id')
+        return result, status, headers
     except LookupError as e:
         abort(404)
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
     except Exception as e:
         abort(500)
 
+@app.route('/books/changes', methods=['GET'])
+@as_json
+def get_bookings_changes():
+    """
+    Get changed bookings
+    List the bookings created or updated since a cursor, oldest change first.
+    ---
+    tags:
+        - PlaceBook
+    parameters:
+        -
+            name: since
+            in: query
+            type: string
+            description: cursor from paging next of the previous pull, or a date formatted as %Y/%m/%d %H:%M:%S, all bookings if omitted
+        -
+            name: number
+            in: query
+            type: integer
+            description: maximum number of bookings returned
+    responses:
+        200:
+            description: List of the changed bookings, paging next holds the cursor of the next pull
+            schema:
+                id: BookingChanges
+                required:
+                    - data
+                    - paging
+                properties:
+                    data:
+                        type: array
+                        description: bookings array
+                        items:
+                            $ref: '#/definitions/get_booking_get_Booking'
+                    paging:
+                        description: pagination
+                        schema:
+                            $ref: '#/definitions/get_amenities_get_Paging'
+        400:
+            description: Issue with the since cursor or number
+    """
+    try:
+        return ListStyle.changes(PlaceBook.select(), request), 200
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
+
 @app.route('/places/<place_id>/books', methods=['POST'])
 @as_json
 def book_date(place_id):
@@ -98,7 +177,7 @@ def book_date(place_id):
             name: number_nights
             in: form
             type: integer
-            description: Number of nights of the booking
+            description: Number of nights of the booking, at most 365
     responses:
         201:
             description: Booking was created
@@ -113,74 +192,37 @@ def book_date(place_id):
         500:
             description: The request was not able to be processed
     """
-    data = {}
-    for key in request.form.keys():
-    	for value in request.form.getlist(key):
-    		data[key] = value
     try:
-        ''' Check if place_id exists '''
-        query = Place.select().where(Place.id == place_id)
-        if not query.exists():
-            raise LookupError('place_id')
-
-        ''' Check if required keys are included '''
-        if not 'user_id' in data:
-            raise KeyError('user_id')
-        elif not 'date_start' in data:
-            raise KeyError('date_start')
-
-        ''' Check if user_id is an integer '''
-        if not type_test(data['user_id'], int):
-            raise TypeError('user_id is not an integer')
+        ''' Check if required keys are included and values are valid '''
+        data = BOOKING_SCHEMA.validate(request.form)
 
         ''' Check if user_id exists '''
         query = User.select().where(User.id == data['user_id'])
         if not query.exists():
             raise LookupError('user_id')
 
-        ''' Check if date_start is a string '''
-        if not type_test(data['date_start'], 'string'):
-            raise TypeError('date_start is not a string')
-
-        ''' Check if date_start string if formatted correctly '''
-        if not datetime.strptime(data['date_start'], "%Y/%m/%d %H:%M:%S"):
-            raise ValueError('date_start is not formatted correctly')
+        with db.atomic():
+            ''' Lock the place so bookings of it are checked one at a time '''
+            if not Place.lock(place_id):
+                raise LookupError('place_id')
 
-        ''' Check if is_validated is a boolean '''
-        if 'is_validated' in data:
-            if not type_test(data['is_validated'], bool):
-                raise TypeError('is_validated is not a boolean')
-
-        ''' Check if number_nights is an integer '''
-        if 'number_nights' in data:
-            if not type_test(data['number_nights'], int):
-                raise TypeError('number_nights is not an integer')
-
-        ''' Check if place is already booked '''
-        book_start = datetime.strptime(data['date_start'], "%Y/%m/%d %H:%M:%S").replace(hour=0, minute=0, second=0)
-        book_end = book_start + timedelta(days= int(data['number_nights']))
-        bookings = PlaceBook.select().where(PlaceBook.place == place_id)
-        for booking in bookings:
-            date_start = booking.date_start.replace(hour=0, minute=0, second=0)
-            date_end = date_start + timedelta(days= int(booking.number_nights))
-            if book_start >= date_start and book_start < date_end:
-                raise ValueError('booked')
-            elif book_end > date_start and book_end <= date_end:
-                raise ValueError('booked')
-            elif date_start >= book_start and date_start < book_end:
+            ''' Check if place is already booked '''
+            book_start = data['date_start'].replace(hour=0, minute=0, second=0)
+            book_end = book_start + timedelta(days=data['number_nights'])
+            if PlaceBook.overlapping(place_id, book_start, book_end).exists():
                 raise ValueError('booked')
 
-        ''' Create new booking '''
-        new = PlaceBook(
-            place = place_id,
-            user = data['user_id'],
-            date_start = datetime.strptime(data['date_start'], "%Y/%m/%d %H:%M:%S")
-        )
-        if 'is_validated' in data:
-            new.is_validated = data['is_validated']
-        if 'number_nights' in data:
-            new.number_nights = data['number_nights']
-        new.save()
+            ''' Create new booking '''
+            new = PlaceBook(
+                place = place_id,
+                user = data['user_id'],
+                date_start = data['date_start']
+            )
+            if 'is_validated' in data:
+                new.is_validated = data['is_validated']
+            if 'number_nights' in data:
+                new.number_nights = data['number_nights']
+            new.save()
         res = {}
         res['code'] = 201
         res['id'] = new.id
@@ -212,6 +254,104 @@ def book_date(place_id):
         print e.message
         abort(500)
 
+@app.route('/places/<place_id>/books/bulk', methods=['POST'])
+@as_json
+def book_dates(place_id):
+    """
+    Create many bookings
+    Create the bookings of a JSON array for the given place in one transaction
+    ---
+    tags:
+        - PlaceBook
+    parameters:
+        -
+            name: place_id
+            in: path
+            type: integer
+            required: True
+            description: ID of the place
+        -
+            name: body
+            in: body
+            required: True
+            description: array of bookings, each with the fields of a new booking
+            schema:
+                type: array
+                items:
+                    type: object
+    responses:
+        201:
+            description: All bookings were created
+            schema:
+                $ref: '#/definitions/create_places_post_bulk_success'
+        200:
+            description: Some bookings were not created, see the code of each item
+        400:
+            description: The request body is not a JSON array
+        404:
+            description: Place was not found
+        500:
+            description: The request was not able to be processed
+    """
+    try:
+        ''' Check the fields of every booking in one pass '''
+        items = bulk_items(request)
+        valid, results = bulk_validate(BOOKING_SCHEMA, items)
+
+        ''' Check the users of the whole batch with one query '''
+        users = existing_ids(User, [data['user_id'] for index, data in valid])
+
+        with db.atomic():
+            ''' Lock the place so bookings of it are checked one at a time '''
+            if not Place.lock(place_id):
+                raise LookupError('place_id')
+
+            ''' Read the bookings of the place that may overlap the batch with one query '''
+            taken = []
+            for index, data in valid:
+                data['number_nights'] = data.get('number_nights', 1)
+                data['date_end'] = PlaceBook.end_date(data['date_start'], data['number_nights'])
+            if valid:
+                batch_start = min([data['date_start'] for index, data in valid]).replace(hour=0, minute=0, second=0)
+                batch_end = max([data['date_end'] for index, data in valid])
+                query = PlaceBook.overlapping(place_id, batch_start, batch_end)
+                taken = list(query.select(PlaceBook.date_start, PlaceBook.date_end).tuples())
+
+            ''' Keep the bookings that overlap neither the place nor the batch '''
+            rows, positions = [], []
+            for index, data in valid:
+                book_start = data['date_start'].replace(hour=0, minute=0, second=0)
+                if not data['user_id'] in users:
+                    results[index] = bulk_error(index, 404, 'user_id was not found')
+                elif any(start < data['date_end'] and end > book_start for start, end in taken):
+                    results[index] = bulk_error(index, 110000, 'Place unavailable at this date')
+                else:
+                    taken.append((book_start, data['date_end']))
+                    rows.append({
+                        'place': place_id,
+                        'user': data['user_id'],
+                        'is_validated': data.get('is_validated', False),
+                        'date_start': data['date_start'],
+                        'number_nights': data['number_nights'],
+                        'date_end': data['date_end']
+                    })
+                    positions.append(index)
+
+            ''' Insert the bookings with one multi-row INSERT '''
+            ids = PlaceBook.insert_rows(rows)
+        for index, new_id in zip(positions, ids):
+            results[index] = {'index': index, 'code': 201, 'msg': 'Booking of place was created successfully', 'id': new_id}
+        return bulk_response(results, len(items))
+    except LookupError as e:
+        abort(404)
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
+    except Exception as e:
+        abort(500)
+
 @app.route('/places/<place_id>/books/<book_id>', methods=['GET'])
 @as_json
 def get_booking(place_id, book_id):
@@ -279,30 +419,20 @@ def get_booking(place_id, book_id):
                         type: datetime string
                         description: date and time the booking was updated in the database
                         default: '2016-08-11 20:30:38'
+        304:
+            description: Record was not modified since the ETag or date given by the client
         404:
             description: Place or booking was not found
         500:
             description: Request could not be processed
     """
     try:
-        ''' Test if place does not exist '''
-        query = Place.select().where(Place.id == place_id)
-        if not query.exists():
-            raise LookupError('place_id')
-
-        ''' Test if booking does not exist '''
-        query = PlaceBook.select().where(PlaceBook.id == book_id)
-        if not query.exists():
-            raise LookupError('bookd_id')
-
-        ''' Check if place, booking combo exists '''
-        query = query.where(PlaceBook.place == place_id)
-        if not query.exists():
-            raise LookupError('book_id, place_id')
-
-        ''' Return booking data '''
-        booking = PlaceBook.get(PlaceBook.id == book_id, PlaceBook.place == place_id)
-        return booking.to_dict(), 200
+        ''' Return booking data, 404 if it does not exist for the place '''
+        booking = fetch_or_404(PlaceBook.select().where(PlaceBook.id == book_id, PlaceBook.place == place_id))
+        headers = row_headers(booking)
+        if not_modified(request, headers):
+            return None, 304, headers
+        return booking.to_dict(), 200, headers
     except LookupError as e:
         abort(404)
     except Exception as e:
@@ -344,7 +474,7 @@ def update_booking(place_id, book_id):
             name: number_nights
             in: form
             type: integer
-            description: Number of nights of the booking
+            description: Number of nights of the booking, at most 365
     responses:
         200:
             description: Booking was updated
@@ -372,56 +502,38 @@ def update_booking(place_id, book_id):
         500:
             description: The request was not able to be processed
     """
-    data = {}
-    for key in request.form.keys():
-        for value in request.form.getlist(key):
-        	data[key] = value
     try:
-        ''' Test if place does not exist '''
-        query = Place.select().where(Place.id == place_id)
-        if not query.exists():
-            raise LookupError('place_id')
-
-        ''' Test if booking does not exist '''
-        query = PlaceBook.select().where(PlaceBook.id == book_id)
-        if not query.exists():
-            raise LookupError('book_id')
-
-        ''' Check if place, booking combo exists '''
-        query = PlaceBook.select().where(PlaceBook.id == book_id, PlaceBook.place == place_id)
-        if not query.exists():
-            raise LookupError('book_id, place_id')
-
         ''' Check if user_id in data '''
-        if 'user_id' in data:
+        if 'user_id' in request.form:
             raise ValueError('User cannot be changed')
 
-        ''' Get the record for update '''
-        booking = PlaceBook.get(PlaceBook.id == book_id, PlaceBook.place == place_id)
+        ''' Check the values of is_validated, date_start and number_nights '''
+        fields = BOOKING_UPDATE_SCHEMA.validate(request.form)
 
-        ''' Check if is_validated in data '''
-        if 'is_validated' in data:
-            if not type_test(data['is_validated'], bool):
-                raise TypeError("Value of 'is_validated' should be a boolean")
-            if data['is_validated'] == 'True':
-                booking.is_validated = True
-            else:
-                booking.is_validated = False
+        if not 'date_start' in fields and not 'number_nights' in fields:
+            ''' Update booking record in one statement, 404 if it does not exist for the place '''
+            if fields:
+                if not PlaceBook.update_fields(fields, PlaceBook.id == book_id, PlaceBook.place == place_id):
+                    raise LookupError('book_id')
+            elif not PlaceBook.select().where(PlaceBook.id == book_id, PlaceBook.place == place_id).exists():
+                raise LookupError('book_id')
+        else:
+            with db.atomic():
+                ''' Lock the place so bookings of it are checked one at a time '''
+                Place.lock(place_id)
 
-        ''' Check if date_start in data '''
-        if 'date_start' in data:
-            if not type_test(data['date_start'], 'string'):
-                raise TypeError("Value of 'date_start' should be a string")
-            if not datetime.strptime(data['date_start'], "%Y/%m/%d %H:%M:%S"):
-                raise TypeError("'date_start' is not formatted properly")
-            booking.date_start = data['date_start']
+                ''' Get the record for update, 404 if it does not exist for the place '''
+                booking = fetch_or_404(PlaceBook.select().where(PlaceBook.id == book_id, PlaceBook.place == place_id))
+                for key in fields:
+                    setattr(booking, key, fields[key])
 
-        ''' Check if number_nights in data '''
-        if 'number_nights' in data:
-            if not type_test(data['number_nights'], int):
-                raise TypeError("Value of 'number_nights' should be a integer")
-            booking.number_nights = data['number_nights']
-        booking.save()
+                ''' Check if the new dates overlap another booking '''
+                book_start = booking.date_start.replace(hour=0, minute=0, second=0)
+                book_end = PlaceBook.end_date(booking.date_start, booking.number_nights)
+                query = PlaceBook.overlapping(place_id, book_start, book_end).where(PlaceBook.id != booking.id)
+                if query.exists():
+                    raise ValueError('booked')
+                booking.save()
         res = {}
         res['code'] = 200
         res['msg'] = "Booking of place was updated successfully"
@@ -434,6 +546,11 @@ def update_booking(place_id, book_id):
         res['msg'] = e.message
         return res, 400
     except ValueError as e:
+        if e.message == 'booked':
+            res = {}
+            res['code'] = 110000
+            res['msg'] = 'Place unavailable at this date'
+            return res, 410
         if e.message == 'User cannot be changed':
             res = {}
             res['code'] = 403
@@ -479,24 +596,10 @@ def delete_booking(place_id, book_id):
             description: Request could not be processed
     """
     try:
-        ''' Test if place does not exist '''
-        query = Place.select().where(Place.id == place_id)
-        if not query.exists():
-            raise LookupError('place_id')
-
-        ''' Test if booking does not exist '''
-        query = PlaceBook.select().where(PlaceBook.id == book_id)
-        if not query.exists():
-            raise LookupError('book_id')
-
-        ''' Check if place, booking combo exists '''
-        query = query.where(PlaceBook.place == place_id)
-        if not query.exists():
-            raise LookupError('book_id, place_id')
-
-        ''' Delete the given booking '''
+        ''' Delete the given booking, 404 if no row was deleted '''
         booking = PlaceBook.delete().where(PlaceBook.id == book_id, PlaceBook.place == place_id)
-        booking.execute()
+        if not booking.execute():
+            raise LookupError('book_id, place_id')
         res = {}
         res['code'] = 200
         res['msg'] = "Booking was deleted successfully"
@@ -1,25 +1,172 @@
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from urllib import urlencode
+from datetime import datetime, timedelta
+from conditional import page_headers, not_modified
+from config import CHANGES
+
 class ListStyle:
 	@staticmethod
 	def list(select, request):
-		''' Get pagination values '''
+		''' Create the list of dicts of the requested page '''
+		rows, paging = ListStyle.page(select, request)
+		list_of_dicts = []
+		for row in rows:
+			list_of_dicts.append(row.to_dict())
+		return {'data': list_of_dicts, 'paging': paging}
+
+	@staticmethod
+	def conditional(select, request):
+		''' Returns the list with its ETag and Last-Modified, a 304 when the client copy is current
+
+		A conditional request first reads only the id and updated_at of the
+		page, so an unchanged page is answered without building its dicts.
+		'''
+		if request.if_none_match or request.if_modified_since:
+			model = select.model_class
+			rows, paging = ListStyle.page(select, request, model.id, model.updated_at)
+			headers = page_headers(request, rows)
+			if not_modified(request, headers):
+				return None, 304, headers
+		rows, paging = ListStyle.page(select, request)
+		list_of_dicts = []
+		for row in rows:
+			list_of_dicts.append(row.to_dict())
+		return {'data': list_of_dicts, 'paging': paging}, 200, page_headers(request, rows)
+
+	@staticmethod
+	def page(select, request, *selection):
+		''' Returns the rows and paging urls of the requested page, reading only the selection if given
+
+		A page, number or after cursor that cannot be read raises TypeError,
+		which the list views answer with a 400.
+		'''
 		page = request.args.get('page')
 		number = request.args.get('number')
+		after = request.args.get('after')
 		if not page:
 			page = 1
 		if not number:
 			number = 10
-		page, number = [int(page), int(number)]
+		try:
+			page, number = [int(page), int(number)]
+		except ValueError:
+			raise TypeError('page and number must be integers')
+		if page < 1 or number < 1:
+			raise TypeError('page and number must be positive')
+		if selection:
+			select = select.select(*selection)
+
+		''' Seek on the primary key when a cursor is given '''
+		if after is not None:
+			return ListStyle.seek(select, request, after, number)
 
 		''' Set next and prev urls '''
 		paging = {}
 		if page == 1:
 			paging['prev'] = None
 		else:
-			paging['prev'] = str(request.base_url) + '?page=' + str(page - 1) + '&number=' + str(number)
-		paging['next'] = str(request.base_url) + '?page=' + str(page + 1) + '&number=' + str(number)
+			paging['prev'] = ListStyle.url(request, page=page - 1, number=number)
+		paging['next'] = ListStyle.url(request, page=page + 1, number=number)
+		return list(select.paginate(page, number)), paging
+
+	@staticmethod
+	def seek(select, request, after, number):
+		''' Returns the rows after the cursor using WHERE id > ? instead of OFFSET '''
+		model = select.model_class
+		if after:
+			select = select.where(model.id > ListStyle.decode_cursor(after))
+		rows = list(select.order_by(model.id).limit(number + 1))
+
+		''' Only emit a next cursor when another row exists '''
+		paging = {}
+		paging['prev'] = None
+		paging['next'] = None
+		if len(rows) > number:
+			rows = rows[:number]
+			cursor = ListStyle.encode_cursor(rows[-1].id)
+			paging['next'] = ListStyle.url(request, after=cursor, number=number)
+		return rows, paging
 
-		''' Create the list of dicts '''
+	@staticmethod
+	def changes(select, request):
+		''' Returns the rows updated after the since cursor, oldest first, with the cursor of the next pull
+
+		Rows are read in (updated_at, id) order from the updated_at index, so
+		a cursor resumes after the last row seen even when several rows share
+		a timestamp. updated_at is set before its transaction commits, so a
+		row may become visible after later ones: rows are held back until
+		they are CHANGES lag seconds old, truncated to the second as
+		updated_at only has second precision in MySQL. A transaction that
+		commits later than that after its updated_at could be skipped. Deleted
+		rows do not appear in the feed.
+		'''
+		model = select.model_class
+		number = request.args.get('number')
+		since = request.args.get('since')
+		try:
+			number = int(number) if number else 10
+		except ValueError:
+			raise TypeError('number must be an integer')
+		if number < 1:
+			raise TypeError('number must be positive')
+
+		''' Resume after the cursor, or from a date on the first pull '''
+		if since:
+			updated_at, row_id = ListStyle.decode_since(since)
+			select = select.where((model.updated_at > updated_at) | ((model.updated_at == updated_at) & (model.id > row_id)))
+		settled = datetime.now().replace(microsecond=0) - timedelta(seconds=CHANGES['lag'])
+		select = select.where(model.updated_at < settled).order_by(model.updated_at, model.id)
+		rows = list(select.limit(number))
+
+		''' The next pull starts after the last row, or at the same cursor when nothing changed '''
+		if rows:
+			since = ListStyle.encode_since(rows[-1].updated_at, rows[-1].id)
+		paging = {}
+		paging['prev'] = None
+		paging['next'] = ListStyle.url(request, since=since, number=number)
 		list_of_dicts = []
-		for row in select.paginate(page, number):
+		for row in rows:
 			list_of_dicts.append(row.to_dict())
 		return {'data': list_of_dicts, 'paging': paging}
+
+	@staticmethod
+	def encode_since(updated_at, row_id):
+		''' Returns an opaque change feed cursor for the given update time and row id '''
+		return ListStyle.encode_cursor('%s.%d' % (updated_at.strftime('%Y%m%d%H%M%S%f'), row_id))
+
+	@staticmethod
+	def decode_since(since):
+		''' Returns the update time and row id of a cursor or of a date, TypeError if it is neither '''
+		try:
+			return datetime.strptime(since, '%Y/%m/%d %H:%M:%S'), 0
+		except ValueError:
+			pass
+		try:
+			value = urlsafe_b64decode(str(since) + '=' * (-len(since) % 4))
+			updated_at, row_id = value.split('.')
+			return datetime.strptime(updated_at, '%Y%m%d%H%M%S%f'), int(row_id)
+		except (TypeError, ValueError):
+			raise TypeError('since must be a cursor or a date formatted as %Y/%m/%d %H:%M:%S')
+
+	@staticmethod
+	def url(request, **params):
+		''' Builds a paging url, keeping any other query arguments '''
+		keys = ('page', 'after', 'since', 'number')
+		args = [(key, params.get(key)) for key in keys if params.get(key) is not None]
+		for key, value in request.args.items(multi=True):
+			if key not in keys:
+				args.append((key, value.encode('utf-8')))
+		return str(request.base_url) + '?' + urlencode(args)
+
+	@staticmethod
+	def encode_cursor(row_id):
+		''' Returns an opaque cursor for the given row id '''
+		return urlsafe_b64encode(str(row_id)).rstrip('=')
+
+	@staticmethod
+	def decode_cursor(cursor):
+		''' Returns the row id of the given cursor, TypeError if it is invalid '''
+		try:
+			return int(urlsafe_b64decode(str(cursor) + '=' * (-len(cursor) % 4)))
+		except (TypeError, ValueError, UnicodeEncodeError):
+			raise TypeError('after must be a cursor')
@@ -1,19 +1,31 @@
 ''' Import app and models '''
 from app import app
+from app.models.base import db
 from app.models.review_place import ReviewPlace
 from app.models.review_user import ReviewUser
 from app.models.review import Review
 from app.models.user import User
 from app.models.place import Place
 from return_styles import ListStyle
-from index import type_test
+from index import fetch_or_404
+from conditional import row_headers, not_modified
+from schema import Schema, Field
+from bulk import bulk_items, bulk_validate, bulk_error, bulk_response, existing_ids
 
 ''' Import packages '''
 from flask_json import as_json, request
 from datetime import datetime
 from flask import abort
+from peewee import JOIN
 import json
 
+''' Fields accepted when creating a review '''
+REVIEW_SCHEMA = Schema({
+	'user_id': Field(int, required=True),
+	'message': Field('string', required=True),
+	'stars': Field(int)
+}, error=ValueError, msg='%s')
+
 @app.route('/users/<user_id>/reviews', methods=['GET'])
 @as_json
 def get_user_reviews(user_id):
@@ -48,18 +60,29 @@ def get_user_reviews(user_id):
 	                    description: pagination
 	                    schema:
 	                        $ref: '#/definitions/get_amenities_get_Paging'
+	    304:
+	        description: List page was not modified since the ETag or date given by the client
+	    400:
+	        description: Issue with the page, number or after cursor
 	"""
 	try:
-		''' Test if user_id exists '''
-		query = User.select().where(User.id == user_id)
-		if not query.exists():
-			raise LookupError('user_id')
-
-		''' Get list of reviews for the user and return response '''
+		''' Get list of reviews for the user '''
 		reviews = Review.select(Review, ReviewUser).join(ReviewUser).where(ReviewUser.user == user_id)
-		return ListStyle.list(reviews, request), 200
+		result, status, headers = ListStyle.conditional(reviews, request)
+
+		''' Only check that the user exists when no review was found '''
+		if status == 200 and not result['data']:
+			query = User.select().where(User.id == user_id)
+			if not query.exists():
+				raise LookupError('user_id')
+		return result, status, headers
 	except LookupError as e:
 		abort(404)
+	except TypeError as e:
+		res = {}
+		res['code'] = 400
+		res['msg'] = e.message
+		return res, 400
 	except Exception as e:
 		print e.message
 		res = {
@@ -69,6 +92,61 @@ def get_user_reviews(user_id):
 		return res, 500
 
 
+@app.route('/reviews/changes', methods=['GET'])
+@as_json
+def get_reviews_changes():
+	"""
+	Get changed reviews
+	List the user and place reviews created or updated since a cursor, oldest change first.
+	---
+	tags:
+	    - Review
+	parameters:
+	    -
+	        name: since
+	        in: query
+	        type: string
+	        description: cursor from paging next of the previous pull, or a date formatted as %Y/%m/%d %H:%M:%S, all reviews if omitted
+	    -
+	        name: number
+	        in: query
+	        type: integer
+	        description: maximum number of reviews returned
+	responses:
+	    200:
+	        description: List of the changed reviews, paging next holds the cursor of the next pull
+	        schema:
+	            id: ReviewChanges
+	            required:
+	                - data
+	                - paging
+	            properties:
+	                data:
+	                    type: array
+	                    description: reviews array
+	                    items:
+	                        $ref: '#/definitions/get_user_review_get_UserReview'
+	                paging:
+	                    description: pagination
+	                    schema:
+	                        $ref: '#/definitions/get_amenities_get_Paging'
+	    400:
+	        description: Issue with the since cursor or number
+	"""
+	try:
+		''' Join both links so each review tells the user or place it reviews '''
+		reviews = (Review
+				   .select(Review, ReviewUser, ReviewPlace)
+				   .join(ReviewUser, JOIN.LEFT_OUTER)
+				   .switch(Review)
+				   .join(ReviewPlace, JOIN.LEFT_OUTER))
+		return ListStyle.changes(reviews, request), 200
+	except TypeError as e:
+		res = {}
+		res['code'] = 400
+		res['msg'] = e.message
+		return res, 400
+
 @app.route('/users/<user_id>/reviews', methods=['POST'])
 @as_json
 def create_user_reviews(user_id):
@@ -114,24 +192,9 @@ def create_user_reviews(user_id):
 	    500:
 	        description: The request was not able to be processed
 	"""
-	data = {}
-	for key in request.form.keys():
-		for value in request.form.getlist(key):
-			data[key] = value
 	try:
-		''' Test for required data '''
-		if not data['user_id']:
-			raise KeyError('user_id')
-		elif not data['message']:
-			raise KeyError('message')
-
-		''' Test type of submitted data '''
-		if not type_test(data['user_id'], int):
-			raise ValueError('user_id')
-		elif not type_test(data['message'], 'string'):
-			raise ValueError('message')
-		elif 'stars' in data and not type_test(data['stars'], int):
-			raise ValueError('stars')
+		''' Test for required data and type of submitted data '''
+		data = REVIEW_SCHEMA.validate(request.form)
 
 		''' Test if route user_id exists '''
 		query = User.select().where(User.id == user_id)
@@ -149,11 +212,15 @@ def create_user_reviews(user_id):
 		)
 		if 'stars' in data:
 			new_review.stars = data['stars']
-		new_review.save()
-		new_user_review = ReviewUser.create(
-			user = user_id,
-			review = new_review.id
-		)
+
+		''' Store the review with the aggregates of the reviewed user '''
+		with db.atomic():
+			new_review.save()
+			new_user_review = ReviewUser.create(
+				user = user_id,
+				review = new_review.id
+			)
+			ReviewUser.count(user_id, new_review.stars)
 		res = {}
 		res['code'] = 201
 		res['msg'] = 'Review saved successfully'
@@ -245,19 +312,21 @@ def get_user_review(user_id, review_id):
 	                    type: datetime string
 	                    description: date and time the review was updated in the database
 	                    default: '2016-08-11 20:30:38'
+	    304:
+	        description: Record was not modified since the ETag or date given by the client
 	    404:
 	        description: Review or a user was not found
 	    500:
 	        description: Request could not be processed
     """
 	try:
-		query = ReviewUser.select().where(ReviewUser.review == review_id, ReviewUser.user == user_id)
-		if not query.exists():
-			raise LookupError('Not found')
-		query = Review.get(Review.id == review_id)
-		data = query.to_dict()
-		data['touserid'] = user_id
-		return data, 200
+		''' Return the review, 404 if it is not a review of the user '''
+		query = Review.select(Review, ReviewUser).join(ReviewUser).where(ReviewUser.review == review_id, ReviewUser.user == user_id)
+		review = fetch_or_404(query)
+		headers = row_headers(review)
+		if not_modified(request, headers):
+			return None, 304, headers
+		return review.to_dict(), 200, headers
 	except LookupError as e:
 		abort(404)
 	except Exception as e:
@@ -297,14 +366,10 @@ def delete_user_review(user_id, review_id):
             description: Request could not be processed
     """
 	try:
-		query = ReviewUser.select().where(ReviewUser.review == review_id, ReviewUser.user == user_id)
-		if not query.exists():
-			raise LookupError('Not found')
-		query = Review.select().where(Review.id == review_id)
-		if not query.exists():
-			raise LookupError('Not found')
-		ReviewUser.delete().where(ReviewUser.review == review_id, ReviewUser.user == user_id).execute()
-		Review.delete().where(Review.id == review_id).execute()
+		''' Delete the review and its link in one transaction with the aggregates, 404 if no row was deleted '''
+		with db.atomic():
+			if not ReviewUser.delete_review(user_id, review_id):
+				raise LookupError('review_id')
 		res = {
 			'code': 200,
 			'msg': 'Review deleted successfully'
@@ -314,6 +379,7 @@ def delete_user_review(user_id, review_id):
 		abort(404)
 	except Exception as e:
 		print e
+		abort(500)
 
 @app.route('/places/<place_id>/reviews', methods=['GET'])
 @as_json
@@ -349,18 +415,29 @@ def get_place_reviews(place_id):
 	                    description: pagination
 	                    schema:
 	                        $ref: '#/definitions/get_amenities_get_Paging'
+	    304:
+	        description: List page was not modified since the ETag or date given by the client
+	    400:
+	        description: Issue with the page, number or after cursor
 	"""
 	try:
-		''' Test if user_id exists '''
-		query = Place.select().where(Place.id == place_id)
-		if not query.exists():
-			raise LookupError('place_id')
-
-		''' Get list of reviews for the user '''
+		''' Get list of reviews for the place '''
 		reviews = Review.select(Review, ReviewPlace).join(ReviewPlace).where(ReviewPlace.place == place_id)
-		return ListStyle.list(reviews, request), 200
+		result, status, headers = ListStyle.conditional(reviews, request)
+
+		''' Only check that the place exists when no review was found '''
+		if status == 200 and not result['data']:
+			query = Place.select().where(Place.id == place_id)
+			if not query.exists():
+				raise LookupError('place_id')
+		return result, status, headers
 	except LookupError as e:
 		abort(404)
+	except TypeError as e:
+		res = {}
+		res['code'] = 400
+		res['msg'] = e.message
+		return res, 400
 	except Exception as e:
 		res = {
 			'code': 500,
@@ -413,24 +490,9 @@ def create_place_review(place_id):
 	    500:
 	        description: The request was not able to be processed
 	"""
-	data = {}
-	for key in request.form.keys():
-		for value in request.form.getlist(key):
-			data[key] = value
 	try:
-		''' Test for required data '''
-		if not data['user_id']:
-			raise KeyError('user_id')
-		elif not data['message']:
-			raise KeyError('message')
-
-		''' Test type of submitted data '''
-		if not type_test(data['user_id'], int):
-			raise ValueError('user_id')
-		elif not type_test(data['message'], 'string'):
-			raise ValueError('message')
-		elif 'stars' in data and not type_test(data['stars'], int):
-			raise ValueError('stars')
+		''' Test for required data and type of submitted data '''
+		data = REVIEW_SCHEMA.validate(request.form)
 
 		''' Test if route place_id exists '''
 		query = Place.select().where(Place.id == place_id)
@@ -449,11 +511,15 @@ def create_place_review(place_id):
 		)
 		if 'stars' in data:
 			new_review.stars = data['stars']
-		new_review.save()
-		new_place_review = ReviewPlace.create(
-			place = place_id,
-			review = new_review.id
-		)
+
+		''' Store the review with the aggregates of the reviewed place '''
+		with db.atomic():
+			new_review.save()
+			new_place_review = ReviewPlace.create(
+				place = place_id,
+				review = new_review.id
+			)
+			ReviewPlace.count(place_id, new_review.stars)
 		res = {}
 		res['code'] = 201
 		res['msg'] = 'Review saved successfully'
@@ -477,6 +543,96 @@ def create_place_review(place_id):
 		res['msg'] = e.message
 		return res, 500
 
+@app.route('/places/<place_id>/reviews/bulk', methods=['POST'])
+@as_json
+def create_place_reviews(place_id):
+	"""
+	Create many place reviews
+	Create the reviews of a JSON array for the given place in one transaction
+	---
+	tags:
+	    - Review
+	parameters:
+	    -
+	        name: place_id
+	        in: path
+	        type: integer
+	        required: True
+	        description: id of the place being reviewed
+	    -
+	        name: body
+	        in: body
+	        required: True
+	        description: array of reviews, each with the fields of a new place review
+	        schema:
+	            type: array
+	            items:
+	                type: object
+	responses:
+	    201:
+	        description: All reviews were created
+	        schema:
+	            $ref: '#/definitions/create_places_post_bulk_success'
+	    200:
+	        description: Some reviews were not created, see the code of each item
+	    400:
+	        description: The request body is not a JSON array
+	    404:
+	        description: Place was not found
+	    500:
+	        description: The request was not able to be processed
+	"""
+	try:
+		''' Check the fields of every review in one pass '''
+		items = bulk_items(request)
+		valid, results = bulk_validate(REVIEW_SCHEMA, items)
+		''' Name the invalid field as the single review endpoint does '''
+		for index in results:
+			if results[index]['code'] == 400 and isinstance(items[index], dict):
+				results[index]['msg'] = str(results[index]['msg']) + ' is invalid'
+
+		''' Test if route place_id exists '''
+		query = Place.select().where(Place.id == place_id)
+		if not query.exists():
+			raise LookupError('place_id')
+
+		''' Check the users of the whole batch with one query '''
+		users = existing_ids(User, [data['user_id'] for index, data in valid])
+		rows, positions = [], []
+		for index, data in valid:
+			if not data['user_id'] in users:
+				results[index] = bulk_error(index, 404, 'user_id was not found')
+			else:
+				rows.append({
+					'user': data['user_id'],
+					'message': data['message'],
+					'stars': data.get('stars', Review.stars.default)
+				})
+				positions.append(index)
+
+		''' Store the reviews and their links with one multi-row INSERT each, with the aggregates of the place '''
+		with db.atomic():
+			ids = Review.insert_rows(rows)
+			if ids:
+				ReviewPlace.insert_many([{'place': place_id, 'review': review_id} for review_id in ids]).execute()
+			stars = {}
+			for row in rows:
+				stars[row['stars']] = stars.get(row['stars'], 0) + 1
+			for value, count in stars.items():
+				ReviewPlace.count(place_id, value, count)
+		for index, new_id in zip(positions, ids):
+			results[index] = {'index': index, 'code': 201, 'msg': 'Review saved successfully', 'id': new_id}
+		return bulk_response(results, len(items))
+	except LookupError as e:
+		abort(404)
+	except TypeError as e:
+		res = {}
+		res['code'] = 400
+		res['msg'] = e.message
+		return res, 400
+	except Exception as e:
+		abort(500)
+
 @app.route('/places/<place_id>/reviews/<review_id>', methods=['GET'])
 @as_json
 def get_place_review(place_id, review_id):
@@ -544,19 +700,21 @@ def get_place_review(place_id, review_id):
 	                    type: datetime string
 	                    description: date and time the review was updated in the database
 	                    default: '2016-08-11 20:30:38'
+	    304:
+	        description: Record was not modified since the ETag or date given by the client
 	    404:
 	        description: Review, user or place was not found
 	    500:
 	        description: Request could not be processed
     """
 	try:
-		query = ReviewPlace.select().where(ReviewPlace.review == review_id, ReviewPlace.place == place_id)
-		if not query.exists():
-			raise LookupError('Not found')
-		query = Review.get(Review.id == review_id)
-		data = query.to_dict()
-		data['toplaceid'] = place_id
-		return data, 200
+		''' Return the review, 404 if it is not a review of the place '''
+		query = Review.select(Review, ReviewPlace).join(ReviewPlace).where(ReviewPlace.review == review_id, ReviewPlace.place == place_id)
+		review = fetch_or_404(query)
+		headers = row_headers(review)
+		if not_modified(request, headers):
+			return None, 304, headers
+		return review.to_dict(), 200, headers
 	except LookupError as e:
 		abort(404)
 	except Exception as e:
@@ -595,14 +753,10 @@ def delete_place_review(place_id, review_id):
             description: Request could not be processed
     """
 	try:
-		query = ReviewPlace.select().where(ReviewPlace.review == review_id, ReviewPlace.place == place_id)
-		if not query.exists():
-			raise LookupError('Not found')
-		query = Review.select().where(Review.id == review_id)
-		if not query.exists():
-			raise LookupError('Not found')
-		ReviewPlace.delete().where(ReviewPlace.review == review_id, ReviewPlace.place == place_id).execute()
-		Review.delete().where(Review.id == review_id).execute()
+		''' Delete the review and its link in one transaction with the aggregates, 404 if no row was deleted '''
+		with db.atomic():
+			if not ReviewPlace.delete_review(place_id, review_id):
+				raise LookupError('review_id')
 		res = {
 			'code': 200,
 			'msg': 'Review deleted successfully'
@@ -612,3 +766,4 @@ def delete_place_review(place_id, review_id):
 		abort(404)
 	except Exception as e:
 		print e
+		abort(500)
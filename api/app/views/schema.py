@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from math import isinf, isnan
+import re
+
+''' Patterns compiled once for every request '''
+INTEGER = re.compile(r"^\s*[-+]?\d+\s*$")
+NUMBER = re.compile(r"^\s*[-+]?((\d+\.?\d*|\.\d+)([eE][-+]?\d+)?|inf|infinity|nan)\s*$", re.IGNORECASE)
+EMAIL = re.compile("^([A-z0-9\"“][\w-]*[+\.]?[\w-]+[\"”]{0,1}@[A-z0-9][\w-]*\.[\w]+\.?[\w]{0,3}\.?[\w]{0,3}\]{0,1})$")
+DATETIME = "%Y/%m/%d %H:%M:%S"
+
+def to_int(value):
+    ''' Returns the value as an integer, None if it is not one '''
+    if INTEGER.match(value):
+        return int(value)
+
+def to_float(value):
+    ''' Returns the value as a float, None if it is not a finite one '''
+    if NUMBER.match(value):
+        value = float(value)
+        if not isnan(value) and not isinf(value):
+            return value
+
+def to_bool(value):
+    ''' Returns the value as a boolean, None if it is not 'True' or 'False' '''
+    if value == 'True':
+        return True
+    elif value == 'False':
+        return False
+
+def to_string(value):
+    ''' Returns the value, None if it is a number '''
+    if not NUMBER.match(value):
+        return value
+
+def to_email(value):
+    ''' Returns the value, None if it is not an email address '''
+    if EMAIL.match(value):
+        return value
+
+def to_datetime(value):
+    ''' Returns the value as a datetime, None if it is not formatted properly '''
+    try:
+        return datetime.strptime(value, DATETIME)
+    except ValueError:
+        return None
+
+''' Coercion of each field type, with the default message when a value is invalid '''
+TYPES = {
+    int: (to_int, "%s is not an integer"),
+    float: (to_float, "%s is not a float"),
+    bool: (to_bool, "%s is not a boolean value"),
+    'string': (to_string, "%s is not a string"),
+    'email': (to_email, "%s is not valid"),
+    'datetime': (to_datetime, "%s is not formatted properly")
+}
+
+def text(value):
+    ''' Returns a JSON value as it would be submitted in a form '''
+    if isinstance(value, basestring):
+        return value
+    elif isinstance(value, float):
+        return repr(value)
+    return unicode(value)
+
+def coerce(value, data_type):
+    ''' Returns the value converted to the type, None if it is invalid '''
+    if value is None:
+        return None
+    return TYPES[data_type][0](text(value))
+
+class Field(object):
+    ''' Describes one field of a request: its type, if it is required and its range '''
+    def __init__(self, data_type, required=False, min=None, max=None, msg=None):
+        self.type = data_type
+        self.required = required
+        self.min = min
+        self.max = max
+        self.msg = msg or TYPES[data_type][1]
+
+class Schema(object):
+    ''' Validates and coerces the fields of a request in one pass
+
+    The fields are compiled once when the view module is imported. Missing
+    required fields raise KeyError, invalid values raise the error class of
+    the schema with the message of the field.
+    '''
+    def __init__(self, fields, error=TypeError, msg=None):
+        self.error = error
+        self.required = [name for name in sorted(fields) if fields[name].required]
+        self.fields = []
+        for name in sorted(fields):
+            field = fields[name]
+            self.fields.append((name, TYPES[field.type][0], field.min, field.max, (msg or field.msg) % name))
+
+    def validate(self, form):
+        ''' Returns the submitted values of the fields of the schema, keeping the last one of repeated keys '''
+        data = {}
+        for key in form.keys():
+            values = form.getlist(key) if hasattr(form, 'getlist') else [form[key]]
+            if values:
+                data[key] = values[-1]
+
+        ''' A required field is missing when absent or empty, a JSON 0 or false is a value '''
+        for name in self.required:
+            if data.get(name) is None or data.get(name) == '':
+                raise KeyError(name)
+
+        values = {}
+        for name, convert, low, high, msg in self.fields:
+            if not name in data:
+                continue
+            value = data[name]
+            if value is not None:
+                value = convert(text(value))
+            if value is None:
+                raise self.error(msg)
+            if low is not None and value < low or high is not None and value > high:
+                raise self.error(msg)
+            values[name] = value
+        return values
@@ -1,8 +1,16 @@
 ''' Import app and models '''
 from app import app
+from app.models.base import db
 from app.models.state import State
+from app.models.city import City
+from app.models.place import Place
+from app.models.review_place import ReviewPlace
 from return_styles import ListStyle
-from index import type_test
+from index import fetch_or_404
+from conditional import row_headers, not_modified
+from schema import Schema, Field
+from auth import admin_required
+from cache import cached, invalidate
 
 ''' Import packages '''
 from flask_json import as_json, request
@@ -10,8 +18,14 @@ from datetime import datetime
 from flask import abort
 import json
 
+''' Fields accepted when creating a state '''
+STATE_SCHEMA = Schema({
+    'name': Field('string', required=True, msg="'%s' must be a string")
+})
+
 @app.route('/states', methods=['GET'])
 @as_json
+@cached('states')
 def get_states():
     """
     Get all states
@@ -37,16 +51,75 @@ def get_states():
                         description: pagination
                         schema:
                             $ref: '#/definitions/get_amenities_get_Paging'
+        304:
+            description: List page was not modified since the ETag or date given by the client
+        400:
+            description: Issue with the page, number or after cursor
     """
     try:
         ''' Returns a list of states in list named result '''
         data = State.select()
-        return ListStyle.list(data, request), 200
+        return ListStyle.conditional(data, request)
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
     except Exception as e:
         abort(500)
 
+@app.route('/states/changes', methods=['GET'])
+@as_json
+def get_states_changes():
+    """
+    Get changed states
+    List the states created or updated since a cursor, oldest change first.
+    ---
+    tags:
+        - State
+    parameters:
+        -
+            name: since
+            in: query
+            type: string
+            description: cursor from paging next of the previous pull, or a date formatted as %Y/%m/%d %H:%M:%S, all states if omitted
+        -
+            name: number
+            in: query
+            type: integer
+            description: maximum number of states returned
+    responses:
+        200:
+            description: List of the changed states, paging next holds the cursor of the next pull
+            schema:
+                id: StateChanges
+                required:
+                    - data
+                    - paging
+                properties:
+                    data:
+                        type: array
+                        description: states array
+                        items:
+                            $ref: '#/definitions/get_state_get_State'
+                    paging:
+                        description: pagination
+                        schema:
+                            $ref: '#/definitions/get_amenities_get_Paging'
+        400:
+            description: Issue with the since cursor or number
+    """
+    try:
+        return ListStyle.changes(State.select(), request), 200
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
+
 @app.route('/states', methods=['POST'])
 @as_json
+@admin_required
 def create_state():
     """
     Create a new state
@@ -68,27 +141,18 @@ def create_state():
                 $ref: '#/definitions/create_amenity_post_post_success'
         400:
             description: Issue with state request
+        401:
+            description: A token is required when authentication is enforced
+        403:
+            description: The token is not the one of an admin
         409:
             description: State already exists
         500:
             description: The request was not able to be processed
     """
-    data = {}
-    for key in request.form.keys():
-    	for value in request.form.getlist(key):
-    		data[key] = value
     try:
-        ''' Check that name key is in data '''
-        if not 'name' in data:
-            raise KeyError('name')
-
-        ''' Check that name key is not null '''
-        if not data['name']:
-            raise TypeError("'name' cannot be NULL")
-
-        ''' Check that name key value is a string '''
-        if not type_test(data['name'], 'string'):
-            raise TypeError("'name' must be a string")
+        ''' Check that name is given and is a string '''
+        data = STATE_SCHEMA.validate(request.form)
 
         ''' Check if state already exists '''
         query = State.select().where(State.name == data['name'])
@@ -98,6 +162,7 @@ def create_state():
         new = State.create(
             name = data['name']
         )
+        invalidate('states')
         res = {}
         res['code'] = 201
         res['id'] = new.id
@@ -165,19 +230,20 @@ def get_state(state_id):
                         type: datetime string
                         description: date and time the state was updated in the database
                         default: '2016-08-11 20:30:38'
+        304:
+            description: Record was not modified since the ETag or date given by the client
         404:
             description: State was not found
         500:
             description: Request could not be processed
     """
     try:
-        ''' Check that state_id exists '''
-        query = State.select().where(State.id == state_id)
-        if not query.exists():
-            raise LookupError('state_id')
-
-        state = State.get(State.id == state_id)
-        return state.to_dict(), 200
+        ''' Return the state, 404 if it does not exist '''
+        state = fetch_or_404(State.select().where(State.id == state_id))
+        headers = row_headers(state)
+        if not_modified(request, headers):
+            return None, 304, headers
+        return state.to_dict(), 200, headers
     except LookupError as e:
         abort(404)
     except Exception as e:
@@ -185,6 +251,7 @@ def get_state(state_id):
 
 @app.route('/states/<state_id>', methods=['DELETE'])
 @as_json
+@admin_required
 def delete_state(state_id):
     """
     Delete the given state
@@ -204,20 +271,28 @@ def delete_state(state_id):
             description: State deleted successfully
             schema:
                 $ref: '#/definitions/delete_amenity_delete_delete_200'
+        401:
+            description: A token is required when authentication is enforced
+        403:
+            description: The token is not the one of an admin
         404:
             description: State was not found
         500:
             description: Request could not be processed
     """
     try:
-        ''' Check that state_id exists '''
-        query = State.select().where(State.id == state_id)
-        if not query.exists():
-            raise LookupError('state_id')
+        ''' Delete the given state and the reviews of its places in one transaction, 404 if no row was deleted
 
-        ''' Delete the given state '''
-        delete_state = State.delete().where(State.id == state_id)
-        delete_state.execute()
+        Cities cascade from the state, and places with their bookings and
+        links from the cities.
+        '''
+        with db.atomic():
+            places = Place.select(Place.id).join(City).where(City.state == state_id)
+            ReviewPlace.delete_reviews(places)
+            delete_state = State.delete().where(State.id == state_id)
+            if not delete_state.execute():
+                raise LookupError('state_id')
+        invalidate('states', 'cities', 'place_amenities')
         response = {}
         response['code'] = 200
         response['msg'] = "State account was deleted"
@@ -1,8 +1,16 @@
 ''' Import app and models '''
 from app import app
+from app.models.base import db
 from app.models.user import User
+from app.models.place import Place
+from app.models.review_place import ReviewPlace
+from app.models.review_user import ReviewUser
 from return_styles import ListStyle
-from index import type_test
+from index import fetch_or_404
+from conditional import row_headers, not_modified
+from schema import Schema, Field
+from cache import invalidate
+from auth import admin_required, admin_error, owner_error, authenticate, basic_user, issue_token, revoke_token, bearer_token
 
 ''' Import packages '''
 from flask_json import as_json, request
@@ -10,6 +18,29 @@ from datetime import datetime
 from flask import abort
 import json
 
+''' Fields accepted when creating a user '''
+USER_SCHEMA = Schema({
+    'email': Field('email', required=True),
+    'first_name': Field('string', required=True),
+    'last_name': Field('string', required=True),
+    'password': Field('string', required=True),
+    'is_admin': Field(bool, msg='%s is not a True or False value')
+})
+
+''' Credentials of a login '''
+LOGIN_SCHEMA = Schema({
+    'email': Field('string', required=True),
+    'password': Field('string', required=True)
+})
+
+''' Fields accepted when updating a user '''
+USER_UPDATE_SCHEMA = Schema({
+    'first_name': Field('string'),
+    'last_name': Field('string'),
+    'password': Field('string'),
+    'is_admin': Field(bool)
+})
+
 @app.route('/users', methods=['GET'])
 @as_json
 def get_users():
@@ -37,9 +68,68 @@ def get_users():
                         description: pagination
                         schema:
                             $ref: '#/definitions/get_amenities_get_Paging'
+        304:
+            description: List page was not modified since the ETag or date given by the client
+        400:
+            description: Issue with the page, number or after cursor
+    """
+    try:
+        data = User.select()
+        return ListStyle.conditional(data, request)
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
+
+@app.route('/users/changes', methods=['GET'])
+@as_json
+def get_users_changes():
+    """
+    Get changed users
+    List the users created or updated since a cursor, oldest change first.
+    ---
+    tags:
+        - User
+    parameters:
+        -
+            name: since
+            in: query
+            type: string
+            description: cursor from paging next of the previous pull, or a date formatted as %Y/%m/%d %H:%M:%S, all users if omitted
+        -
+            name: number
+            in: query
+            type: integer
+            description: maximum number of users returned
+    responses:
+        200:
+            description: List of the changed users, paging next holds the cursor of the next pull
+            schema:
+                id: UserChanges
+                required:
+                    - data
+                    - paging
+                properties:
+                    data:
+                        type: array
+                        description: users array
+                        items:
+                            $ref: '#/definitions/get_user_get_User'
+                    paging:
+                        description: pagination
+                        schema:
+                            $ref: '#/definitions/get_amenities_get_Paging'
+        400:
+            description: Issue with the since cursor or number
     """
-    data = User.select()
-    return ListStyle.list(data, request), 200
+    try:
+        return ListStyle.changes(User.select(), request), 200
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
 
 @app.route('/users', methods=['POST'])
 @as_json
@@ -87,41 +177,24 @@ def create_user():
                 $ref: '#/definitions/create_amenity_post_post_success'
         400:
             description: Issue with user request
+        401:
+            description: A token is required to set is_admin when authentication is enforced
+        403:
+            description: Only an admin can set is_admin
         409:
             description: Email already exists
         500:
             description: The request was not able to be processed
     """
     try:
-        data = {}
-        for key in request.form.keys():
-           for value in request.form.getlist(key):
-               data[key] = value
-
-        ''' Test for required keys '''
-        if not 'email' in data:
-            raise KeyError('email')
-        if not 'first_name' in data:
-            raise KeyError('first_name')
-        if not 'last_name' in data:
-            raise KeyError('last_name')
-        if not 'password' in data:
-            raise KeyError('password')
+        ''' Test for required keys and key value data types '''
+        data = USER_SCHEMA.validate(request.form)
 
-        ''' Test required key value data types '''
-        if not type_test(data['email'], 'email'):
-            raise TypeError('email is not valid')
-        if not type_test(data['first_name'], 'string'):
-            raise TypeError('first_name is not a string')
-        if not type_test(data['last_name'], 'string'):
-            raise TypeError('last_name is not a string')
-        if not type_test(data['password'], 'string'):
-            raise TypeError('password is not a string')
-
-        ''' Test optional key value data types '''
+        ''' Only an admin can create an admin '''
         if 'is_admin' in data:
-            if not type_test(data['is_admin'], bool):
-                raise TypeError('is_admin is not a True or False value')
+            error = admin_error()
+            if error is not None:
+                return error
 
         ''' Test if email already exists in the db '''
         query = User.select().where(User.email == data['email'])
@@ -206,6 +279,18 @@ def get_user(user_id):
                         type: bool
                         description: Define if the user is an admin or not
                         default: False
+                    review_count:
+                        type: integer
+                        description: number of reviews of the user
+                        default: 0
+                    review_stars:
+                        type: integer
+                        description: total stars of the reviews of the user
+                        default: 0
+                    review_average:
+                        type: float
+                        description: average stars of the reviews of the user, null without reviews
+                        default: null
                     id:
                         type: number
                         description: id of the user
@@ -218,20 +303,20 @@ def get_user(user_id):
                         type: datetime string
                         description: date and time the user was updated in the database
                         default: '2016-08-11 20:30:38.959846'
+        304:
+            description: Record was not modified since the ETag or date given by the client
         404:
             description: User was not found
         500:
             description: Request could not be processed
     """
     try:
-        ''' Check if user_id exists '''
-        query = User.select().where(User.id == user_id)
-        if not query.exists():
-            raise LookupError('user_id')
-
-        ''' Return user data '''
-        user = User.get(User.id == user_id)
-        return user.to_dict(), 200
+        ''' Return user data, 404 if it does not exist '''
+        user = fetch_or_404(User.select().where(User.id == user_id))
+        headers = row_headers(user)
+        if not_modified(request, headers):
+            return None, 304, headers
+        return user.to_dict(), 200, headers
     except LookupError as e:
         abort(404)
     except Exception as e:
@@ -274,50 +359,46 @@ def update_user(user_id):
                 $ref: '#/definitions/update_booking_put_put_success'
         400:
             description: Issue with user update request
+        401:
+            description: A token is required when authentication is enforced
         403:
-            description: Email cannot be changed
+            description: Email cannot be changed, or the token is neither the one of the user nor of an admin
         500:
             description: The request was not able to be processed
     """
-    data = {}
-    for key in request.form.keys():
-    	for value in request.form.getlist(key):
-    		data[key] = value
     try:
+        ''' Only the user or an admin can update the user '''
+        error = owner_error(user_id)
+        if error is not None:
+            return error
+
         ''' Check if protected fields are included '''
-        if 'email' in data:
+        if 'email' in request.form:
             raise ValueError("Email cannot be changed")
 
         ''' Check for valid data types '''
-        if 'first_name' in data and not type_test(data['first_name'], 'string'):
-            raise TypeError('first_name is not a string')
-        if 'last_name' in data and not type_test(data['last_name'], 'string'):
-            raise TypeError('last_name is not a string')
-        if 'is_admin' in data and not type_test(data['is_admin'], bool):
-            raise TypeError('is_admin is not a boolean value')
-        if 'password' in data and not type_test(data['password'], 'string'):
-            raise TypeError('password is not a string')
+        data = USER_UPDATE_SCHEMA.validate(request.form)
 
-        ''' Check if user_id exists '''
-        query = User.select().where(User.id == user_id)
-        if not query.exists():
-            raise LookupError('user_id')
+        ''' Only an admin can grant or remove admin rights '''
+        if 'is_admin' in data:
+            error = admin_error()
+            if error is not None:
+                return error
 
-        ''' Retrieve user record and update '''
-        user = User.get(User.id == user_id)
-        for key in data:
-            if key == 'first_name':
-                user.first_name = data['first_name']
-            elif key == 'last_name':
-                user.last_name = data['last_name']
-            elif key == 'is_admin':
-                if data['is_admin'] == 'True':
-                    user.is_admin = True
-                else:
-                    user.is_admin = False
-            elif key == 'password':
-                user.set_password(data['password'])
-        user.save()
+        ''' Collect the columns to update '''
+        fields = {}
+        for key in ['first_name', 'last_name', 'is_admin']:
+            if key in data:
+                fields[key] = data[key]
+        if 'password' in data:
+            fields['password'] = User.hash_password(data['password'])
+
+        ''' Update user record in one statement, 404 if it does not exist '''
+        if fields:
+            if not User.update_fields(fields, User.id == user_id):
+                raise LookupError('user_id')
+        elif not User.select().where(User.id == user_id).exists():
+            raise LookupError('user_id')
         res = {}
         res['code'] = 200
         res['msg'] = "User was updated successfully"
@@ -339,6 +420,7 @@ def update_user(user_id):
 
 @app.route('/users/<user_id>', methods=['DELETE'])
 @as_json
+@admin_required
 def delete_user(user_id):
     """
     Delete the given user
@@ -358,20 +440,35 @@ def delete_user(user_id):
             description: User deleted successfully
             schema:
                 $ref: '#/definitions/delete_amenity_delete_delete_200'
+        401:
+            description: A token is required when authentication is enforced
+        403:
+            description: The token is not the one of an admin
         404:
             description: User was not found
         500:
             description: Request could not be processed
     """
     try:
-        ''' Check if user_id exists '''
-        query = User.select().where(User.id == user_id)
-        if not query.exists():
-            raise LookupError('user_id')
+        ''' Delete the given user in one transaction, 404 if no row was deleted
 
-        ''' Delete the given user '''
-        delete_user = User.delete().where(User.id == user_id)
-        delete_user.execute()
+        Places, bookings and written reviews cascade from the user. The reviews
+        about the user or its places are deleted first, as only their links
+        would cascade. The places and users it reviewed are then recounted.
+        '''
+        with db.atomic():
+            places = ReviewPlace.reviewed_by(user_id)
+            users = ReviewUser.reviewed_by(user_id)
+            ReviewUser.delete_reviews([user_id])
+            ReviewPlace.delete_reviews(Place.select(Place.id).where(Place.owner == user_id))
+            delete_user = User.delete().where(User.id == user_id)
+            if not delete_user.execute():
+                raise LookupError('user_id')
+            if places:
+                ReviewPlace.recount(Place.id << places)
+            if users:
+                ReviewUser.recount(User.id << users)
+        invalidate('place_amenities')
         response = {}
         response['code'] = 200
         response['msg'] = "User account was deleted"
@@ -380,3 +477,92 @@ def delete_user(user_id):
         abort(404)
     except Exception as error:
         abort(500)
+
+@app.route('/login', methods=['POST'])
+@as_json
+def login():
+    """
+    Log a user in
+    Verify the credentials of a user, given in the form or as Basic authorization, and issue a token.
+    The token is sent back as a Bearer Authorization header.
+    ---
+    tags:
+        - User
+    parameters:
+        -
+            name: email
+            in: form
+            type: string
+            description: Email of the user
+        -
+            name: password
+            in: form
+            type: string
+            description: Password of the user
+    responses:
+        200:
+            description: Credentials are valid, the user is returned with a token in its token field
+            schema:
+                $ref: '#/definitions/get_user_get_User'
+        400:
+            description: Issue with login request
+        401:
+            description: Email or password is wrong
+        500:
+            description: The request was not able to be processed
+    """
+    try:
+        if request.authorization is not None:
+            user = basic_user(request)
+        else:
+            data = LOGIN_SCHEMA.validate(request.form)
+            user = authenticate(data['email'], data['password'])
+        if user is None:
+            res = {}
+            res['code'] = 401
+            res['msg'] = 'Invalid email or password'
+            return res, 401
+        data = user.to_dict()
+        data['token'] = issue_token(user)
+        return data, 200
+    except KeyError as e:
+        res = {}
+        res['code'] = 40000
+        res['msg'] = 'Missing parameters'
+        return res, 400
+    except TypeError as e:
+        res = {}
+        res['code'] = 400
+        res['msg'] = e.message
+        return res, 400
+    except Exception as e:
+        abort(500)
+
+@app.route('/logout', methods=['POST'])
+@as_json
+def logout():
+    """
+    Log a user out
+    Revoke the Bearer token of the request.
+    ---
+    tags:
+        - User
+    responses:
+        200:
+            description: Token was revoked
+            schema:
+                $ref: '#/definitions/delete_amenity_delete_delete_200'
+        401:
+            description: No valid token was given
+    """
+    token = bearer_token(request)
+    if token is None:
+        res = {}
+        res['code'] = 401
+        res['msg'] = 'Authentication required'
+        return res, 401
+    revoke_token(token)
+    res = {}
+    res['code'] = 200
+    res['msg'] = 'Token was revoked'
+    return res, 200
@@ -0,0 +1,287 @@
+''' Seeds realistic volumes through the models and measures the API hot paths
+
+Usage: python benchmark.py [--scale 1.0] [--requests 200] [--output results.json] [--reuse]
+
+    AIRBNB_ENV=test AIRBNB_DATABASE_ENGINE=sqlite AIRBNB_DATABASE_PATH=/tmp/bench.db python benchmark.py
+
+At scale 1 the database holds 50 states, 1000 cities, 10k users, 100k places,
+1M bookings and 300k reviews. The tables of the configured database are
+dropped and seeded again unless --reuse is given, so only point it at a
+local SQLite file or a local MySQL stand-in. Requests go through
+app.test_client(), and each scenario reports its latency percentiles and the
+number of queries per request as JSON, to be kept and compared over time.
+'''
+from os import environ
+from datetime import datetime, timedelta
+from time import time
+import subprocess
+import argparse
+import random
+import json
+import sys
+
+if environ.get('AIRBNB_ENV') == 'production':
+    sys.exit('benchmark.py drops and seeds its tables, it does not run in production')
+
+from app import app
+from app.models.base import db
+from app.models.state import State
+from app.models.city import City
+from app.models.user import User
+from app.models.place import Place
+from app.models.place_book import PlaceBook
+from app.models.amenity import Amenity
+from app.models.place_amenity import PlaceAmenities
+from app.models.review import Review
+from app.models.review_place import ReviewPlace
+from app.models.review_user import ReviewUser
+from app.models import geo
+from app.views.return_styles import ListStyle
+from config import DATABASE, CACHE
+
+MODELS = [User, State, City, Place, Amenity, PlaceBook, PlaceAmenities, Review, ReviewPlace, ReviewUser]
+SEED = 20160811
+FIRST_NIGHT = datetime(2016, 1, 1)
+
+''' Rows seeded at scale 1 '''
+VOLUMES = {
+    'states': 50,
+    'cities': 1000,
+    'users': 10000,
+    'places': 100000,
+    'bookings': 1000000,
+    'place_reviews': 200000,
+    'user_reviews': 100000
+}
+
+def batches(rows, columns):
+    ''' Splits the rows so one INSERT stays below the 999 variables of SQLite '''
+    size = max(1, 999 // columns) if DATABASE['engine'] == 'sqlite' else 1000
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def insert(model, rows):
+    ''' Inserts the rows in multi-row INSERTs, returns their ids for the BaseModel tables '''
+    ids = []
+    if not rows:
+        return ids
+    with db.atomic():
+        for batch in batches(rows, len(rows[0]) + 2):
+            if hasattr(model, 'insert_rows'):
+                ids.extend(model.insert_rows(batch))
+            else:
+                model.insert_many(batch).execute()
+    return ids
+
+def seed(scale, rng):
+    ''' Drops the tables and seeds them, returns the number of rows by table '''
+    counts = dict((key, max(1, int(value * scale))) for key, value in VOLUMES.items())
+    db.drop_tables(MODELS, safe=True)
+    db.create_tables(MODELS, safe=True)
+
+    password = User.hash_password('benchmark')
+    states = insert(State, [{'name': 'State %d' % i} for i in range(counts['states'])])
+    cities = insert(City, [{'name': 'City %d' % i, 'state': rng.choice(states)} for i in range(counts['cities'])])
+    users = insert(User, [{
+        'email': 'user%d@benchmark.com' % i,
+        'password': password,
+        'first_name': 'First %d' % i,
+        'last_name': 'Last %d' % i
+    } for i in range(counts['users'])])
+
+    places = []
+    for start in range(0, counts['places'], 10000):
+        rows = []
+        for i in range(start, min(start + 10000, counts['places'])):
+            latitude, longitude = rng.uniform(25, 49), rng.uniform(-124, -67)
+            rows.append({
+                'owner': rng.choice(users),
+                'city': rng.choice(cities),
+                'name': 'Place %d' % i,
+                'description': 'A place to stay',
+                'number_rooms': rng.randint(1, 6),
+                'number_bathrooms': rng.randint(1, 4),
+                'max_guest': rng.randint(1, 12),
+                'price_by_night': rng.randint(20, 500),
+                'latitude': latitude,
+                'longitude': longitude,
+                'geohash': geo.encode(latitude, longitude)
+            })
+        places.extend(insert(Place, rows))
+
+    ''' Bookings of a place sit in their own 30 day slots so they never overlap '''
+    per_place = max(1, counts['bookings'] // len(places))
+    for start in range(0, len(places), 2000):
+        rows = []
+        for place_id in places[start:start + 2000]:
+            for slot in range(per_place):
+                date_start = FIRST_NIGHT + timedelta(days=slot * 30 + rng.randint(0, 20))
+                number_nights = rng.randint(1, 7)
+                rows.append({
+                    'place': place_id,
+                    'user': rng.choice(users),
+                    'is_validated': rng.random() < 0.8,
+                    'date_start': date_start,
+                    'number_nights': number_nights,
+                    'date_end': PlaceBook.end_date(date_start, number_nights)
+                })
+        insert(PlaceBook, rows)
+
+    for key, link, field, targets in [('place_reviews', ReviewPlace, 'place', places), ('user_reviews', ReviewUser, 'user', users)]:
+        for start in range(0, counts[key], 10000):
+            number = min(10000, counts[key] - start)
+            rows = [{'message': 'A review', 'stars': rng.randint(1, 5), 'user': rng.choice(users)} for i in range(number)]
+            ids = insert(Review, rows)
+            insert(link, [{field: rng.choice(targets), 'review': review_id} for review_id in ids])
+    ReviewPlace.recount()
+    ReviewUser.recount()
+    return dict((model._meta.db_table, model.select().count()) for model in MODELS)
+
+class QueryCounter:
+    ''' Counts the statements sent to the database while installed '''
+    def __init__(self):
+        self.count = 0
+        self.execute_sql = db.execute_sql
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+        return self.execute_sql(*args, **kwargs)
+
+    def __enter__(self):
+        db.execute_sql = self
+        return self
+
+    def __exit__(self, *args):
+        del db.execute_sql
+
+def scenarios(ids, rng):
+    ''' Returns the scenarios by name, each builds the method, url and form of one request '''
+    places, users, cities = ids['place'], ids['user'], ids['city']
+    future = [FIRST_NIGHT + timedelta(days=3650)]
+
+    def booking():
+        future[0] += timedelta(days=1)
+        return 'post', '/places/%d/books' % rng.choice(places), {
+            'user_id': rng.choice(users),
+            'date_start': future[0].strftime('%Y/%m/%d %H:%M:%S'),
+            'number_nights': 1
+        }
+
+    def availability():
+        date = FIRST_NIGHT + timedelta(days=rng.randint(0, 300))
+        return 'post', '/places/%d/available' % rng.choice(places), {'year': date.year, 'month': date.month, 'day': date.day}
+
+    def city_availability():
+        date = FIRST_NIGHT + timedelta(days=rng.randint(0, 300))
+        return 'post', '/places/available', {
+            'city_id': rng.choice(cities),
+            'date_start': date.strftime('%Y/%m/%d %H:%M:%S'),
+            'number_nights': rng.randint(1, 7)
+        }
+
+    return [
+        ('places_page', lambda: ('get', '/places?page=%d&number=10' % rng.randint(1, 100), None)),
+        ('places_deep_page', lambda: ('get', '/places?page=%d&number=10' % rng.randint(1, max(1, len(places) // 10)), None)),
+        ('places_cursor', lambda: ('get', '/places?number=10&after=' + ListStyle.encode_cursor(rng.choice(places)), None)),
+        ('places_filtered', lambda: ('get', '/places?min_price=100&max_price=200&min_guest=4&sort=price_by_night', None)),
+        ('place_get', lambda: ('get', '/places/%d' % rng.choice(places), None)),
+        ('place_availability', availability),
+        ('city_availability', city_availability),
+        ('booking_create', booking),
+        ('place_reviews', lambda: ('get', '/places/%d/reviews' % rng.choice(places), None)),
+        ('user_reviews', lambda: ('get', '/users/%d/reviews' % rng.choice(users), None))
+    ]
+
+def percentile(values, percent):
+    ''' Returns the value under which the given percent of the sorted values fall '''
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+def measure(client, build, requests, warmup):
+    ''' Sends the requests of a scenario, returns its latencies in ms, queries and statuses '''
+    latencies, queries, statuses = [], [], {}
+    for index in range(warmup + requests):
+        method, url, form = build()
+        with QueryCounter() as counter:
+            start = time()
+            rv = getattr(client, method)(url, data=form)
+            elapsed = (time() - start) * 1000
+        if index < warmup:
+            continue
+        latencies.append(elapsed)
+        queries.append(counter.count)
+        statuses[str(rv.status_code)] = statuses.get(str(rv.status_code), 0) + 1
+    latencies.sort()
+    return {
+        'requests': requests,
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(latencies[-1], 3),
+        'queries_mean': round(float(sum(queries)) / len(queries), 2),
+        'queries_max': max(queries),
+        'statuses': statuses
+    }
+
+def revision():
+    ''' Returns the git commit of the tree, None outside of a checkout '''
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT).strip()
+    except Exception:
+        return None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the API hot paths on seeded data')
+    parser.add_argument('--scale', type=float, default=1.0, help='fraction of the seeded volumes')
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per scenario')
+    parser.add_argument('--warmup', type=int, default=20, help='untimed requests before each scenario')
+    parser.add_argument('--only', action='append', help='scenario to run, may be repeated')
+    parser.add_argument('--output', help='file the JSON results are written to, stdout if omitted')
+    parser.add_argument('--reuse', action='store_true', help='keep the seeded tables of a previous run')
+    args = parser.parse_args()
+
+    rng = random.Random(SEED)
+    db.connect()
+    start = time()
+    if args.reuse:
+        rows = dict((model._meta.db_table, model.select().count()) for model in MODELS)
+    else:
+        rows = seed(args.scale, rng)
+    seconds = round(time() - start, 1)
+
+    ids = {}
+    for model, key in [(Place, 'place'), (User, 'user'), (City, 'city')]:
+        ids[key] = [row[0] for row in model.select(model.id).tuples()]
+    rng = random.Random(SEED)
+    client = app.test_client()
+    results = []
+    for name, build in scenarios(ids, rng):
+        if args.only and not name in args.only:
+            continue
+        result = measure(client, build, args.requests, args.warmup)
+        result['scenario'] = name
+        results.append(result)
+        sys.stderr.write('%-20s p50 %8.2f ms  p99 %8.2f ms  %5.1f queries\n' % (name, result['p50_ms'], result['p99_ms'], result['queries_mean']))
+    db.close()
+
+    report = {
+        'meta': {
+            'date': datetime.now().strftime('%Y/%m/%d %H:%M:%S'),
+            'revision': revision(),
+            'engine': DATABASE['engine'],
+            'python': sys.version.split()[0],
+            'scale': args.scale,
+            'seed': SEED,
+            'seed_seconds': None if args.reuse else seconds,
+            'cache_ttl': CACHE['ttl'],
+            'rows': rows
+        },
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    else:
+        print json.dumps(report, indent=2, sort_keys=True)
@@ -3,9 +3,36 @@ from os import environ
 '''script  to define some variables of your RestAPI application depending of the environment variable AIRBNB_ENV'''
 
 DATABASE = {}
+''' mysql, or sqlite for a local stand-in stored in the file at path '''
+DATABASE['engine'] = environ.get('AIRBNB_DATABASE_ENGINE', 'mysql')
+DATABASE['path'] = environ.get('AIRBNB_DATABASE_PATH', 'airbnb.db')
 DATABASE['host'] = environ.get('AIRBNB_HOST')
 DATABASE['port'] = 3306
 DATABASE['charset'] = 'utf8'
+''' Connection pool size and seconds before an idle pooled connection is recycled '''
+DATABASE['max_connections'] = int(environ.get('AIRBNB_DATABASE_POOL_SIZE', 20))
+DATABASE['stale_timeout'] = int(environ.get('AIRBNB_DATABASE_STALE_TIMEOUT', 300))
+
+''' Entries and seconds to live of the response cache, a ttl of 0 disables it '''
+CACHE = {}
+CACHE['size'] = int(environ.get('AIRBNB_CACHE_SIZE', 1024))
+CACHE['ttl'] = int(environ.get('AIRBNB_CACHE_TTL', 60))
+''' Seconds a change waits before the change feeds return it, longer than any write transaction '''
+CHANGES = {}
+CHANGES['lag'] = int(environ.get('AIRBNB_CHANGES_LAG', 5))
+''' Password hashing algorithm and work factor, hashing threads of gevent workers and verified credentials cache '''
+PASSWORD = {}
+PASSWORD['algorithm'] = environ.get('AIRBNB_PASSWORD_ALGORITHM', 'pbkdf2_sha256')
+PASSWORD['iterations'] = int(environ.get('AIRBNB_PASSWORD_ITERATIONS', 100000))
+PASSWORD['threads'] = int(environ.get('AIRBNB_PASSWORD_THREADS', 4))
+PASSWORD['cache_size'] = int(environ.get('AIRBNB_PASSWORD_CACHE_SIZE', 1024))
+PASSWORD['cache_ttl'] = int(environ.get('AIRBNB_PASSWORD_CACHE_TTL', 300))
+''' Token signing key and lifetime in seconds, revoked tokens kept and admin checks on the gated endpoints '''
+AUTH = {}
+AUTH['secret'] = environ.get('AIRBNB_SECRET_KEY', 'airbnb_clone_development_key')
+AUTH['max_age'] = int(environ.get('AIRBNB_TOKEN_MAX_AGE', 86400))
+AUTH['deny_size'] = int(environ.get('AIRBNB_TOKEN_DENY_SIZE', 4096))
+AUTH['required'] = environ.get('AIRBNB_AUTH_REQUIRED', '0') == '1'
 if environ.get('AIRBNB_ENV') == 'production':
     ''' Production specific variables '''
     DEBUG = False
@@ -14,11 +41,14 @@ if environ.get('AIRBNB_ENV') == 'production':
     DATABASE['user'] = 'airbnb_user_prod'
     DATABASE['database'] = 'airbnb_prod'
     DATABASE['password'] = environ.get('AIRBNB_DATABASE_PWD_PROD')
+    AUTH['secret'] = environ.get('AIRBNB_SECRET_KEY')
 elif environ.get('AIRBNB_ENV') == 'test':
     ''' Test specific variables '''
     DEBUG = False
     HOST = 'localhost'
     PORT = 5555
+    CACHE['ttl'] = int(environ.get('AIRBNB_CACHE_TTL', 0))
+    PASSWORD['iterations'] = int(environ.get('AIRBNB_PASSWORD_ITERATIONS', 1000))
     DATABASE['user'] = 'airbnb_user_test'
     DATABASE['database'] = 'airbnb_test'
     DATABASE['password'] = environ.get('AIRBNB_DATABASE_PWD_TEST')
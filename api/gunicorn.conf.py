@@ -1,4 +1,6 @@
 # Sample Gunicorn configuration file.
+from os import environ
+import multiprocessing
 
 #
 # Server socket
@@ -70,9 +72,24 @@ backlog = 2048
 #       A positive integer. Generally set in the 1-5 seconds range.
 #
 
-workers = 1
-worker_class = 'sync'
-worker_connections = 1000
+#   The production profile sizes workers from the CPU count and can be
+#   tuned without editing this file:
+#
+#       AIRBNB_WORKERS              number of workers (2 x cores + 1)
+#       AIRBNB_WORKER_CLASS         sync, gevent or eventlet (sync), the
+#                                   last two need their package installed
+#       AIRBNB_WORKER_CONNECTIONS   clients per gevent/eventlet worker (1000)
+#
+#   PyMySQL is pure Python, so the gevent and eventlet workers make its
+#   sockets cooperative and one worker serves many requests at once. The
+#   peewee pool keeps one connection per greenlet, so give each worker a
+#   pool (AIRBNB_DATABASE_POOL_SIZE) as large as the requests it serves
+#   concurrently, within the max_connections of the MySQL server.
+#
+
+workers = int(environ.get('AIRBNB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = environ.get('AIRBNB_WORKER_CLASS', 'sync')
+worker_connections = int(environ.get('AIRBNB_WORKER_CONNECTIONS', 1000))
 timeout = 30
 keepalive = 2
 
@@ -185,6 +202,13 @@ proc_name = None
 def post_fork(server, worker):
     server.log.info("Worker spawned (pid: %s)", worker.pid)
 
+    ''' Connections opened by a preloaded master must not be shared with workers '''
+    import sys
+    if 'app.models.base' in sys.modules:
+        db = sys.modules['app.models.base'].db
+        if hasattr(db, 'close_all'):
+            db.close_all()
+
 def pre_fork(server, worker):
     pass
 
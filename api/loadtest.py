@@ -0,0 +1,63 @@
+''' Measures the throughput of a running API at growing concurrency
+
+Usage: python loadtest.py [url] [requests] [concurrency ...]
+
+    python loadtest.py http://localhost:3000/places 2000 1 4 16 64
+
+Run it against gunicorn started with different AIRBNB_WORKERS and
+AIRBNB_WORKER_CLASS values to compare how each profile scales.
+'''
+from threading import Thread, Lock
+from time import time
+import urllib2
+import sys
+
+def run(url, requests, concurrency):
+    ''' Sends the requests from concurrent threads, returns the latencies and error count '''
+    latencies = []
+    errors = [0]
+    lock = Lock()
+    remaining = [requests]
+
+    def client():
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            start = time()
+            try:
+                urllib2.urlopen(url).read()
+                failed = False
+            except Exception:
+                failed = True
+            with lock:
+                latencies.append(time() - start)
+                if failed:
+                    errors[0] += 1
+
+    threads = [Thread(target=client) for i in range(concurrency)]
+    start = time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time() - start, sorted(latencies), errors[0]
+
+def percentile(latencies, percent):
+    ''' Returns the latency in milliseconds under which the given percent of requests were served '''
+    if not latencies:
+        return 0.0
+    index = min(len(latencies) - 1, int(len(latencies) * percent / 100.0))
+    return latencies[index] * 1000
+
+if __name__ == '__main__':
+    url = sys.argv[1] if len(sys.argv) > 1 else 'http://localhost:3000/places'
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    levels = [int(level) for level in sys.argv[3:]] or [1, 4, 16, 64]
+
+    print '%-12s %10s %10s %10s %8s' % ('concurrency', 'req/s', 'p50 ms', 'p99 ms', 'errors')
+    for concurrency in levels:
+        elapsed, latencies, errors = run(url, requests, concurrency)
+        print '%-12d %10.1f %10.1f %10.1f %8d' % (concurrency, requests / elapsed,
+            percentile(latencies, 50), percentile(latencies, 99), errors)
@@ -9,8 +9,64 @@ from app.models.place_amenity import PlaceAmenities
 from app.models.review import Review
 from app.models.review_place import ReviewPlace
 from app.models.review_user import ReviewUser
+from app.models import geo
+from playhouse.migrate import MySQLMigrator, migrate
+from peewee import CharField, DateTimeField, IntegerField, ForeignKeyField, SQL, fn
 
 ''' Initializes each table in the database '''
 db.connect()
 db.create_tables([User,State,City,Place,Amenity,PlaceBook,PlaceAmenities,Review,ReviewPlace,ReviewUser], safe=True)
+
+''' Adds the columns introduced after the tables were first created '''
+migrator = MySQLMigrator(db)
+columns = [column.name for column in db.get_columns('placebook')]
+if not 'date_end' in columns:
+    migrate(
+        migrator.add_column('placebook', 'date_end', DateTimeField(null=True)),
+        migrator.add_index('placebook', ('place_id', 'date_start', 'date_end'), False)
+    )
+    PlaceBook.update(date_end=SQL('DATE(date_start) + INTERVAL number_nights DAY')).execute()
+    migrate(migrator.add_not_null('placebook', 'date_end'))
+''' Overlap checks only read the bookings of the last MAX_NIGHTS days, a longer one would be missed '''
+if PlaceBook.select(fn.MAX(PlaceBook.number_nights)).order_by().scalar() > PlaceBook.MAX_NIGHTS:
+    raise SystemExit('placebook holds bookings longer than %d nights, shorten them before serving' % PlaceBook.MAX_NIGHTS)
+columns = [column.name for column in db.get_columns('place')]
+if not 'geohash' in columns:
+    migrate(
+        migrator.add_column('place', 'geohash', CharField(max_length=12, null=True)),
+        migrator.add_index('place', ('geohash',), False)
+    )
+    for place in Place.select(Place.id, Place.latitude, Place.longitude):
+        geohash = geo.encode(place.latitude, place.longitude)
+        Place.update(geohash=geohash).where(Place.id == place.id).execute()
+for table, link in [('place', ReviewPlace), ('user', ReviewUser)]:
+    columns = [column.name for column in db.get_columns(table)]
+    if not 'review_count' in columns:
+        migrate(
+            migrator.add_column(table, 'review_count', IntegerField(default=0)),
+            migrator.add_column(table, 'review_stars', IntegerField(default=0))
+        )
+        link.recount()
+indexes = [index.name for index in db.get_indexes('place')]
+for columns in [('city_id', 'price_by_night'), ('city_id', 'max_guest')]:
+    if not 'place_' + '_'.join(columns) in indexes:
+        migrate(migrator.add_index('place', columns, False))
+for table in ['user', 'state', 'city', 'place', 'amenity', 'placebook', 'review']:
+    indexes = [index.name for index in db.get_indexes(table)]
+    for column in ['created_at', 'updated_at']:
+        if not table + '_' + column in indexes:
+            migrate(migrator.add_index(table, (column,), False))
+''' Recreates the foreign keys that do not cascade deletes yet '''
+for model in [City, Place, PlaceBook, PlaceAmenities, Review, ReviewPlace, ReviewUser]:
+    table = model._meta.db_table
+    for field in model._meta.sorted_fields:
+        if not isinstance(field, ForeignKeyField) or field.on_delete != 'CASCADE':
+            continue
+        constraint = migrator.get_foreign_key_constraint(table, field.db_column)
+        cursor = db.execute_sql('SELECT delete_rule FROM information_schema.referential_constraints '
+                                'WHERE constraint_schema = DATABASE() AND constraint_name = %s', (constraint,))
+        if cursor.fetchone()[0] != 'CASCADE':
+            migrate(migrator.drop_foreign_key_constraint(table, field.db_column))
+            db.execute_sql('ALTER TABLE `%s` ADD CONSTRAINT `%s` FOREIGN KEY (`%s`) REFERENCES `%s` (`%s`) ON DELETE CASCADE' %
+                           (table, constraint, field.db_column, field.rel_model._meta.db_table, field.to_field.db_column))
 db.close()
@@ -220,5 +220,34 @@ class AppTestCase(unittest.TestCase):
         data = json.loads(rv.data)['data']
         self.assertEqual(len(data), 0)
 
+    def test_create_place_amenities(self):
+        ''' Set base data '''
+        rv = self.app.post('/states', data=good_state_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/states/1/cities', data=good_city_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/users', data=good_user_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/places', data=good_place_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/amenities', data=good_amenity_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/amenities', data=good_amenity_2)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/places/1/amenities/1')
+        self.assertEqual(rv.status_code, 201)
+
+        ''' Test if place does not exist '''
+        rv = self.app.post('/places/404/amenities', data=json.dumps([2]), content_type='application/json')
+        self.assertEqual(rv.status_code, 404)
+
+        ''' Test per item results '''
+        rv = self.app.post('/places/1/amenities', data=json.dumps([2, 1, 404, 'nope', 2]), content_type='application/json')
+        self.assertEqual(rv.status_code, 200)
+        data = json.loads(rv.data)['data']
+        self.assertEqual([item['code'] for item in data], [201, 400, 404, 400, 400])
+        rv = self.app.get('/places/1/amenities')
+        self.assertEqual(len(json.loads(rv.data)['data']), 2)
+
 if __name__ == '__main__':
     unittest.main()
@@ -3,6 +3,10 @@ from app import app
 from app.models.base import db
 from app.models.city import City
 from app.models.state import State
+from app.models.user import User
+from app.models.place import Place
+from app.models.review import Review
+from app.models.review_place import ReviewPlace
 
 ''' Import test data '''
 from city_data import *
@@ -17,12 +21,12 @@ class AppTestCase(unittest.TestCase):
 
     def setUp(self):
         db.connect()
-        db.create_tables([City, State], safe=True)
+        db.create_tables([City, State, User, Place, Review, ReviewPlace], safe=True)
         logging.disable(logging.CRITICAL)
         self.app = app.test_client()
 
     def tearDown(self):
-        db.drop_tables([City, State])
+        db.drop_tables([City, State, User, Place, Review, ReviewPlace])
         db.close()
 
     def test_create(self):
@@ -6,6 +6,8 @@ from app.models.user import User
 from app.models.state import State
 from app.models.city import City
 from app.models.place_book import PlaceBook
+from app.models.review import Review
+from app.models.review_place import ReviewPlace
 
 ''' Import test data '''
 from place_data import *
@@ -25,12 +27,12 @@ class AppTestCase(unittest.TestCase):
 
     def setUp(self):
         db.connect()
-        db.create_tables([Place, User, State, City, PlaceBook])
+        db.create_tables([Place, User, State, City, PlaceBook, Review, ReviewPlace])
         logging.disable(logging.CRITICAL)
         self.app = app.test_client()
 
     def tearDown(self):
-        db.drop_tables([Place, User, State, City, PlaceBook])
+        db.drop_tables([Place, User, State, City, PlaceBook, Review, ReviewPlace])
         db.close()
 
     def test_create(self):
@@ -104,6 +106,19 @@ class AppTestCase(unittest.TestCase):
         rv = self.app.post('/places', data=bad_place_13)
         self.assertEqual(rv.status_code, 400)
 
+        ''' Test if a coordinate is not a finite number '''
+        for value in ['nan', 'inf', '-Infinity']:
+            rv = self.app.post('/places', data=dict(good_place_1, latitude=value))
+            self.assertEqual(rv.status_code, 400)
+            rv = self.app.post('/places', data=dict(good_place_1, longitude=value))
+            self.assertEqual(rv.status_code, 400)
+
+        ''' Test that zero is kept for the numeric fields '''
+        rv = self.app.post('/places', data=dict(good_place_1, latitude=0, longitude=0, number_rooms=0))
+        self.assertEqual(rv.status_code, 201)
+        data = json.loads(self.app.get('/places/%d' % json.loads(rv.data)['id']).data)
+        self.assertEqual((data['latitude'], data['longitude'], data['number_rooms']), (0, 0, 0))
+
         ''' Test if owner_id does not exist '''
         rv = self.app.post('/places', data=bad_place_14)
         self.assertEqual(rv.status_code, 404)
@@ -230,6 +245,16 @@ class AppTestCase(unittest.TestCase):
         rv = self.app.put('/places/1', data={'longitude': 'nope'})
         self.assertEqual(rv.status_code, 400)
 
+        ''' Test out of range updates '''
+        rv = self.app.put('/places/1', data={'latitude': 91.5})
+        self.assertEqual(rv.status_code, 400)
+        rv = self.app.put('/places/1', data={'max_guest': -1})
+        self.assertEqual(rv.status_code, 400)
+        rv = self.app.put('/places/1', data={'latitude': 'nan'})
+        self.assertEqual(rv.status_code, 400)
+        rv = self.app.put('/places/1', data={'longitude': 'inf'})
+        self.assertEqual(rv.status_code, 400)
+
         ''' Test valid data type updates '''
         rv = self.app.put('/places/1', data={'name': 'This is the next best place after the other'})
         self.assertEqual(rv.status_code, 200)
@@ -263,6 +288,11 @@ class AppTestCase(unittest.TestCase):
         self.assertNotEqual(data['latitude'], good_place_1['latitude'])
         self.assertNotEqual(data['longitude'], good_place_1['longitude'])
 
+        ''' Test that moving the place keeps its geohash in sync '''
+        rv = self.app.put('/places/1', data={'latitude': 37.7749, 'longitude': -122.4194})
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(Place.get(Place.id == 1).geohash[:5], '9q8yy')
+
     def test_create_by_city(self):
         ''' Set base data '''
         rv = self.app.post('/states', data=good_state_1)
@@ -279,6 +309,8 @@ class AppTestCase(unittest.TestCase):
         self.assertEqual(rv.status_code, 201)
         data = json.loads(rv.data)
         self.assertEqual(data['id'], 1)
+        rv = self.app.post('/states/1/cities/1/places', data=dict(good_place_by_city_1, latitude=0, longitude=0))
+        self.assertEqual(rv.status_code, 201)
 
         ''' Test if owner_id is missing '''
         rv = self.app.post('/states/1/cities/1/places', data=bad_place_1)
@@ -467,7 +499,168 @@ class AppTestCase(unittest.TestCase):
         data = json.loads(rv.data)
         self.assertEqual(data['available'], True)
 
+    def test_places_availability(self):
+        ''' Set base data '''
+        rv = self.app.post('/users', data=good_user_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/users', data=good_user_2)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/states', data=good_state_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/states/1/cities', data=good_city_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/places', data=good_place_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/places', data=good_place_2)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/places/1/books', data=good_place_book_1)
+        self.assertEqual(rv.status_code, 201)
+        date_start = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
+
+        ''' Test missing required values '''
+        rv = self.app.post('/places/available', data={'date_start': date_start})
+        self.assertEqual(rv.status_code, 400)
+        rv = self.app.post('/places/available', data={'place_id': 1})
+        self.assertEqual(rv.status_code, 400)
+
+        ''' Test invalid value types '''
+        rv = self.app.post('/places/available', data={'place_id': 'nope', 'date_start': date_start})
+        self.assertEqual(rv.status_code, 400)
+        rv = self.app.post('/places/available', data={'place_id': 1, 'date_start': '2016/07/24'})
+        self.assertEqual(rv.status_code, 400)
+
+        ''' Test availability by place ids, city and state '''
+        for data in [{'place_id': [1, 2]}, {'city_id': 1}, {'state_id': 1}]:
+            data['date_start'] = date_start
+            rv = self.app.post('/places/available', data=data)
+            self.assertEqual(rv.status_code, 200)
+            data = json.loads(rv.data)['data']
+            self.assertEqual(len(data), 2)
+            self.assertEqual(data[0], {'place_id': 1, 'available': False})
+            self.assertEqual(data[1], {'place_id': 2, 'available': True})
+
+        ''' Test a date range after the booking '''
+        future = datetime.now() + timedelta(days=20)
+        rv = self.app.post('/places/available', data={'place_id': 1, 'date_start': future.strftime("%Y/%m/%d %H:%M:%S"), 'number_nights': 3})
+        self.assertEqual(rv.status_code, 200)
+        data = json.loads(rv.data)['data']
+        self.assertEqual(data, [{'place_id': 1, 'available': True}])
+
+    def test_list_filters(self):
+        ''' Set base data '''
+        rv = self.app.post('/users', data=good_user_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/states', data=good_state_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/states/1/cities', data=good_city_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/places', data=good_place_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/places', data=good_place_2)
+        self.assertEqual(rv.status_code, 201)
+
+        ''' Test invalid filters and sorts '''
+        rv = self.app.get('/places?min_price=nope')
+        self.assertEqual(rv.status_code, 400)
+        rv = self.app.get('/places?sort=name')
+        self.assertEqual(rv.status_code, 400)
+
+        ''' Test filters on every place list '''
+        for url in ['/places', '/states/1/places', '/states/1/cities/1/places']:
+            rv = self.app.get(url + '?max_price=120')
+            self.assertEqual(rv.status_code, 200)
+            data = json.loads(rv.data)['data']
+            self.assertEqual(len(data), 1)
+            self.assertEqual(data[0]['id'], 2)
+            rv = self.app.get(url + '?min_guest=5&min_rooms=3')
+            self.assertEqual(rv.status_code, 200)
+            data = json.loads(rv.data)['data']
+            self.assertEqual(len(data), 1)
+            self.assertEqual(data[0]['id'], 1)
+
+        ''' Test sorting by price '''
+        rv = self.app.get('/places?sort=price_by_night')
+        data = json.loads(rv.data)['data']
+        self.assertEqual([place['id'] for place in data], [2, 1])
+        rv = self.app.get('/places?sort=-price_by_night')
+        data = json.loads(rv.data)['data']
+        self.assertEqual([place['id'] for place in data], [1, 2])
+
+    def test_search(self):
+        ''' Set base data '''
+        rv = self.app.post('/users', data=good_user_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/states', data=good_state_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/states/1/cities', data=good_city_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/places', data=good_place_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/places', data=good_place_2)
+        self.assertEqual(rv.status_code, 201)
+
+        ''' Test missing required values '''
+        rv = self.app.get('/places/search?lat=37.79&lng=-122.4')
+        self.assertEqual(rv.status_code, 400)
+
+        ''' Test invalid values '''
+        rv = self.app.get('/places/search?lat=91&lng=-122.4&radius=1')
+        self.assertEqual(rv.status_code, 400)
+        rv = self.app.get('/places/search?lat=37.79&lng=-122.4&radius=nope')
+        self.assertEqual(rv.status_code, 400)
+
+        ''' Test places within the radius '''
+        rv = self.app.get('/places/search?lat=37.79&lng=-122.4&radius=1')
+        self.assertEqual(rv.status_code, 200)
+        data = json.loads(rv.data)['data']
+        self.assertEqual(len(data), 2)
+        self.assertLess(data[0]['distance'], 1)
 
+        ''' Test places outside the radius '''
+        rv = self.app.get('/places/search?lat=34.05&lng=-118.24&radius=10')
+        self.assertEqual(rv.status_code, 200)
+        data = json.loads(rv.data)['data']
+        self.assertEqual(len(data), 0)
+
+    def test_create_bulk(self):
+        ''' Set base data '''
+        rv = self.app.post('/users', data=good_user_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/states', data=good_state_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/states/1/cities', data=good_city_1)
+        self.assertEqual(rv.status_code, 201)
+
+        ''' Test a body that is not an array '''
+        rv = self.app.post('/places/bulk', data=json.dumps(good_place_1), content_type='application/json')
+        self.assertEqual(rv.status_code, 400)
+
+        ''' Create valid places '''
+        rv = self.app.post('/places/bulk', data=json.dumps([good_place_1, good_place_2]), content_type='application/json')
+        self.assertEqual(rv.status_code, 201)
+        data = json.loads(rv.data)['data']
+        self.assertEqual([item['id'] for item in data], [1, 2])
+        rv = self.app.get('/places/2')
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(json.loads(rv.data)['name'], good_place_2['name'])
+        self.assertIsNotNone(Place.get(Place.id == 2).geohash)
+
+        ''' Test per item results of an invalid batch '''
+        missing = dict(good_place_1)
+        del missing['name']
+        invalid = dict(good_place_1, max_guest='nope')
+        no_city = dict(good_place_1, city_id=404)
+        rv = self.app.post('/places/bulk', data=json.dumps([missing, invalid, no_city, good_place_1]), content_type='application/json')
+        self.assertEqual(rv.status_code, 200)
+        data = json.loads(rv.data)['data']
+        self.assertEqual([item['code'] for item in data], [40000, 400, 404, 201])
+        self.assertEqual(data[3]['id'], 3)
+        self.assertEqual(Place.select().count(), 3)
+
+        ''' Test that a required coordinate of 0 is a value, an empty one is missing '''
+        rv = self.app.post('/places/bulk', data=json.dumps([dict(good_place_1, latitude=0, longitude=0.0), dict(good_place_1, latitude='')]), content_type='application/json')
+        data = json.loads(rv.data)['data']
+        self.assertEqual([item['code'] for item in data], [201, 40000])
 
 if __name__ == '__main__':
     unittest.main()
@@ -105,6 +105,22 @@ class AppTestCase(unittest.TestCase):
         rv = self.app.post('/places/1/books', data=bad_place_book_11)
         self.assertEqual(rv.status_code, 410)
 
+        ''' Test that a booking can start the day the previous one ends '''
+        rv = self.app.post('/places/1/books', data=good_place_book_3)
+        self.assertEqual(rv.status_code, 201)
+
+        ''' Test that a booking is at most MAX_NIGHTS nights, and that one that long still blocks its last night '''
+        rv = self.app.post('/places/1/books', data=dict(good_place_book_1, number_nights=PlaceBook.MAX_NIGHTS + 1))
+        self.assertEqual(rv.status_code, 400)
+        start = datetime(2030, 1, 1, 14, 0, 0)
+        rv = self.app.post('/places/1/books', data=dict(good_place_book_1, date_start=start.strftime("%Y/%m/%d %H:%M:%S"), number_nights=PlaceBook.MAX_NIGHTS))
+        self.assertEqual(rv.status_code, 201)
+        last_night = start + timedelta(days=PlaceBook.MAX_NIGHTS - 1)
+        rv = self.app.post('/places/1/books', data=dict(good_place_book_1, date_start=last_night.strftime("%Y/%m/%d %H:%M:%S"), number_nights=1))
+        self.assertEqual(rv.status_code, 410)
+        rv = self.app.post('/places/1/books', data=dict(good_place_book_1, date_start=(last_night + timedelta(days=1)).strftime("%Y/%m/%d %H:%M:%S"), number_nights=1))
+        self.assertEqual(rv.status_code, 201)
+
     def test_list(self):
         ''' Set base data '''
         rv = self.app.post('/users', data=good_user_1)
@@ -253,11 +269,17 @@ class AppTestCase(unittest.TestCase):
         ''' Test if number_nights is an invalid type '''
         rv = self.app.put('/places/1/books/1', data={'number_nights': 'Nope'})
         self.assertEqual(rv.status_code, 400)
+        rv = self.app.put('/places/1/books/1', data={'number_nights': PlaceBook.MAX_NIGHTS + 1})
+        self.assertEqual(rv.status_code, 400)
 
         ''' Test updating is_validated '''
         rv = self.app.put('/places/1/books/1', data={'is_validated': True})
         self.assertEqual(rv.status_code, 200)
 
+        ''' Test that fields outside of the schema are ignored '''
+        rv = self.app.put('/places/1/books/1', data={'is_validated': True, 'place_id': 2, 'date_end': 'nope'})
+        self.assertEqual(rv.status_code, 200)
+
         ''' Test updating data_start '''
         rv = self.app.put('/places/1/books/1', data={'date_start': datetime.now().strftime("%Y/%m/%d %H:%M:%S")})
         self.assertEqual(rv.status_code, 200)
@@ -275,5 +297,43 @@ class AppTestCase(unittest.TestCase):
         self.assertNotEqual(data['date_start'], good_place_book_1['date_start'])
         self.assertNotEqual(data['number_nights'], good_place_book_1['number_nights'])
 
+        ''' Test that an update cannot overlap another booking '''
+        rv = self.app.put('/places/1/books/1', data={'number_nights': 2})
+        self.assertEqual(rv.status_code, 200)
+        rv = self.app.post('/places/1/books', data=good_place_book_3)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.put('/places/1/books/1', data={'number_nights': 3})
+        self.assertEqual(rv.status_code, 410)
+
+    def test_create_bulk(self):
+        ''' Set base data '''
+        rv = self.app.post('/users', data=good_user_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/users', data=good_user_2)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/states', data=good_state_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/states/1/cities', data=good_city_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/places', data=good_place_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/places/1/books', data=good_place_book_1)
+        self.assertEqual(rv.status_code, 201)
+
+        ''' Test if place does not exist '''
+        rv = self.app.post('/places/404/books/bulk', data=json.dumps([good_place_book_3]), content_type='application/json')
+        self.assertEqual(rv.status_code, 404)
+
+        ''' Test per item results, overlapping the place or the batch '''
+        items = [good_place_book_3, bad_place_book_1, bad_place_book_4, bad_place_book_9, good_place_book_3]
+        rv = self.app.post('/places/1/books/bulk', data=json.dumps(items), content_type='application/json')
+        self.assertEqual(rv.status_code, 200)
+        data = json.loads(rv.data)['data']
+        self.assertEqual([item['code'] for item in data], [201, 404, 400, 110000, 110000])
+        self.assertEqual(data[0]['id'], 2)
+        rv = self.app.get('/places/1/books/2')
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(PlaceBook.select().count(), 2)
+
 if __name__ == '__main__':
     unittest.main()
@@ -14,6 +14,15 @@ good_place_book_2 = {
 	'number_nights': 1
 }
 
+good_date_3 = datetime.now() + timedelta(days=2)
+
+good_place_book_3 = {
+	'user_id': 1,
+	'is_validated': False,
+	'date_start': good_date_3.strftime("%Y/%m/%d %H:%M:%S"),
+	'number_nights': 1
+}
+
 bad_place_book_1 = {
 	'user_id': 404,
 	'is_validated': True,
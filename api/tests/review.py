@@ -19,6 +19,7 @@ from user_data import good_user_1, good_user_2
 from place_data import good_place_1
 
 ''' Package import '''
+from datetime import datetime
 import unittest
 import json
 import logging
@@ -118,6 +119,17 @@ class AppTestCase(unittest.TestCase):
 		rv = self.app.get('/users/1/reviews')
 		data = json.loads(rv.data)['data']
 		self.assertEqual(len(data), 1)
+		self.assertEqual((data[0]['fromuserid'], data[0]['touserid'], data[0]['toplaceid']), (1, 1, None))
+
+		''' Test that the joined reviews are serialized without queries '''
+		reviews = list(Review.select(Review, ReviewUser).join(ReviewUser).where(ReviewUser.user == 1))
+		def execute_sql(*args, **kwargs):
+			raise AssertionError('to_dict made a query')
+		db.execute_sql = execute_sql
+		try:
+			self.assertEqual(reviews[0].to_dict()['touserid'], 1)
+		finally:
+			del db.execute_sql
 
 	def test_get_user_review(self):
 		''' Set base data '''
@@ -226,6 +238,194 @@ class AppTestCase(unittest.TestCase):
 		rv = self.app.post('/places/1/reviews', data=bad_place_review_5)
 		self.assertEqual(rv.status_code, 400)
 
+	def test_place_review_aggregates(self):
+		''' Set base data '''
+		rv = self.app.post('/users', data=good_user_1)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/users', data=good_user_2)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/states', data=good_state_1)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/states/1/cities', data=good_city_1)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/places', data=good_place_1)
+		self.assertEqual(rv.status_code, 201)
+
+		''' Test that a place without reviews has no average '''
+		rv = self.app.get('/places/1')
+		data = json.loads(rv.data)
+		self.assertEqual(data['review_count'], 0)
+		self.assertIsNone(data['review_average'])
+
+		''' Test that creations add to the aggregates of the reviewed place and user '''
+		rv = self.app.post('/places/1/reviews', data=good_place_review_1)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/places/1/reviews', data=dict(good_place_review_2, stars=2))
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/users/2/reviews', data=good_review_1)
+		self.assertEqual(rv.status_code, 201)
+		data = json.loads(self.app.get('/places/1').data)
+		self.assertEqual((data['review_count'], data['review_stars'], data['review_average']), (2, 7, 3.5))
+		data = json.loads(self.app.get('/users/2').data)
+		self.assertEqual((data['review_count'], data['review_stars'], data['review_average']), (1, 5, 5.0))
+
+		''' Test that a deletion removes the review from the aggregates '''
+		rv = self.app.delete('/places/1/reviews/1')
+		self.assertEqual(rv.status_code, 200)
+		data = json.loads(self.app.get('/places/1').data)
+		self.assertEqual((data['review_count'], data['review_stars'], data['review_average']), (1, 2, 2.0))
+		rv = self.app.delete('/users/2/reviews/3')
+		self.assertEqual(rv.status_code, 200)
+		data = json.loads(self.app.get('/users/2').data)
+		self.assertEqual((data['review_count'], data['review_stars']), (0, 0))
+
+		''' Test that a review of another place is not deleted nor counted '''
+		rv = self.app.post('/places', data=good_place_1)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.delete('/places/2/reviews/2')
+		self.assertEqual(rv.status_code, 404)
+		data = json.loads(self.app.get('/places/2').data)
+		self.assertEqual((data['review_count'], data['review_stars']), (0, 0))
+		rv = self.app.get('/places/1/reviews/2')
+		self.assertEqual(rv.status_code, 200)
+
+		''' Test that a recount matches the stored aggregates '''
+		Place.update(review_count=0, review_stars=0).execute()
+		ReviewPlace.recount(Place.id == 1)
+		place = Place.get(Place.id == 1)
+		self.assertEqual((place.review_count, place.review_stars), (1, 2))
+
+	def test_create_bulk(self):
+		''' Set base data '''
+		rv = self.app.post('/users', data=good_user_1)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/users', data=good_user_2)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/states', data=good_state_1)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/states/1/cities', data=good_city_1)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/places', data=good_place_1)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/places/1/reviews', data=good_place_review_1)
+		self.assertEqual(rv.status_code, 201)
+
+		''' Test if place does not exist or the body is not an array '''
+		rv = self.app.post('/places/404/reviews/bulk', data=json.dumps([good_place_review_1]), content_type='application/json')
+		self.assertEqual(rv.status_code, 404)
+		rv = self.app.post('/places/1/reviews/bulk', data=json.dumps(good_place_review_1), content_type='application/json')
+		self.assertEqual(rv.status_code, 400)
+
+		''' Test per item results, the created reviews keep their order '''
+		items = [good_place_review_2, bad_place_review_1, dict(good_place_review_1, user_id=404), bad_place_review_5, dict(good_place_review_1, stars=3)]
+		rv = self.app.post('/places/1/reviews/bulk', data=json.dumps(items), content_type='application/json')
+		self.assertEqual(rv.status_code, 200)
+		data = json.loads(rv.data)['data']
+		self.assertEqual([item['code'] for item in data], [201, 40000, 404, 400, 201])
+		self.assertEqual(data[3]['msg'], 'stars is invalid')
+		rv = self.app.get('/places/1/reviews/%d' % data[0]['id'])
+		self.assertEqual(json.loads(rv.data)['fromuserid'], 2)
+		rv = self.app.get('/places/1/reviews/%d' % data[4]['id'])
+		self.assertEqual(json.loads(rv.data)['stars'], 3)
+
+		''' Test that the reviews are added to the aggregates of the place '''
+		data = json.loads(self.app.get('/places/1').data)
+		self.assertEqual((data['review_count'], data['review_stars']), (3, 8))
+		rv = self.app.post('/places/1/reviews/bulk', data=json.dumps([good_place_review_2]), content_type='application/json')
+		self.assertEqual(rv.status_code, 201)
+
+	def test_changes(self):
+		''' Set base data, a review of a user and one of a place '''
+		rv = self.app.post('/users', data=good_user_1)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/users', data=good_user_2)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/states', data=good_state_1)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/states/1/cities', data=good_city_1)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/places', data=good_place_1)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/users/2/reviews', data=good_review_1)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/places/1/reviews', data=good_place_review_2)
+		self.assertEqual(rv.status_code, 201)
+
+		''' Test that the feed tells the user or place of each review '''
+		Review.update(updated_at=datetime(2016, 8, 11, 20, 30, 38)).execute()
+		rv = self.app.get('/reviews/changes')
+		self.assertEqual(rv.status_code, 200)
+		data = json.loads(rv.data)['data']
+		self.assertEqual([(review['id'], review['touserid'], review['toplaceid']) for review in data], [(1, 2, None), (2, None, 1)])
+		rv = self.app.get('/reviews/changes?since=invalid')
+		self.assertEqual(rv.status_code, 400)
+
+	def test_delete_cascades(self):
+		''' Set base data, user 1 owns the place and both users review each other '''
+		rv = self.app.post('/users', data=good_user_1)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/users', data=good_user_2)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/users', data=dict(good_user_2, email='third@example.com'))
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/states', data=good_state_1)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/states/1/cities', data=good_city_1)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/places', data=good_place_1)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/places/1/reviews', data=dict(good_place_review_1, user_id=2))
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/users/1/reviews', data=dict(good_review_1, user_id=2))
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/users/3/reviews', data=dict(good_review_1, user_id=1))
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/users/3/reviews', data=dict(good_review_1, user_id=2, stars=1))
+		self.assertEqual(rv.status_code, 201)
+
+		''' Test that deleting user 1 removes its place and every review about or by it '''
+		past = datetime(2016, 8, 11, 20, 30, 38)
+		User.update(updated_at=past).execute()
+		rv = self.app.delete('/users/1')
+		self.assertEqual(rv.status_code, 200)
+		self.assertEqual(Place.select().count(), 0)
+		self.assertEqual([review.id for review in Review.select()], [4])
+		self.assertEqual(ReviewPlace.select().count(), 0)
+		self.assertEqual(ReviewUser.select().count(), 1)
+
+		''' Test that the aggregates of the user it reviewed are recounted '''
+		data = json.loads(self.app.get('/users/3').data)
+		self.assertEqual((data['review_count'], data['review_stars']), (1, 1))
+		self.assertGreater(User.get(User.id == 3).updated_at, past)
+
+		''' Test that deleting a city removes the reviews of its places '''
+		rv = self.app.post('/places', data=dict(good_place_1, owner_id=2))
+		self.assertEqual(rv.status_code, 201)
+		place_id = json.loads(rv.data)['id']
+		rv = self.app.post('/places/%d/reviews' % place_id, data=dict(good_place_review_1, user_id=3))
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.delete('/states/404/cities/1')
+		self.assertEqual(rv.status_code, 404)
+		self.assertEqual(Review.select().count(), 2)
+		rv = self.app.delete('/states/1/cities/1')
+		self.assertEqual(rv.status_code, 200)
+		self.assertEqual(Place.select().count(), 0)
+		self.assertEqual([review.id for review in Review.select()], [4])
+
+		''' Test that deleting a state removes the reviews of its places '''
+		rv = self.app.post('/states/1/cities', data=good_city_1)
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.post('/places', data=dict(good_place_1, owner_id=2, city_id=json.loads(rv.data)['id']))
+		self.assertEqual(rv.status_code, 201)
+		place_id = json.loads(rv.data)['id']
+		rv = self.app.post('/places/%d/reviews' % place_id, data=dict(good_place_review_1, user_id=3))
+		self.assertEqual(rv.status_code, 201)
+		rv = self.app.delete('/states/1')
+		self.assertEqual(rv.status_code, 200)
+		self.assertEqual(City.select().count(), 0)
+		self.assertEqual(Place.select().count(), 0)
+		self.assertEqual([review.id for review in Review.select()], [4])
+
 	def test_get_place_reviews(self):
 		''' Set base data '''
 		rv = self.app.post('/users', data=good_user_1)
@@ -260,6 +460,7 @@ class AppTestCase(unittest.TestCase):
 		rv = self.app.get('/places/1/reviews')
 		data = json.loads(rv.data)['data']
 		self.assertEqual(len(data), 1)
+		self.assertEqual((data[0]['touserid'], data[0]['toplaceid']), (None, 1))
 
 	def test_get_place_review(self):
 		''' Set base data '''
@@ -2,11 +2,20 @@
 from app import app
 from app.models.base import db
 from app.models.state import State
+from app.models.city import City
+from app.models.user import User
+from app.models.place import Place
+from app.models.review import Review
+from app.models.review_place import ReviewPlace
+from app.views.cache import cache
+from config import CHANGES
 
 ''' Import test data '''
 from state_data import *
+from city_data import good_city_1
 
 ''' Import packages '''
+from datetime import datetime, timedelta
 import unittest
 import json
 import logging
@@ -15,12 +24,12 @@ class AppTestCase(unittest.TestCase):
 
     def setUp(self):
         db.connect()
-        db.create_tables([State], safe=True)
+        db.create_tables([State, City, User, Place, Review, ReviewPlace], safe=True)
         logging.disable(logging.CRITICAL)
         self.app = app.test_client()
 
     def tearDown(self):
-        db.drop_tables([State])
+        db.drop_tables([State, City, User, Place, Review, ReviewPlace])
         db.close()
 
     def test_create(self):
@@ -67,6 +76,93 @@ class AppTestCase(unittest.TestCase):
         data = json.loads(rv.data)['data']
         self.assertEqual(len(data), 1)
 
+    def test_list_cursor(self):
+        ''' Set base data '''
+        rv = self.app.post('/states', data=good_state_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/states', data=good_state_2)
+        self.assertEqual(rv.status_code, 201)
+
+        ''' Test that the first page returns a next cursor '''
+        rv = self.app.get('/states?after=&number=1')
+        self.assertEqual(rv.status_code, 200)
+        data = json.loads(rv.data)
+        self.assertEqual(len(data['data']), 1)
+        self.assertEqual(data['data'][0]['id'], 1)
+        self.assertIsNotNone(data['paging']['next'])
+
+        ''' Test that the cursor seeks past the first page '''
+        rv = self.app.get(data['paging']['next'])
+        self.assertEqual(rv.status_code, 200)
+        data = json.loads(rv.data)
+        self.assertEqual(len(data['data']), 1)
+        self.assertEqual(data['data'][0]['id'], 2)
+        self.assertIsNone(data['paging']['next'])
+
+        ''' Test that a malformed cursor, page or number is a 400 '''
+        for url in ['/states?after=abc', '/states?after=!!!', '/states?page=zzz', '/states?number=0', '/users?after=!!!', '/places?after=zzz']:
+            rv = self.app.get(url)
+            self.assertEqual(rv.status_code, 400)
+            self.assertEqual(json.loads(rv.data)['code'], 400)
+
+    def test_changes(self):
+        ''' Set base data, two states updated in the same second '''
+        start = datetime.now()
+        rv = self.app.post('/states', data=good_state_1)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/states', data=good_state_2)
+        self.assertEqual(rv.status_code, 201)
+
+        ''' Test that each row gets its own creation time '''
+        self.assertGreaterEqual(State.get(State.id == 1).created_at, start)
+
+        ''' Test that rows are held back until they are older than the lag, for transactions still committing '''
+        rv = self.app.get('/states/changes')
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(len(json.loads(rv.data)['data']), 0)
+        State.update(updated_at=datetime.now() - timedelta(seconds=CHANGES['lag'] + 2)).where(State.id == 2).execute()
+        rv = self.app.get('/states/changes')
+        self.assertEqual([state['id'] for state in json.loads(rv.data)['data']], [2])
+
+        ''' Test that the feed pages through rows sharing a timestamp '''
+        past = datetime(2016, 8, 11, 20, 30, 38)
+        State.update(updated_at=past).execute()
+        rv = self.app.get('/states/changes?number=1')
+        self.assertEqual(rv.status_code, 200)
+        data = json.loads(rv.data)
+        self.assertEqual([state['id'] for state in data['data']], [1])
+        rv = self.app.get(data['paging']['next'])
+        data = json.loads(rv.data)
+        self.assertEqual([state['id'] for state in data['data']], [2])
+
+        ''' Test that a pull without changes keeps the cursor '''
+        since = data['paging']['next']
+        rv = self.app.get(since)
+        data = json.loads(rv.data)
+        self.assertEqual(len(data['data']), 0)
+        self.assertEqual(data['paging']['next'], since)
+
+        ''' Test that an update shows up after the cursor '''
+        State.update(updated_at=past + timedelta(seconds=1)).where(State.id == 1).execute()
+        rv = self.app.get(since)
+        data = json.loads(rv.data)
+        self.assertEqual([state['id'] for state in data['data']], [1])
+
+        ''' Test a date as the first cursor and an invalid cursor '''
+        rv = self.app.get('/states/changes?since=2016/08/11 20:30:39')
+        self.assertEqual([state['id'] for state in json.loads(rv.data)['data']], [1])
+        rv = self.app.get('/states/changes?since=invalid')
+        self.assertEqual(rv.status_code, 400)
+
+        ''' Test the feed of the cities of every state '''
+        rv = self.app.post('/states/1/cities', data=good_city_1)
+        self.assertEqual(rv.status_code, 201)
+        City.update(updated_at=past).execute()
+        rv = self.app.get('/cities/changes')
+        self.assertEqual(rv.status_code, 200)
+        data = json.loads(rv.data)['data']
+        self.assertEqual([(city['id'], city['state_id']) for city in data], [(1, 1)])
+
     def test_get(self):
         ''' Set base data '''
         rv = self.app.post('/states', data=good_state_1)
@@ -109,5 +205,45 @@ class AppTestCase(unittest.TestCase):
         data = json.loads(rv.data)['data']
         self.assertEqual(len(data), 0)
 
+    def test_cache(self):
+        ''' Enable the response cache for this test '''
+        cache.clear()
+        cache.ttl = 60
+        try:
+            rv = self.app.post('/states', data=good_state_1)
+            self.assertEqual(rv.status_code, 201)
+
+            ''' Test that the second list is served from the cache '''
+            rv = self.app.get('/states')
+            self.assertEqual(len(json.loads(rv.data)['data']), 1)
+            rv = self.app.get('/states')
+            self.assertEqual(len(json.loads(rv.data)['data']), 1)
+            rv = self.app.get('/cache/stats')
+            data = json.loads(rv.data)
+            self.assertEqual(data['hits'], 1)
+            self.assertEqual(data['misses'], 1)
+
+            ''' Test that a query string is cached separately '''
+            rv = self.app.get('/states?number=1')
+            self.assertEqual(json.loads(self.app.get('/cache/stats').data)['misses'], 2)
+
+            ''' Test that another host gets its own paging urls '''
+            rv = self.app.get('/states?number=1', base_url='http://api.example.com')
+            self.assertEqual(json.loads(self.app.get('/cache/stats').data)['misses'], 3)
+            self.assertTrue(json.loads(rv.data)['paging']['next'].startswith('http://api.example.com/states'))
+
+            ''' Test that creating and deleting a state invalidates the list '''
+            rv = self.app.post('/states', data=good_state_2)
+            self.assertEqual(rv.status_code, 201)
+            rv = self.app.get('/states')
+            self.assertEqual(len(json.loads(rv.data)['data']), 2)
+            rv = self.app.delete('/states/1')
+            self.assertEqual(rv.status_code, 200)
+            rv = self.app.get('/states')
+            self.assertEqual(len(json.loads(rv.data)['data']), 1)
+        finally:
+            cache.clear()
+            cache.ttl = 0
+
 if __name__ == '__main__':
     unittest.main()
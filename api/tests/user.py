@@ -2,12 +2,22 @@
 from app import app
 from app.models.base import db
 from app.models.user import User
+from app.models.state import State
+from app.models.city import City
+from app.models.place import Place
+from app.models.review import Review
+from app.models.review_place import ReviewPlace
+from app.models.review_user import ReviewUser
+from app.views.auth import verified
+from config import AUTH
 
 ''' Import test data '''
 from user_data import *
 
 ''' Import packages '''
 from datetime import datetime, timedelta
+from base64 import b64encode
+from hashlib import md5
 import unittest
 import json
 import logging
@@ -16,12 +26,12 @@ class AppTestCase(unittest.TestCase):
 
     def setUp(self):
         db.connect()
-        db.create_tables([User], safe=True)
+        db.create_tables([User, State, City, Place, Review, ReviewPlace, ReviewUser], safe=True)
         logging.disable(logging.CRITICAL)
         self.app = app.test_client()
 
     def tearDown(self):
-        db.drop_tables([User])
+        db.drop_tables([User, State, City, Place, Review, ReviewPlace, ReviewUser])
         db.close()
 
     def test_create(self):
@@ -130,6 +140,180 @@ class AppTestCase(unittest.TestCase):
         rv = self.app.delete('/users/404')
         self.assertEqual(rv.status_code, 404)
 
+    def test_update_unchanged(self):
+        ''' Set base data with an old update time '''
+        rv = self.app.post('/users', data=good_user_1)
+        self.assertEqual(rv.status_code, 201)
+        past = datetime(2016, 8, 11, 20, 30, 38)
+        User.update(updated_at=past).where(User.id == 1).execute()
+
+        ''' Test that an update without changes does not write the row '''
+        rv = self.app.put('/users/1', data={'first_name': good_user_1['first_name']})
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(User.get(User.id == 1).updated_at, past)
+
+        ''' Test that an update only writes the changed columns '''
+        user = User.get(User.id == 1)
+        user.first_name = 'Change'
+        user.last_name = good_user_1['last_name']
+        self.assertEqual([field.name for field in user.changed_fields], ['first_name'])
+        user.save()
+        user = User.get(User.id == 1)
+        self.assertEqual(user.first_name, 'Change')
+        self.assertNotEqual(user.updated_at, past)
+
+    def test_conditional_get(self):
+        ''' Set base data '''
+        rv = self.app.post('/users', data=good_user_1)
+        self.assertEqual(rv.status_code, 201)
+
+        ''' Test that a matching ETag returns 304 without a body '''
+        rv = self.app.get('/users/1')
+        self.assertEqual(rv.status_code, 200)
+        etag = rv.headers['ETag']
+        self.assertIn('Last-Modified', rv.headers)
+        rv = self.app.get('/users/1', headers={'If-None-Match': etag})
+        self.assertEqual(rv.status_code, 304)
+        self.assertEqual(rv.data, '')
+
+        ''' Test that the list page has its own validators '''
+        rv = self.app.get('/users')
+        self.assertEqual(rv.status_code, 200)
+        list_etag = rv.headers['ETag']
+        rv = self.app.get('/users', headers={'If-None-Match': list_etag})
+        self.assertEqual(rv.status_code, 304)
+
+        ''' Test that an update changes the ETag of the user and of the list '''
+        rv = self.app.put('/users/1', data={'first_name': 'Change'})
+        self.assertEqual(rv.status_code, 200)
+        rv = self.app.get('/users/1', headers={'If-None-Match': etag})
+        self.assertEqual(rv.status_code, 200)
+        self.assertNotEqual(rv.headers['ETag'], etag)
+        rv = self.app.get('/users', headers={'If-None-Match': list_etag})
+        self.assertEqual(rv.status_code, 200)
+
+    def test_login(self):
+        ''' Set base data '''
+        rv = self.app.post('/users', data=good_user_1)
+        self.assertEqual(rv.status_code, 201)
+        self.assertTrue(User.get(User.id == 1).password.startswith('pbkdf2_sha256$'))
+        credentials = {'email': good_user_1['email'], 'password': good_user_1['password']}
+
+        ''' Test valid, wrong and missing credentials '''
+        rv = self.app.post('/login', data=credentials)
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(json.loads(rv.data)['email'], good_user_1['email'])
+        rv = self.app.post('/login', data=dict(credentials, password='wrong'))
+        self.assertEqual(rv.status_code, 401)
+        rv = self.app.post('/login', data={'email': good_user_1['email']})
+        self.assertEqual(rv.status_code, 400)
+
+        ''' Test that repeat logins are answered from the verified credentials '''
+        hits = verified.hits
+        rv = self.app.post('/login', data=credentials)
+        self.assertEqual(rv.status_code, 200)
+        self.assertEqual(verified.hits, hits + 1)
+
+        ''' Test Basic authorization '''
+        header = 'Basic ' + b64encode('%s:%s' % (credentials['email'], credentials['password']))
+        rv = self.app.post('/login', headers={'Authorization': header})
+        self.assertEqual(rv.status_code, 200)
+
+        ''' Test that a new password revokes the verified credentials '''
+        rv = self.app.put('/users/1', data={'password': 'notthesame'})
+        self.assertEqual(rv.status_code, 200)
+        rv = self.app.post('/login', data=credentials)
+        self.assertEqual(rv.status_code, 401)
+
+        ''' Test that a legacy md5 password is rehashed on login '''
+        User.update(password=md5('test1234').hexdigest()).where(User.id == 1).execute()
+        rv = self.app.post('/login', data=credentials)
+        self.assertEqual(rv.status_code, 200)
+        self.assertTrue(User.get(User.id == 1).password.startswith('pbkdf2_sha256$'))
+        rv = self.app.post('/login', data=credentials)
+        self.assertEqual(rv.status_code, 200)
+
+    def test_tokens(self):
+        ''' Set base data, an admin and a regular user '''
+        rv = self.app.post('/users', data=dict(good_user_1, is_admin=False))
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/users', data=good_user_2)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/login', data={'email': good_user_2['email'], 'password': good_user_2['password']})
+        self.assertEqual(rv.status_code, 200)
+        admin = {'Authorization': 'Bearer ' + json.loads(rv.data)['token']}
+        rv = self.app.post('/login', data={'email': good_user_1['email'], 'password': good_user_1['password']})
+        self.assertEqual(rv.status_code, 200)
+        user = {'Authorization': 'Bearer ' + json.loads(rv.data)['token']}
+
+        ''' Test that valid tokens pass and forged ones are refused '''
+        rv = self.app.get('/users/1', headers=admin)
+        self.assertEqual(rv.status_code, 200)
+        rv = self.app.get('/users/1', headers={'Authorization': admin['Authorization'] + 'x'})
+        self.assertEqual(rv.status_code, 401)
+
+        ''' Test that admin endpoints check the token when authentication is enforced '''
+        AUTH['required'] = True
+        try:
+            rv = self.app.post('/states', data={'name': 'California'})
+            self.assertEqual(rv.status_code, 401)
+            rv = self.app.post('/states', data={'name': 'California'}, headers=user)
+            self.assertEqual(rv.status_code, 403)
+            rv = self.app.post('/states', data={'name': 'California'}, headers=admin)
+            self.assertEqual(rv.status_code, 201)
+        finally:
+            AUTH['required'] = False
+
+        ''' Test that a revoked token is refused '''
+        rv = self.app.post('/logout', headers=user)
+        self.assertEqual(rv.status_code, 200)
+        rv = self.app.get('/users/1', headers=user)
+        self.assertEqual(rv.status_code, 401)
+        rv = self.app.get('/users/1', headers=admin)
+        self.assertEqual(rv.status_code, 200)
+
+    def test_admin_escalation(self):
+        ''' Set base data, an admin created before authentication is enforced '''
+        rv = self.app.post('/users', data=good_user_2)
+        self.assertEqual(rv.status_code, 201)
+        rv = self.app.post('/login', data={'email': good_user_2['email'], 'password': good_user_2['password']})
+        admin = {'Authorization': 'Bearer ' + json.loads(rv.data)['token']}
+        AUTH['required'] = True
+        try:
+            ''' Test that only an admin can create an admin '''
+            regular = dict((key, value) for key, value in good_user_1.items() if key != 'is_admin')
+            rv = self.app.post('/users', data=good_user_1)
+            self.assertEqual(rv.status_code, 401)
+            rv = self.app.post('/users', data=regular)
+            self.assertEqual(rv.status_code, 201)
+            rv = self.app.post('/login', data={'email': good_user_1['email'], 'password': good_user_1['password']})
+            user = {'Authorization': 'Bearer ' + json.loads(rv.data)['token']}
+            rv = self.app.post('/users', data=dict(good_user_1, email='third@example.com'), headers=user)
+            self.assertEqual(rv.status_code, 403)
+
+            ''' Test that a user only updates itself and cannot grant itself admin rights '''
+            rv = self.app.put('/users/2', data={'first_name': 'Change'})
+            self.assertEqual(rv.status_code, 401)
+            rv = self.app.put('/users/2', data={'first_name': 'Change'}, headers=user)
+            self.assertEqual(rv.status_code, 200)
+            rv = self.app.put('/users/2', data={'is_admin': True}, headers=user)
+            self.assertEqual(rv.status_code, 403)
+            rv = self.app.put('/users/1', data={'first_name': 'Change'}, headers=user)
+            self.assertEqual(rv.status_code, 403)
+            self.assertFalse(User.get(User.id == 2).is_admin)
+            rv = self.app.post('/states', data={'name': 'California'}, headers=user)
+            self.assertEqual(rv.status_code, 403)
+
+            ''' Test that an admin grants rights and that a demoted admin loses them before its token expires '''
+            rv = self.app.put('/users/2', data={'is_admin': True}, headers=admin)
+            self.assertEqual(rv.status_code, 200)
+            self.assertTrue(User.get(User.id == 2).is_admin)
+            User.update(is_admin=False).where(User.id == 1).execute()
+            rv = self.app.post('/states', data={'name': 'California'}, headers=admin)
+            self.assertEqual(rv.status_code, 403)
+        finally:
+            AUTH['required'] = False
+
     def test_update(self):
         ''' Set base data '''
         rv = self.app.post('/users', data=good_user_1)